@@ -0,0 +1 @@
+""" Benchmarks that run offline against local servers or generated data. """
@@ -0,0 +1,108 @@
+"""
+Measure merging several large result files (4 files with 250k rows each by default, overlapping queries and URLs):
+loading all search results into a SearchResultList, sorting, and deduplicating them in memory (as before the combine
+command) vs. the external merge sort of ddg.external_sort. Each approach runs in a separate process to report its
+peak RSS.
+"""
+
+import argparse
+import csv
+import filecmp
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from ddg.external_sort import combine_result_files
+from ddg.search_result import SearchResult
+from ddg.search_result_list import SearchResultList
+
+
+def write_result_files(directory, file_count, rows_per_file, seed=0):
+    generator = random.Random(seed)
+    query_count = rows_per_file // 25
+    file_paths = list()
+    for i in range(file_count):
+        file_path = os.path.join(directory, 'results-' + str(i) + '.csv')
+        with open(file_path, 'w', encoding='utf8', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(SearchResult.get_column_names(True))
+            # runs overlap in half of their queries
+            for query in generator.sample(range(query_count * 2), query_count):
+                for rank, url in enumerate(generator.sample(range(50), 25), 1):
+                    writer.writerow(['"Benchmark query ' + str(query) + '"', rank, 'en',
+                                     'https://example.org/' + str(query) + '/' + str(url),
+                                     'Title ' + str(url), 'Snippet of search result ' + str(url) + ' ' * 100])
+        file_paths.append(file_path)
+    return file_paths
+
+
+def combine_in_memory(file_paths, output_dir):
+    """ Merging as done before ddg.external_sort (all search results are loaded into memory). """
+    search_result_list = SearchResultList()
+    for file_path in file_paths:
+        search_result_list.values.extend(SearchResultList.iter_from_file(file_path, ','))
+    search_result_list.values.sort(key=lambda search_result: (search_result.query, search_result.rank))
+    seen = set()
+    deduplicated = list()
+    for search_result in search_result_list.values:
+        if (search_result.query, search_result.url) not in seen:
+            seen.add((search_result.query, search_result.url))
+            deduplicated.append(search_result)
+    search_result_list.values = deduplicated
+    search_result_list.write(output_dir, ',', True, 'combined.csv')
+
+
+def run(approach, file_paths, output_dir):
+    """ :return: Tuple (wall time in seconds, peak RSS in MiB) of a process executing the approach. """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'benchmark.combine_benchmark', '--run', approach,
+                                '--output-dir', output_dir] + file_paths)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError(approach + ' terminated with wait status ' + str(status))
+    peak_rss = rusage.ru_maxrss / 1024 if sys.platform != 'darwin' else rusage.ru_maxrss / 2 ** 20
+    return elapsed, peak_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-f', '--files', type=int, default=4)
+    parser.add_argument('-n', '--rows', type=int, default=250000, help='Number of rows per file')
+    parser.add_argument('--chunk-size', type=int, default=100000, dest='chunk_size')
+    # internal: execute one approach
+    parser.add_argument('--run', choices=['in-memory', 'external'])
+    parser.add_argument('--output-dir', dest='output_dir')
+    parser.add_argument('file_paths', nargs='*')
+    args = parser.parse_args()
+
+    logging.getLogger("ddg-retriever_logger").disabled = True
+    if args.run == 'in-memory':
+        combine_in_memory(args.file_paths, args.output_dir)
+        return
+    if args.run == 'external':
+        combine_result_files(args.file_paths, args.output_dir, 'combined.csv', ',', chunk_size=args.chunk_size)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = write_result_files(directory, args.files, args.rows)
+        output_files = dict()
+        for approach in ['in-memory', 'external']:
+            output_dir = os.path.join(directory, approach)
+            elapsed, peak_rss = run(approach, file_paths, output_dir)
+            output_files[approach] = os.path.join(output_dir, 'combined.csv')
+            with open(output_files[approach], encoding='utf8', newline='') as fp:
+                row_count = sum(1 for _ in csv.reader(fp)) - 1
+            print('{0:<10} {1:>8.2f} s {2:>8.0f} MiB peak RSS {3:>10} rows written'.format(
+                approach, elapsed, peak_rss, row_count))
+        # both approaches must write the same file (compared without loading it, which would inflate the peak RSS
+        # reported for the next process)
+        assert filecmp.cmp(output_files['in-memory'], output_files['external'], shallow=False)
+
+
+if __name__ == '__main__':
+    main()
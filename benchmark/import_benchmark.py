@@ -0,0 +1,143 @@
+"""
+Measure startup costs: wall time of importing the ddg modules in a fresh interpreter, wall time and import time
+(python -X importtime) of running ddg-retriever.py --help, which heavy dependencies are loaded by each import,
+and the startup time of a language detection pool (profiles loaded once and shared with forked workers vs.
+loaded by each worker).
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the ddg package is also found when running this file as a script (python3 benchmark/import_benchmark.py)
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+MODULES = ['ddg', 'ddg.query', 'ddg.query_list', 'ddg.search_result_list', 'ddg.async_retriever',
+           'ddg.response_archive', 'ddg.request_profile']
+
+# dependencies that should only be loaded when they are used
+HEAVY_DEPENDENCIES = ['requests', 'lxml', 'langdetect', 'httpx', 'http.server', 'multiprocessing']
+
+
+def time_command(command, runs):
+    """ :return: Median wall time of the command in seconds. """
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def get_import_times(command):
+    """
+    Run the command with -X importtime in a fresh interpreter.
+    :return: Dictionary mapping the modules imported at top level (not by another module) to their cumulative
+        import time in microseconds.
+    """
+    output = subprocess.run([command[0], '-X', 'importtime'] + command[1:], cwd=ROOT_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    import_times = dict()
+    for line in output.stderr.decode('utf8').splitlines():
+        columns = line.split('|')
+        # nested imports are indented, the header has no numeric columns
+        if not line.startswith('import time:') or len(columns) != 3 or columns[2].startswith('  '):
+            continue
+        try:
+            import_times[columns[2].strip()] = int(columns[1])
+        except ValueError:
+            continue
+    return import_times
+
+
+def time_command_imports(command, runs):
+    """
+    :return: Median import time of the command in seconds (sum of the cumulative import times of the modules
+        imported at top level), excluding the modules imported by the interpreter startup.
+    """
+    startup_modules = set(get_import_times([sys.executable, '-c', 'pass']))
+    durations = []
+    for _ in range(runs):
+        import_times = get_import_times(command)
+        durations.append(sum(microseconds for module, microseconds in import_times.items()
+                             if module not in startup_modules) / 10 ** 6)
+    return statistics.median(durations)
+
+
+def time_import(module, runs):
+    """
+    Import the module in fresh interpreters (excluding interpreter startup).
+    :return: Tuple (median import time in seconds, heavy dependencies loaded by the import).
+    """
+    code = ('import sys, time; start = time.perf_counter(); import ' + module
+            + '; print(time.perf_counter() - start, '
+            + '*(d for d in ' + repr(HEAVY_DEPENDENCIES) + ' if d in sys.modules))')
+    durations = []
+    loaded = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, stdout=subprocess.PIPE, check=True)
+        values = output.stdout.decode('utf8').split()
+        durations.append(float(values[0]))
+        loaded = values[1:]
+    return statistics.median(durations), loaded
+
+
+def time_language_detection_pool(processes, start_method):
+    """ :return: Seconds until every worker of a language detection pool has detected a language. """
+    import multiprocessing
+
+    from ddg import language_detection
+
+    start = time.perf_counter()
+    if start_method == 'fork':
+        # profiles are loaded once and shared with the forked workers (see LanguageDetector)
+        language_detection.initialize()
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(start_method),
+                                   initializer=language_detection.initialize)
+    futures = [executor.submit(language_detection.detect_language, 'This is an English snippet.')
+               for _ in range(processes)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--runs', type=int, default=10, help='Number of runs per measurement (median)')
+    parser.add_argument('-p', '--processes', type=int, default=4, help='Number of language detection workers')
+    args = parser.parse_args()
+
+    baseline = time_command([sys.executable, '-c', 'pass'], args.runs)
+    print('{0:<32} {1:>8.1f} ms'.format('interpreter startup', baseline * 1000))
+    for module in MODULES:
+        duration, loaded = time_import(module, args.runs)
+        print('{0:<32} {1:>8.1f} ms   loaded: {2}'.format('import ' + module, duration * 1000,
+                                                         ', '.join(loaded) or '-'))
+    command = [sys.executable, 'ddg-retriever.py', '--help']
+    duration = time_command(command, args.runs)
+    print('{0:<32} {1:>8.1f} ms   (including interpreter startup)'.format('ddg-retriever.py --help',
+                                                                         duration * 1000))
+    duration = time_command_imports(command, args.runs)
+    print('{0:<32} {1:>8.1f} ms   (-X importtime, cumulative)'.format('ddg-retriever.py --help imports',
+                                                                      duration * 1000))
+
+    import multiprocessing
+    for start_method in ['fork', 'spawn']:
+        if start_method not in multiprocessing.get_all_start_methods():
+            continue
+        durations = [time_language_detection_pool(args.processes, start_method) for _ in range(3)]
+        print('{0:<32} {1:>8.1f} ms   ({2} workers)'.format('language detection (' + start_method + ')',
+                                                          statistics.median(durations) * 1000, args.processes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+""" Measure memory used per search result when loading a large synthetic results CSV file. """
+
+import argparse
+import csv
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from ddg.search_result import SearchResult
+from ddg.search_result_list import SearchResultList
+
+
+class PlainSearchResult(object):
+    """ Search result with per-instance __dict__ and string ranks (representation used before __slots__). """
+
+    def __init__(self, query, rank, url, title, snippet):
+        self.query = query
+        self.rank = rank
+        self.url = url
+        self.title = title
+        self.snippet = snippet
+        self.language = None
+
+
+def write_results(file_path, count, results_per_query):
+    with open(file_path, 'w', encoding='utf8', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(SearchResult.get_column_names())
+        for i in range(count):
+            query_number, rank = divmod(i, results_per_query)
+            writer.writerow(['"Query number ' + str(query_number) + '"', rank + 1,
+                             'https://example.org/' + str(query_number) + '/' + str(rank),
+                             'Title of result ' + str(i),
+                             'Snippet of search result ' + str(i) + ' with some more words in it.'])
+
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    values = load()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(values)
+
+
+def load_plain(file_path):
+    with open(file_path, encoding='utf8', newline='') as fp:
+        reader = csv.reader(fp)
+        next(reader)
+        return [PlainSearchResult(*row) for row in reader]
+
+
+def load_search_result_list(file_path):
+    search_result_list = SearchResultList()
+    search_result_list.read_from_csv(file_path, ',')
+    return search_result_list.values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--results', type=int, default=500000)
+    parser.add_argument('-r', '--results-per-query', type=int, default=25, dest='results_per_query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'results.csv')
+        write_results(file_path, args.results, args.results_per_query)
+        print('{0} search results ({1:.1f} MB CSV file)'.format(args.results, os.path.getsize(file_path) / 2 ** 20))
+        for name, load in [('plain objects', load_plain), ('SearchResultList', load_search_result_list)]:
+            print('{0:<20} {1:>8.1f} bytes per result'.format(name, measure(lambda: load(file_path))))
+
+
+if __name__ == '__main__':
+    main()
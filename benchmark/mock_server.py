@@ -0,0 +1,208 @@
+"""
+Local stand-in for Duck Duck Go's HTML search serving the recorded result pages in benchmark/fixtures.
+Latency, server errors, throttling (429 at random or above a sustainable rate), and empty snippets can be injected
+to reproduce production conditions.
+Point ddg-retriever at the server by setting SearchUri = http://127.0.0.1:<PORT>/html/ in the configuration file.
+"""
+
+import argparse
+import html
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark.parser_benchmark import load_fixtures
+
+RESULTS_PER_PAGE = 30  # offset s of the next page as sent by Duck Duck Go
+
+next_page_query_regex = re.compile(b'(<input type="hidden" name="q" value=")[^"]*(")')
+next_page_offset_regex = re.compile(b'(<input type="hidden" name="s" value=")[0-9]*(")')
+snippet_regex = re.compile(b'(<a class="result__snippet"[^>]*>).*?(</a>)', re.DOTALL)
+
+
+class MockServer(ThreadingHTTPServer):
+    """ HTTP server answering search requests with recorded result pages. """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0, latency_jitter=0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, empty_snippet_rate=0.0, seed=0, max_requests_per_minute=0):
+        """
+        :param latency: Mean delay of each response in milliseconds.
+        :param latency_jitter: Maximum deviation from the mean delay in milliseconds.
+        :param error_rate: Fraction of requests answered with status code 500.
+        :param throttle_rate: Fraction of requests answered with status code 429.
+        :param retry_after: Value of the Retry-After header of 429 responses in seconds.
+        :param empty_snippet_rate: Fraction of result pages whose snippets are removed.
+        :param seed: Seed for the injected faults (requests are answered in arrival order, which depends on timing).
+        :param max_requests_per_minute: Sustainable request rate; requests exceeding it (allowing bursts of
+            a few requests) are answered with status code 429 (0 = no limit).
+        """
+        super().__init__(address, SearchRequestHandler)
+        self.pages = load_fixtures()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.empty_snippet_rate = empty_snippet_rate
+        self.random = random.Random(seed)
+        self.max_requests_per_minute = max_requests_per_minute
+        self.burst = 3
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.throttle_count = 0
+        self.empty_snippet_count = 0
+        self.first_request_times = dict()  # query -> time of first request
+        self.page_shift = 0  # changing the shift changes the result pages served for each query
+
+    @property
+    def search_uri(self):
+        return 'http://' + self.server_address[0] + ':' + str(self.server_port) + '/html/'
+
+    def get_page(self, query, offset):
+        """ Recorded result page for the passed query and offset (the next page form refers to the query). """
+        page = self.pages[(zlib.crc32(query.encode('utf8')) + offset // RESULTS_PER_PAGE + self.page_shift)
+                          % len(self.pages)]
+        page = next_page_query_regex.sub(lambda m: m.group(1) + html.escape(query).encode('utf8') + m.group(2),
+                                         page)
+        return next_page_offset_regex.sub(lambda m: m.group(1) + str(offset + RESULTS_PER_PAGE).encode('utf8')
+                                          + m.group(2), page)
+
+    def draw_fault(self):
+        """ :return: Tuple (delay in seconds, status code, remove snippets). """
+        with self.lock:
+            self.request_count += 1
+            delay = max(0, self.latency + self.random.uniform(-self.latency_jitter, self.latency_jitter)) / 1000
+            if self.is_over_limit():
+                self.throttle_count += 1
+                return delay, 429, False
+            value = self.random.random()
+            if value < self.error_rate:
+                self.error_count += 1
+                return delay, 500, False
+            if value < self.error_rate + self.throttle_rate:
+                self.throttle_count += 1
+                return delay, 429, False
+            if self.random.random() < self.empty_snippet_rate:
+                self.empty_snippet_count += 1
+                return delay, 200, True
+            return delay, 200, False
+
+    def is_over_limit(self):
+        """ Consume a token of the sustainable request rate (lock must be held). :return: True if none is left. """
+        if self.max_requests_per_minute <= 0:
+            return False
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.max_requests_per_minute / 60)
+        self.last_refill = now
+        if self.tokens < 1:
+            return True
+        self.tokens -= 1
+        return False
+
+    def record_request(self, query):
+        with self.lock:
+            self.first_request_times.setdefault(query, time.time())
+
+    def reset(self):
+        with self.lock:
+            self.request_count = 0
+            self.error_count = 0
+            self.throttle_count = 0
+            self.empty_snippet_count = 0
+            self.first_request_times = dict()
+            self.tokens = self.burst
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.answer(urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.answer(urllib.parse.parse_qs(self.rfile.read(length).decode('utf8')))
+
+    def answer(self, parameters):
+        query = parameters.get('q', [''])[0]
+        offset = int(parameters.get('s', ['0'])[0] or 0)
+        if offset == 0:
+            self.server.record_request(query)
+
+        delay, status_code, remove_snippets = self.server.draw_fault()
+        time.sleep(delay)
+
+        if status_code == 200:
+            content = self.server.get_page(query, offset)
+            if remove_snippets:
+                content = snippet_regex.sub(b'\\1\\2', content)
+        else:
+            content = b'<html><body>Error</body></html>'
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        if status_code == 429:
+            self.send_header('Retry-After', str(self.server.retry_after))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_fault_arguments(parser):
+    parser.add_argument('--latency', type=int, default=0, help='Mean response delay in milliseconds')
+    parser.add_argument('--latency-jitter', type=int, default=0, dest='latency_jitter',
+                        help='Maximum deviation from the mean response delay in milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, dest='error_rate',
+                        help='Fraction of requests answered with status code 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, dest='throttle_rate',
+                        help='Fraction of requests answered with status code 429')
+    parser.add_argument('--retry-after', type=int, default=1, dest='retry_after',
+                        help='Retry-After header of 429 responses in seconds')
+    parser.add_argument('--empty-snippet-rate', type=float, default=0.0, dest='empty_snippet_rate',
+                        help='Fraction of result pages without snippets')
+    parser.add_argument('--max-requests-per-minute', type=float, default=0, dest='max_requests_per_minute',
+                        help='Sustainable request rate; faster requests are answered with status code 429')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def create_server(args, address=('127.0.0.1', 0)):
+    return MockServer(address, args.latency, args.latency_jitter, args.error_rate, args.throttle_rate,
+                      args.retry_after, args.empty_snippet_rate, args.seed, args.max_requests_per_minute)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-p', '--port', type=int, default=8080)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args, ('127.0.0.1', args.port))
+    print('Serving ' + str(len(server.pages)) + ' recorded result pages at ' + server.search_uri)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Measure reading and deduplicating a large synthetic query column (1M rows by default):
+one Query object per row (as before QueryNormalizer) vs. batch normalization with deduplication before Query creation.
+"""
+
+import argparse
+import logging
+import random
+import re
+import time
+import urllib.parse
+
+import unidecode
+
+from ddg.query import Query
+from ddg.query_list import QueryList
+from ddg.search_result_list import SearchResultList
+
+WORDS = ['interrupt', 'handler', 'SQL', 'injection', 'plug-in', 'computing', 'rule', 'of', 'three', 'C++',
+         'programming', 'compilers', 'principles', 'Java', 'platform', 'write', 'once', 'Gödel', 'L\'Hôpital\'s',
+         'Zürich', 'Škoda', 'naïve', 'Bayes', 'Fourier', 'transform', 'Dijkstra', 'Erdős', 'Poincaré', 'São Paulo']
+SEPARATORS = [' ', ' ', ' ', ' (', ') ', ', ', ': ', '/']
+
+special_character_regex = re.compile("\\s*[()/\\\\?;:,]+\\s*")
+
+
+class PerRowQuery(object):
+    """ Query construction as done before QueryNormalizer (transliteration, headers, etc. for every row). """
+
+    def __init__(self, query_string, exact_matches, remove_special_characters):
+        self.query_string = unidecode.unidecode(query_string)
+        self.is_empty = False
+        if remove_special_characters:
+            sub_queries = list(filter(lambda q: len(q) > 0, special_character_regex.split(self.query_string)))
+            if len(sub_queries) == 0:
+                self.is_empty = True
+            elif exact_matches:
+                self.query_string = '"' + '" "'.join(sub_queries) + '"'
+            else:
+                self.query_string = ' '.join(sub_queries)
+        else:
+            self.query_string = str(self.query_string).strip()
+            if len(self.query_string) == 0:
+                self.is_empty = True
+            elif exact_matches:
+                self.query_string = '"' + self.query_string + '"'
+        self.uri = 'https://duckduckgo.com/html/?q=' + urllib.parse.quote(self.query_string)
+        self.headers = {
+            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.14; rv:68.0) Gecko/20100101 Firefox/68.0",
+            "Accept": "text/html, application/xhtml+xml, application/xml;q=0.9, */*;q=0.8",
+            "Accept-Charset": "utf-8",
+            "Accept-Language": "en"
+        }
+        self.search_results = SearchResultList()
+
+
+def generate_rows(count, unique_count, seed=0):
+    generator = random.Random(seed)
+    unique = []
+    for _ in range(unique_count):
+        words = generator.sample(WORDS, generator.randint(1, 4))
+        query = words[0]
+        for word in words[1:]:
+            query += generator.choice(SEPARATORS) + word
+        unique.append(query)
+    return [[generator.choice(unique)] for _ in range(count)]
+
+
+def read_per_row(rows, exact_matches, remove_special_characters):
+    unique_query_strings = set()
+    queries = []
+    for row in rows:
+        query = PerRowQuery(row[0], exact_matches, remove_special_characters)
+        if query.is_empty or query.query_string in unique_query_strings:
+            continue
+        unique_query_strings.add(query.query_string)
+        queries.append(query)
+    return queries
+
+
+def read_batch(rows, exact_matches, remove_special_characters):
+    return list(QueryList().iter_from_reader(iter(rows), ['query'], exact_matches, remove_special_characters))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--rows', type=int, default=1000000)
+    parser.add_argument('-u', '--unique', type=int, default=200000, help='Number of distinct raw query strings')
+    args = parser.parse_args()
+
+    # skipped duplicates are logged at INFO level, which would dominate the measurement
+    logging.getLogger("ddg-retriever_logger").disabled = True
+
+    rows = generate_rows(args.rows, args.unique)
+    print('{0} rows, {1} distinct raw query strings'.format(len(rows), args.unique))
+    results = dict()
+    for name, read in [('Query per row', read_per_row), ('QueryNormalizer', read_batch)]:
+        start = time.perf_counter()
+        queries = read(rows, True, True)
+        elapsed = time.perf_counter() - start
+        results[name] = [query.query_string for query in queries]
+        print('{0:<16} {1:>10.0f} rows/s {2:>8} unique queries'.format(name, len(rows) / elapsed, len(queries)))
+
+    # both approaches must yield the same queries in the same order
+    assert results['Query per row'] == results['QueryNormalizer']
+    assert isinstance(read_batch(rows[:1], True, True)[0], Query)
+
+
+if __name__ == '__main__':
+    main()
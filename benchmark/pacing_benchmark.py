@@ -0,0 +1,121 @@
+"""
+Fixed request rates vs. adaptive pacing (see AdaptivePacer) against the local mock server throttling requests above a
+sustainable rate (429 with Retry-After). For each strategy, ddg-retriever.py is run in a fresh directory and the
+following values are reported: queries per second, throttled requests, scheduled retries, failed queries,
+and the final and peak rate of the adaptive pacing (taken from its log messages).
+"""
+
+import argparse
+import configparser
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark.mock_server import MockServer
+from benchmark.throughput_benchmark import SCRIPT, count_rows, parse_log, write_input
+
+statistics_regex = re.compile(r'Adaptive pacing: final rate ([0-9.]+) requests per minute \(peak ([0-9.]+)')
+decision_regex = re.compile(r'Adaptive pacing: .*(increasing|decreasing) rate')
+
+
+def write_config(file_path, directory, search_uri, args, requests_per_minute, adaptive_pacing):
+    config = configparser.ConfigParser()
+    config.optionxform = str  # keep case of keys
+    config['DEFAULT'] = {
+        'InputFile': os.path.join(directory, 'queries.csv'),
+        'OutputDirectory': os.path.join(directory, 'output'),
+        'Delimiter': ',',
+        'SearchUri': search_uri,
+        'MaxResults': str(args.max_results),
+        'WaitOnError': '1000',
+        'MaxWaitOnError': '8000',
+        'MaxRetries': '3',
+        'DetectLanguages': 'False',
+        # some recorded result pages contain empty snippets, which would be retried regardless of the pacing
+        'CheckForEmptySnippets': 'False',
+        'Concurrency': str(args.concurrency),
+        'RequestsPerMinute': str(requests_per_minute),
+        'AdaptivePacing': str(adaptive_pacing),
+        'MinRequestsPerMinute': '6',
+        'MaxRequestsPerMinute': str(args.max_requests_per_minute * 10),
+    }
+    with open(file_path, 'w') as fp:
+        config.write(fp)
+
+
+def read_pacing(file_path):
+    """ :return: Tuple (final rate, peak rate, number of rate changes) logged by the adaptive pacing. """
+    final_rate = peak_rate = float('nan')
+    changes = 0
+    with open(file_path, encoding='utf8') as fp:
+        for line in fp:
+            if decision_regex.search(line):
+                changes += 1
+            match = statistics_regex.search(line)
+            if match is not None:
+                final_rate, peak_rate = float(match.group(1)), float(match.group(2))
+    return final_rate, peak_rate, changes
+
+
+def run(server, args, name, requests_per_minute, adaptive_pacing):
+    server.reset()
+    with tempfile.TemporaryDirectory() as directory:
+        write_input(os.path.join(directory, 'queries.csv'), args.queries)
+        config_file = os.path.join(directory, 'config.ini')
+        write_config(config_file, directory, server.search_uri, args, requests_per_minute, adaptive_pacing)
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT, '-c', config_file], cwd=directory, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+
+        log_file = os.path.join(directory, 'ddg-retriever.log')
+        _, retries = parse_log(log_file)
+        final_rate, peak_rate, changes = read_pacing(log_file)
+        failed = count_rows(os.path.join(directory, 'output', 'failed_queries.csv'))
+
+    return {
+        'name': name,
+        'qps': args.queries / elapsed,
+        'requests': server.request_count,
+        'throttled': server.throttle_count,
+        'retries': retries,
+        'failed': failed,
+        'final': final_rate,
+        'peak': peak_rate,
+        'changes': changes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--queries', type=int, default=200)
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    parser.add_argument('-m', '--max-results', type=int, default=25, dest='max_results')
+    parser.add_argument('--max-requests-per-minute', type=float, default=1200, dest='max_requests_per_minute',
+                        help='Sustainable request rate of the mock server')
+    parser.add_argument('--latency', type=int, default=20, help='Mean response delay in milliseconds')
+    args = parser.parse_args()
+
+    server = MockServer(latency=args.latency, latency_jitter=args.latency // 2, retry_after=1,
+                        max_requests_per_minute=args.max_requests_per_minute).start()
+    strategies = [
+        ('fixed (1/4 of limit)', args.max_requests_per_minute / 4, False),
+        ('fixed (2x limit)', args.max_requests_per_minute * 2, False),
+        ('adaptive', args.max_requests_per_minute / 4, True),
+    ]
+    print('Sustainable rate of the mock server: {0:.0f} requests per minute'.format(args.max_requests_per_minute))
+    print('{0:<22} {1:>8} {2:>8} {3:>9} {4:>7} {5:>6} {6:>10} {7:>10} {8:>8}'.format(
+        'strategy', 'qps', 'requests', 'throttled', 'retries', 'failed', 'final rpm', 'peak rpm', 'changes'))
+    for name, requests_per_minute, adaptive_pacing in strategies:
+        result = run(server, args, name, requests_per_minute, adaptive_pacing)
+        print('{name:<22} {qps:>8.1f} {requests:>8} {throttled:>9} {retries:>7} {failed:>6} {final:>10.1f} '
+              '{peak:>10.1f} {changes:>8}'.format(**result))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure parser throughput on saved result pages, independent of the network.
+The fixture pages in benchmark/fixtures reproduce Duck Duck Go's HTML result page markup
+for the search results exported to output/queries.csv.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from lxml import html
+
+from ddg.result_parser import parse_result_items
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def parse_with_xpath_strings(content, max_results):
+    """ Parsing as done before ddg.result_parser (XPath strings evaluated for every page and item). """
+    tree = html.fromstring(content)
+    items = tree.xpath('//div[@class="results"]'
+                       '/div[contains(@class, "result")]'
+                       '/div[contains(@class, "result__body")]')
+    results = []
+    for item in items:
+        title = "".join(item.xpath('h2[@class="result__title"]/a[@class="result__a"]/descendant::text()'))
+        url = "".join(item.xpath('h2[@class="result__title"]/a[@class="result__a"]/@href'))
+        snippet = "".join(item.xpath('a[@class="result__snippet"]/descendant::text()'))
+        results.append((url, title, snippet))
+        if len(results) == max_results:
+            break
+    return results
+
+
+def parse_with_result_parser(content, max_results):
+    results = []
+    for result in parse_result_items(html.fromstring(content)):
+        results.append(result)
+        if len(results) == max_results:
+            break
+    return results
+
+
+def load_fixtures():
+    pages = []
+    for file_path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html'))):
+        with open(file_path, 'rb') as fp:
+            pages.append(fp.read())
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('-m', '--max-results', type=int, default=25, dest='max_results')
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_fixtures()
+    for page in pages:
+        # both parsers must extract the same results
+        assert parse_with_xpath_strings(page, args.max_results) == parse_with_result_parser(page, args.max_results)
+
+    parsers = [('XPath strings', parse_with_xpath_strings), ('result_parser', parse_with_result_parser)]
+    # best of several alternating rounds, so that load on the machine affects both parsers alike
+    best = dict()
+    for _ in range(args.rounds):
+        for name, parse in parsers:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                for page in pages:
+                    parse(page, args.max_results)
+            elapsed = time.perf_counter() - start
+            best[name] = min(best.get(name, elapsed), elapsed)
+    for name, _ in parsers:
+        print('{0:<15} {1:>10.1f} pages/s'.format(name, args.iterations * len(pages) / best[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Measure refreshing a query set of which only a fraction is stale: a full run rewriting the output file
+(as before the refresh command) vs. the refresh command re-requesting only queries older than QueryStoreMaxAge
+and exporting the ranking changes, both against the local mock server (whose result pages change in between).
+Additionally, compare the ranking diff (keyed by URL) with a diff using nested scans of both result lists.
+"""
+
+import argparse
+import configparser
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark.mock_server import add_fault_arguments, create_server
+from benchmark.throughput_benchmark import SCRIPT, count_rows, write_input
+from ddg.ranking_diff import diff_rankings
+from ddg.search_result import SearchResult
+
+
+def write_config(file_path, directory, search_uri, args, query_store=True):
+    config = configparser.ConfigParser()
+    config.optionxform = str  # keep case of keys
+    config['DEFAULT'] = {
+        'InputFile': os.path.join(directory, 'queries.csv'),
+        'OutputDirectory': os.path.join(directory, 'output'),
+        'Delimiter': ',',
+        'SearchUri': search_uri,
+        'MaxResults': str(args.max_results),
+        'MinWait': '0',
+        'MaxWait': '0',
+        'WaitOnError': '100',
+        'DetectLanguages': 'False',
+        'CheckForEmptySnippets': 'False',
+        'Concurrency': str(args.concurrency),
+        'QueryStore': os.path.join(directory, 'queries.sqlite') if query_store else '',
+        'QueryStoreMaxAge': '1',
+    }
+    with open(file_path, 'w') as fp:
+        config.write(fp)
+
+
+def run(server, directory, config_file, *command):
+    server.reset()
+    start = time.perf_counter()
+    subprocess.run([sys.executable, SCRIPT, '-c', config_file] + list(command), cwd=directory, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start, server.request_count
+
+
+def age_queries(store_file, fraction, seed=0):
+    """ Make a fraction of the stored queries older than QueryStoreMaxAge (1 hour). """
+    connection = sqlite3.connect(store_file)
+    query_strings = [row[0] for row in connection.execute("SELECT query FROM queries ORDER BY query")]
+    stale = random.Random(seed).sample(query_strings, int(len(query_strings) * fraction))
+    with connection:
+        connection.executemany("UPDATE queries SET fetch_time = fetch_time - 7200 WHERE query = ?",
+                               [(query_string,) for query_string in stale])
+    connection.close()
+    return len(stale)
+
+
+def diff_with_nested_scans(previous_results, current_results):
+    changes = list()
+    for search_result in current_results:
+        previous = [result for result in previous_results if result.url == search_result.url]
+        if len(previous) == 0:
+            changes.append(('new', search_result.url, search_result.rank, None, search_result.title))
+        elif previous[0].rank != search_result.rank:
+            changes.append(('moved', search_result.url, search_result.rank, previous[0].rank, search_result.title))
+    for search_result in previous_results:
+        if not any(result.url == search_result.url for result in current_results):
+            changes.append(('dropped', search_result.url, None, search_result.rank, search_result.title))
+    return changes
+
+
+def benchmark_diff(query_count, max_results, seed=0):
+    generator = random.Random(seed)
+    pairs = list()
+    for i in range(query_count):
+        urls = ['https://example.org/' + str(i) + '/' + str(j) for j in range(max_results * 2)]
+        previous = generator.sample(urls, max_results)
+        # some URLs move, some are replaced
+        current = previous[:]
+        moved = current[:max_results // 5]
+        generator.shuffle(moved)
+        current[:len(moved)] = moved
+        current[-2:] = generator.sample([url for url in urls if url not in previous], 2)
+        pairs.append(([SearchResult('q' + str(i), rank + 1, url, '', '') for rank, url in enumerate(previous)],
+                      [SearchResult('q' + str(i), rank + 1, url, '', '') for rank, url in enumerate(current)]))
+    for name, diff in [('nested scans', diff_with_nested_scans), ('keyed by URL', diff_rankings)]:
+        start = time.perf_counter()
+        change_count = sum(len(diff(previous, current)) for previous, current in pairs)
+        elapsed = time.perf_counter() - start
+        print('{0:<16} {1:>10.0f} queries/s {2:>8} changes'.format(name, query_count / elapsed, change_count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--queries', type=int, default=1000)
+    parser.add_argument('-s', '--stale', type=float, default=0.1, help='Fraction of stale queries')
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    parser.add_argument('--max-results', type=int, default=25, dest='max_results')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args).start()
+    with tempfile.TemporaryDirectory() as directory:
+        write_input(os.path.join(directory, 'queries.csv'), args.queries)
+        config_file = os.path.join(directory, 'config.ini')
+        write_config(config_file, directory, server.search_uri, args)
+
+        elapsed, requests = run(server, directory, config_file)
+        print('{0:<16} {1:>8.2f} s {2:>8} requests'.format('initial run', elapsed, requests))
+        stale = age_queries(os.path.join(directory, 'queries.sqlite'), args.stale)
+
+        # result pages change after the initial run
+        server.page_shift = 1
+        write_config(config_file, directory, server.search_uri, args, query_store=False)
+        elapsed, requests = run(server, directory, config_file)
+        print('{0:<16} {1:>8.2f} s {2:>8} requests {3:>8} rows written'.format(
+            'full run', elapsed, requests, count_rows(os.path.join(directory, 'output', 'queries.csv'))))
+
+        write_config(config_file, directory, server.search_uri, args)
+        elapsed, requests = run(server, directory, config_file, 'refresh')
+        print('{0:<16} {1:>8.2f} s {2:>8} requests {3:>8} rows written ({4} stale queries)'.format(
+            'refresh', elapsed, requests, count_rows(os.path.join(directory, 'output', 'queries.changes.csv')),
+            stale))
+
+    server.shutdown()
+    benchmark_diff(10000, args.max_results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+""" Compare one HTTP session per query with a shared, pooled session against a local server. """
+
+import argparse
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from ddg.query import Query
+from ddg.session import create_session
+
+PAGE = ('<html><body><div class="results">'
+        + '<div class="result results_links web-result"><div class="links_main links_deep result__body">'
+          '<h2 class="result__title"><a class="result__a" href="https://example.org/">Title</a></h2>'
+          '<a class="result__snippet" href="https://example.org/">Snippet</a></div></div>' * 25
+        + '</div></body></html>').encode('utf8')
+
+
+class CountingServer(ThreadingHTTPServer):
+    """ HTTP server counting accepted connections (i.e., handshakes). """
+
+    daemon_threads = True
+
+    def __init__(self, address, handler):
+        super().__init__(address, handler)
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def get_request(self):
+        request = super().get_request()
+        with self.lock:
+            self.connections += 1
+        return request
+
+
+class ResultPageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(server, queries, concurrency, session_factory):
+    server.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda query: query.retrieve_search_results(
+            25, 0, 0, False, session=session_factory()), queries))
+    elapsed = time.perf_counter() - start
+    return len(queries) / elapsed, server.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--requests', type=int, default=500)
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    server = CountingServer(('127.0.0.1', 0), ResultPageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_uri = 'http://127.0.0.1:' + str(server.server_port) + '/html/?q='
+
+    def create_queries():
+        queries = []
+        for i in range(args.requests):
+            query = Query('query ' + str(i), True, True)
+            query.uri = base_uri + str(i)
+            queries.append(query)
+        return queries
+
+    shared_session = create_session(args.concurrency)
+    for name, session_factory in [('session per query', requests.Session),
+                                  ('shared session', lambda: shared_session)]:
+        requests_per_second, connections = run(server, create_queries(), args.concurrency, session_factory)
+        print('{0:<20} {1:>10.1f} requests/s {2:>6} connections'.format(name, requests_per_second, connections))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+End-to-end throughput of ddg-retriever.py against the local mock server (see benchmark/mock_server.py).
+For each configured concurrency, the tool is run in a fresh directory and the following values are reported:
+queries per second (wall clock time of the whole run), p50/p99 query latency (first request of a query until its
+result list has been parsed, including retries), scheduled retries, failed queries, and peak RSS of the process.
+"""
+
+import argparse
+import configparser
+import csv
+import datetime
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark.mock_server import add_fault_arguments, create_server
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ddg-retriever.py')
+
+log_line_regex = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) ddg-retriever_logger \w+: (.*)$')
+parsed_prefix = 'Successfully parsed result list for query: '
+retry_prefix = 'Retrying in '
+
+
+def write_input(file_path, count):
+    with open(file_path, 'w', encoding='utf8', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['query'])
+        for i in range(count):
+            writer.writerow(['Benchmark query ' + str(i)])
+
+
+def write_config(file_path, directory, search_uri, args, concurrency):
+    config = configparser.ConfigParser()
+    config.optionxform = str  # keep case of keys
+    config['DEFAULT'] = {
+        'InputFile': os.path.join(directory, 'queries.csv'),
+        'OutputDirectory': os.path.join(directory, 'output'),
+        'Delimiter': ',',
+        'SearchUri': search_uri,
+        'MaxResults': str(args.max_results),
+        'MinWait': str(args.min_wait),
+        'MaxWait': str(args.max_wait),
+        'WaitOnError': str(args.wait_on_error),
+        'MaxWaitOnError': str(args.wait_on_error * 8),
+        'MaxRetries': '3',
+        'DetectLanguages': str(args.detect_languages),
+        'Concurrency': str(concurrency),
+        'RequestsPerMinute': str(args.requests_per_minute),
+    }
+    with open(file_path, 'w') as fp:
+        config.write(fp)
+
+
+def parse_log(file_path):
+    """ :return: Tuple (dict of query -> time its result list has been parsed, number of scheduled retries). """
+    parsed_times = dict()
+    retries = 0
+    with open(file_path, encoding='utf8') as fp:
+        for line in fp:
+            match = log_line_regex.match(line.rstrip('\n'))
+            if match is None:
+                continue
+            message = match.group(2)
+            if message.startswith(parsed_prefix):
+                timestamp = datetime.datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S,%f').timestamp()
+                parsed_times[message[len(parsed_prefix):]] = timestamp
+            elif message.startswith(retry_prefix):
+                retries += 1
+    return parsed_times, retries
+
+
+def count_rows(file_path):
+    if not os.path.exists(file_path):
+        return 0
+    with open(file_path, encoding='utf8') as fp:
+        return max(0, sum(1 for _ in csv.reader(fp)) - 1)
+
+
+def percentile(values, p):
+    if len(values) == 0:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(server, args, concurrency):
+    server.reset()
+    with tempfile.TemporaryDirectory() as directory:
+        write_input(os.path.join(directory, 'queries.csv'), args.queries)
+        config_file = os.path.join(directory, 'config.ini')
+        write_config(config_file, directory, server.search_uri, args, concurrency)
+
+        # the tool writes its log file to the working directory
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, SCRIPT, '-c', config_file], cwd=directory,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # wait4 reports the resource usage of this process only (unlike getrusage(RUSAGE_CHILDREN))
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = status
+        elapsed = time.perf_counter() - start
+        if status != 0:
+            raise RuntimeError('ddg-retriever.py terminated with wait status ' + str(status))
+
+        parsed_times, retries = parse_log(os.path.join(directory, 'ddg-retriever.log'))
+        latencies = [parsed_times[query] - first_request
+                     for query, first_request in server.first_request_times.items() if query in parsed_times]
+        failed = count_rows(os.path.join(directory, 'output', 'failed_queries.csv'))
+
+    peak_rss = rusage.ru_maxrss / 1024 if sys.platform != 'darwin' else rusage.ru_maxrss / 2 ** 20
+    return {
+        'concurrency': concurrency,
+        'qps': args.queries / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'requests': server.request_count,
+        'retries': retries,
+        'failed': failed,
+        'rss': peak_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--queries', type=int, default=200)
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('-m', '--max-results', type=int, default=25, dest='max_results')
+    parser.add_argument('--min-wait', type=int, default=0, dest='min_wait')
+    parser.add_argument('--max-wait', type=int, default=0, dest='max_wait')
+    parser.add_argument('--wait-on-error', type=int, default=100, dest='wait_on_error')
+    parser.add_argument('--requests-per-minute', type=float, default=0, dest='requests_per_minute')
+    parser.add_argument('--detect-languages', action='store_true', dest='detect_languages')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args).start()
+    print('{0:>11} {1:>8} {2:>10} {3:>10} {4:>8} {5:>7} {6:>6} {7:>9}'.format(
+        'concurrency', 'qps', 'p50 [ms]', 'p99 [ms]', 'requests', 'retries', 'failed', 'RSS [MB]'))
+    for concurrency in args.concurrency:
+        result = run(server, args, concurrency)
+        print('{concurrency:>11} {qps:>8.1f} {p50:>10.1f} {p99:>10.1f} {requests:>8} {retries:>7} {failed:>6} '
+              '{rss:>9.1f}'.format(**result))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,25 @@
 import argparse
-import codecs
 import configparser
-import csv
 import logging
+import os
+import signal
 import sys
 
+from ddg import LOG_FILE
+from ddg.journal import Journal
+from ddg.language_cache import LanguageCache
+from ddg.metrics import Metrics, MetricsReporter
+from ddg.query import Query
 from ddg.query_list import QueryList
+from ddg.query_store import QueryStore
+from ddg.ranking_diff import RankingDiff
+from ddg.response_archive import ResponseArchive
+from ddg.response_cache import ResponseCache
+from ddg.result_formats import check_format, get_filename, read
 from ddg.search_result_list import SearchResultList
-from util.exceptions import IllegalArgumentError
+from ddg.sharding import filter_shard, get_shard_filename, merge_shards, parse_shard
+from util.exceptions import IllegalArgumentError, IllegalConfigurationError
+from util.log import configure_logger
 
 logger = logging.getLogger('ddg-retriever_logger')
 
@@ -22,6 +34,64 @@ def get_argument_parser():
         help='Path to config file',
         dest='config_file'
     )
+    arg_parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Skip queries already recorded in the journal of a previous (interrupted) run',
+        dest='resume'
+    )
+    arg_parser.add_argument(
+        '--shard',
+        help='Only retrieve the search results for shard i of N (e.g., 1/4), partitioning the queries by hash',
+        dest='shard'
+    )
+    subparsers = arg_parser.add_subparsers(dest='command')
+    merge_parser = subparsers.add_parser(
+        'merge',
+        help='Merge the output files of all shards in the order of the input file'
+    )
+    merge_parser.add_argument(
+        'shard_count',
+        type=int,
+        help='Number of shards'
+    )
+    subparsers.add_parser(
+        'reparse',
+        help='Extract the search results again from the result pages archived in a previous run (ArchiveResponses)'
+    )
+    refresh_parser = subparsers.add_parser(
+        'refresh',
+        help='Retrieve only queries older than QueryStoreMaxAge again and export how their rankings have changed'
+    )
+    refresh_parser.add_argument(
+        '--previous',
+        help='Previously exported search results to compare with (imported into the query store first)',
+        dest='previous_file'
+    )
+    combine_parser = subparsers.add_parser(
+        'combine',
+        help='Merge result files into one file sorted by query and rank, skipping duplicate URLs of a query'
+    )
+    combine_parser.add_argument(
+        'result_files',
+        nargs='+',
+        help='Files with exported search results (CSV, SQLite, or Parquet)'
+    )
+    combine_parser.add_argument(
+        '--output',
+        default='combined.csv',
+        help='Filename of the merged file in the output directory (default: combined.csv)',
+        dest='output_filename'
+    )
+    daemon_parser = subparsers.add_parser(
+        'daemon',
+        help='Keep running and retrieve queries as they arrive (JSON lines on stdin or files in a watched directory)'
+    )
+    daemon_parser.add_argument(
+        '--watch',
+        help='Directory to watch for input files instead of reading JSON lines from stdin',
+        dest='watch_dir'
+    )
     return arg_parser
 
 
@@ -30,6 +100,9 @@ def main():
     parser = get_argument_parser()
     args = parser.parse_args()
 
+    # initialize named global logger
+    configure_logger('ddg-retriever_logger', LOG_FILE)
+
     # parse config file
     config = configparser.ConfigParser()
     config.read(args.config_file)
@@ -48,46 +121,285 @@ def main():
         logger.error("Required configuration missing.\nTerminating.")
         sys.exit()
 
+    # search results can also be exported to SQLite databases or Parquet files
+    output_format = config['DEFAULT'].get('OutputFormat', 'csv').lower()
+    output_batch_size = config['DEFAULT'].getint('OutputBatchSize', 1000)
+    check_format(output_format)
+
     # requests
+    Query.search_uri = config['DEFAULT'].get('SearchUri', Query.search_uri)
     exact_matches = config['DEFAULT'].getboolean('ExactMatches', True)
     remove_special_characters = config['DEFAULT'].getboolean('RemoveSpecialCharacters', True)
     max_results = config['DEFAULT'].getint('MaxResults', 25)
     min_wait = config['DEFAULT'].getint('MinWait', 500)
     max_wait = config['DEFAULT'].getint('MaxWait', 2000)
     wait_on_error = config['DEFAULT'].getint('WaitOnError', 30000)
+    max_wait_on_error = config['DEFAULT'].getint('MaxWaitOnError', 300000)
+    max_retries = config['DEFAULT'].getint('MaxRetries', 3)
     check_for_empty_snippets = config['DEFAULT'].getboolean('CheckForEmptySnippets', True)
+    concurrency = config['DEFAULT'].getint('Concurrency', 1)
+    requests_per_minute = config['DEFAULT'].getfloat('RequestsPerMinute', 0)
+    pool_size = config['DEFAULT'].getint('PoolSize', 10)
+    http2 = config['DEFAULT'].getboolean('HTTP2', False)
+    adaptive_pacing = config['DEFAULT'].getboolean('AdaptivePacing', False)
+    min_requests_per_minute = config['DEFAULT'].getfloat('MinRequestsPerMinute', 6)
+    max_requests_per_minute = config['DEFAULT'].getfloat('MaxRequestsPerMinute', 600)
+
+    # caching of raw result pages
+    cache_dir = config['DEFAULT'].get('CacheDirectory', '')
+    cache_ttl = config['DEFAULT'].getint('CacheTTL', 168)
+    cache_max_size = config['DEFAULT'].getint('CacheMaxSize', 1024)
+
+    # archive of the raw result pages of each run, which can be parsed again offline
+    archive_responses = config['DEFAULT'].getboolean('ArchiveResponses', False)
+    reparse_processes = config['DEFAULT'].getint('ReparseProcesses', 0)
+
+    # index of queries retrieved in previous runs
+    query_store_file = config['DEFAULT'].get('QueryStore', '')
+    query_store_max_age = config['DEFAULT'].getfloat('QueryStoreMaxAge', 0)
+    join_stored_results = config['DEFAULT'].getboolean('JoinStoredResults', True)
 
     # detecting languages of snippets
     detect_languages = config['DEFAULT'].getboolean('DetectLanguages', True)
+    language_detection_processes = config['DEFAULT'].getint('LanguageDetectionProcesses', 1)
+    language_detection_chunk_size = config['DEFAULT'].getint('LanguageDetectionChunkSize', 1000)
+    language_cache_file = config['DEFAULT'].get('LanguageCache', '')
+    language_cache_size = config['DEFAULT'].getint('LanguageCacheSize', 100000)
+
+    # metrics (JSON lines snapshots and/or Prometheus text format)
+    metrics_file = config['DEFAULT'].get('MetricsFile', '')
+    metrics_interval = config['DEFAULT'].getfloat('MetricsInterval', 60)
+    prometheus_file = config['DEFAULT'].get('PrometheusFile', '')
+    prometheus_port = config['DEFAULT'].getint('PrometheusPort', 0)
+
+    # process input file lazily instead of loading it into memory
+    streaming = config['DEFAULT'].getboolean('Streaming', False)
+
+    # merging result files (number of search results sorted in memory at once)
+    sort_chunk_size = config['DEFAULT'].getint('SortChunkSize', 100000)
+
+    # daemon mode (seconds between two scans of the watched directory)
+    watch_interval = config['DEFAULT'].getfloat('WatchInterval', 1)
+
+    shard_index, shard_count = (1, 1)
+    if args.shard is not None:
+        shard_index, shard_count = parse_shard(args.shard)
+
+    filename = os.path.basename(input_file)
+    if os.path.abspath(os.path.join(output_dir, get_filename(filename, output_format))) == os.path.abspath(input_file):
+        raise IllegalConfigurationError("Output file must not overwrite input file.")
+
+    # memo of detected languages shared across runs
+    language_cache = None
+    if detect_languages and language_cache_file:
+        language_cache = LanguageCache(language_cache_file, language_cache_size)
 
-    queries_only = False
+    query_store = None
+    if query_store_file:
+        query_store = QueryStore(query_store_file, query_store_max_age * 3600)
+    if args.command == 'refresh':
+        if query_store is None:
+            raise IllegalConfigurationError("Refreshing search results requires a QueryStore.")
+        if args.previous_file is not None:
+            # search results of an output file count as retrieved when the file has been written
+            logger.info("Importing search results from " + args.previous_file + "...")
+            query_store.import_search_results(SearchResultList.iter_from_file(args.previous_file, delimiter),
+                                              os.path.getmtime(args.previous_file))
 
-    # read CSV as UTF-8 encoded file (see also http://stackoverflow.com/a/844443)
-    with codecs.open(input_file, encoding='utf8') as fp:
+    def retrieve_search_results(query_list, queries, journal=None, archive=None):
+        """ Retrieve the search results of the queries with the configured cache, request profiles, and metrics. """
+        cache = None
+        # refreshed queries are requested again instead of being served from result pages cached up to CacheTTL ago
+        if cache_dir and args.command != 'refresh':
+            cache = ResponseCache(cache_dir, cache_ttl * 3600, cache_max_size * 1024 * 1024)
+        # request profiles ([Profile <name>] sections), each with its own session and rate budget
+        from ddg.request_profile import read_profiles
+        profiles = read_profiles(config, min_wait, max_wait, adaptive_pacing, min_requests_per_minute,
+                                 max_requests_per_minute, pool_size, http2, wait_on_error, max_wait_on_error)
+        metrics = None
+        metrics_reporter = None
+        if metrics_file or prometheus_file or prometheus_port > 0:
+            metrics = Metrics()
+            metrics_reporter = MetricsReporter(metrics, metrics_interval, metrics_file, prometheus_file,
+                                               prometheus_port).start()
+        try:
+            query_list.retrieve_search_results(max_results, min_wait, max_wait, wait_on_error,
+                                               detect_languages, check_for_empty_snippets,
+                                               concurrency=concurrency,
+                                               requests_per_minute=requests_per_minute,
+                                               pool_size=pool_size,
+                                               http2=http2,
+                                               journal=journal,
+                                               cache=cache,
+                                               queries=queries,
+                                               language_cache=language_cache,
+                                               max_wait_on_error=max_wait_on_error,
+                                               max_retries=max_retries,
+                                               metrics=metrics,
+                                               adaptive_pacing=adaptive_pacing,
+                                               min_requests_per_minute=min_requests_per_minute,
+                                               max_requests_per_minute=max_requests_per_minute,
+                                               archive=archive,
+                                               profiles=profiles)
+        finally:
+            for profile in profiles:
+                profile.close()
+            if metrics_reporter is not None:
+                metrics_reporter.close()
+
+    try:
+        if args.command == 'combine':
+            combined_file = os.path.join(output_dir, get_filename(args.output_filename, output_format))
+            if any(os.path.abspath(combined_file) == os.path.abspath(result_file) for result_file in args.result_files):
+                raise IllegalArgumentError("Output file must not overwrite a result file.")
+            from ddg.external_sort import combine_result_files
+            logger.info("Merging " + str(len(args.result_files)) + " result files...")
+            combine_result_files(args.result_files, output_dir, args.output_filename, delimiter, output_format,
+                                 sort_chunk_size, output_batch_size)
+            logger.info("Finished.")
+            return
+
+        if args.command == 'daemon':
+            if args.resume or shard_count > 1:
+                raise IllegalArgumentError("The daemon mode supports neither --resume nor --shard.")
+            from ddg.daemon import StdinDaemon, WatchDirectoryDaemon
+            if args.watch_dir is None:
+                daemon = StdinDaemon(sys.stdin, sys.stdout, exact_matches, remove_special_characters,
+                                     detect_languages)
+            else:
+                if os.path.abspath(args.watch_dir) == os.path.abspath(output_dir):
+                    raise IllegalConfigurationError("Output directory must not be the watched directory.")
+                daemon = WatchDirectoryDaemon(args.watch_dir, output_dir, delimiter, output_format, exact_matches,
+                                              remove_special_characters, detect_languages, watch_interval,
+                                              output_batch_size)
+            # finish the queries that have already been read before terminating
+            signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+            signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+            daemon.query_store = query_store
+            query_list = QueryList()
+            query_list.query_store = query_store
+            query_list.query_handler = daemon.handle_query
+            retrieve_search_results(query_list, daemon.iter_queries())
+            logger.info("Finished.")
+            return
+
+        # CSV files are read as UTF-8 encoded files (see also http://stackoverflow.com/a/844443)
         logger.info("Checking input format in " + input_file + "...")
-        reader = csv.reader(fp, delimiter=delimiter)
-        # read header
-        header = next(reader, None)
+        # read header (only once, the remaining rows are read from the same reader)
+        header, reader = read(input_file, delimiter)
         if not header:
-            raise IllegalArgumentError("Missing header in CSV file.")
+            raise IllegalArgumentError("Missing header in input file.")
         queries_only = len(header) == 1
 
-    if queries_only:
-        logger.info("Input file contains only queries, retrieving search results...")
-        query_list = QueryList()
-        query_list.read_from_csv(input_file, exact_matches, remove_special_characters, delimiter)
-        query_list.retrieve_search_results(max_results, min_wait, max_wait, wait_on_error,
-                                           detect_languages, check_for_empty_snippets)
-        query_list.write_search_results_to_csv(output_dir, delimiter, detect_languages)
-        query_list.write_failed_queries(output_dir, delimiter)
-    elif detect_languages:
-        logger.info("Input file contains search results, detecting language of snippets...")
-        search_result_list = SearchResultList()
-        search_result_list.read_from_csv(input_file, delimiter)
-        search_result_list.detect_languages()
-        search_result_list.write_to_csv(output_dir, delimiter, detect_languages)
-    else:
-        logger.info("No action configured, terminating...")
+        if queries_only:
+            logger.info("Input file contains only queries, retrieving search results...")
+            query_list = QueryList()
+            query_list.filename = filename
+            if args.command == 'merge':
+                queries = query_list.iter_from_reader(reader, header, exact_matches, remove_special_characters)
+                merge_shards(query_list, queries, output_dir, delimiter, args.shard_count, output_format)
+                logger.info("Finished.")
+                return
+
+            # when refreshing, queries that are not older than QueryStoreMaxAge are skipped
+            queries = query_list.iter_from_reader(reader, header, exact_matches, remove_special_characters,
+                                                  query_store, join_stored_results and args.command != 'refresh')
+            failed_queries_filename = "failed_queries.csv"
+            if shard_count > 1:
+                # queries are deduplicated before partitioning, duplicates always belong to the same shard
+                logger.info("Retrieving search results for shard " + str(shard_index) + "/" + str(shard_count)
+                            + "...")
+                queries = filter_shard(queries, shard_index, shard_count)
+                query_list.filename = get_shard_filename(filename, shard_index, shard_count)
+                failed_queries_filename = get_shard_filename(failed_queries_filename, shard_index, shard_count)
+
+            if args.command == 'reparse':
+                archive_file = os.path.join(output_dir, query_list.filename + '.archive')
+                if not os.path.exists(archive_file):
+                    raise IllegalArgumentError("Response archive " + archive_file + " not found.")
+                logger.info("Extracting search results from " + archive_file + "...")
+                search_results = query_list.iter_reparsed_search_results(archive_file, max_results,
+                                                                         check_for_empty_snippets,
+                                                                         reparse_processes or None)
+                if detect_languages:
+                    search_results = SearchResultList.iter_with_languages(search_results,
+                                                                          language_detection_processes,
+                                                                          language_detection_chunk_size,
+                                                                          language_cache)
+                query_list.search_results.write(output_dir, delimiter, detect_languages, query_list.filename,
+                                                search_results, output_format, output_batch_size)
+                query_list.write_failed_queries(output_dir, delimiter, failed_queries_filename)
+                logger.info("Finished.")
+                return
+
+            if args.command == 'refresh':
+                if args.resume:
+                    raise IllegalArgumentError("Refreshing search results does not support --resume.")
+                logger.info("Refreshing stale search queries from " + input_file + "...")
+                # search results are only kept in the query store, i.e., queries are always streamed
+                query_list.ranking_diff = RankingDiff(output_dir, query_list.filename, output_format, delimiter,
+                                                      output_batch_size)
+                try:
+                    retrieve_search_results(query_list, queries)
+                finally:
+                    query_list.ranking_diff.close()
+                query_list.write_failed_queries(output_dir, delimiter, failed_queries_filename)
+                logger.info("Finished.")
+                return
+
+            if streaming:
+                logger.info("Streaming search queries from " + input_file + "...")
+            else:
+                logger.info("Reading search queries from " + input_file + "...")
+                query_list.initialize(query_list.filename, queries)
+                logger.info(str(len(query_list.values)) + " search queries have been imported.")
+                queries = None
+
+            # checkpoint each processed query to be able to resume interrupted runs
+            journal = Journal(os.path.join(output_dir, query_list.filename + '.journal'))
+            journal.open(args.resume)
+            archive = None
+            if archive_responses:
+                archive = ResponseArchive(os.path.join(output_dir, query_list.filename + '.archive'))
+                archive.open(args.resume)
+            try:
+                retrieve_search_results(query_list, queries, journal, archive)
+                query_list.write_search_results(output_dir, delimiter, detect_languages, output_format)
+                query_list.write_failed_queries(output_dir, delimiter, failed_queries_filename)
+            finally:
+                journal.close()
+                if archive is not None:
+                    archive.close()
+        elif args.command == 'merge' or shard_count > 1:
+            raise IllegalArgumentError("Sharding requires an input file with queries.")
+        elif detect_languages:
+            logger.info("Input file contains search results, detecting language of snippets...")
+            search_result_list = SearchResultList()
+            search_results = SearchResultList.iter_from_reader(reader, header)
+            if streaming:
+                logger.info("Streaming search results from " + input_file + "...")
+                search_result_list.write(output_dir, delimiter, detect_languages, filename,
+                                         SearchResultList.iter_with_languages(
+                                             search_results, language_detection_processes,
+                                             language_detection_chunk_size, language_cache),
+                                         output_format, output_batch_size)
+            else:
+                logger.info("Reading search results from " + input_file + "...")
+                search_result_list.filename = filename
+                search_result_list.values.extend(search_results)
+                logger.info(str(len(search_result_list.values)) + " search results have been imported.")
+                search_result_list.detect_languages(language_detection_processes, language_detection_chunk_size,
+                                                    language_cache)
+                search_result_list.write(output_dir, delimiter, detect_languages, None, None, output_format,
+                                         output_batch_size)
+        else:
+            logger.info("No action configured, terminating...")
+    finally:
+        if query_store is not None:
+            query_store.close()
+        if language_cache is not None:
+            language_cache.log_statistics()
+            language_cache.close()
 
     logger.info("Finished.")
 
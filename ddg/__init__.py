@@ -1,6 +1,2 @@
-import util.log
-
+# the logger is configured by ddg-retriever.py (see util.log.configure_logger), not when importing this package
 LOG_FILE = 'ddg-retriever.log'
-
-# initialize named global logger
-logger = util.log.configure_logger('ddg-retriever_logger', LOG_FILE)
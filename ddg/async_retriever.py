@@ -0,0 +1,373 @@
+"""
+Asyncio API for embedding the retriever in asynchronous services (requires the optional package httpx).
+
+    async with AsyncRetriever(requests_per_minute=30) as retriever:
+        search_results = await retriever.search('SQL injection', max_results=10)
+
+Queries are processed by the same Query methods as in the synchronous CLI (caching, parsing, pagination,
+empty result checks). Requests, delays, and retries are non-blocking; parsing and cache access run in a thread pool,
+language cache access in a dedicated thread, and language detection in worker processes, so that they do not stall
+other coroutines.
+"""
+
+import asyncio
+import collections
+import functools
+import logging
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from random import randint
+
+import requests
+
+from ddg.language_detection import detect_languages, get_process_context, initialize
+from ddg.query import Query
+from ddg.retry_scheduler import RetryScheduler
+from util.exceptions import IllegalConfigurationError
+from util.rate_limiter import get_requests_per_minute
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+class AsyncTokenBucket(object):
+    """ Token bucket shared by all coroutines of an event loop (see util.rate_limiter.TokenBucket). """
+
+    def __init__(self, requests_per_minute, capacity=1):
+        """
+        :param requests_per_minute: Number of tokens refilled per minute.
+        :param capacity: Maximum number of tokens that can be accumulated (burst size).
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("Rate must be positive.")
+        self.rate = requests_per_minute / 60  # tokens per second
+        self.capacity = max(1, capacity)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self):
+        """
+        Wait until a token is available and consume it.
+        :return: Time spent waiting in seconds.
+        """
+        waited = 0.0
+        # waiting coroutines are served in order
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class AsyncRetriever(object):
+    """
+    Retrieves search results with a non-blocking HTTP client that keeps connections alive across queries.
+    Failed attempts are retried with exponential backoff (see RetryScheduler) without blocking other queries.
+    """
+
+    # maximum number of queries that are processed or buffered to be yielded in input order
+    max_pending_queries = 1000
+
+    def __init__(self, max_results=25, min_wait=500, max_wait=2000, wait_on_error=30000, max_wait_on_error=300000,
+                 max_retries=3, check_for_empty_snippets=True, concurrency=1, requests_per_minute=0, pool_size=10,
+                 http2=False, cache=None, metrics=None, client=None, executor=None, language_detection_processes=1):
+        """
+        :param concurrency: Maximum number of concurrent requests.
+        :param requests_per_minute: Request budget shared by all queries; if not positive, each request waits
+            randomly between min_wait and max_wait milliseconds instead (with concurrency > 1, the waits are
+            converted to a shared budget, i.e., concurrent requests do not multiply the request rate).
+        :param cache: Response cache for raw result pages (see ResponseCache).
+        :param metrics: Metrics to record timings, retries, etc. in (see Metrics).
+        :param client: httpx.AsyncClient to use instead of creating one.
+        :param executor: Thread pool for parsing result pages and accessing the cache (None = default executor of
+            the event loop).
+        :param language_detection_processes: Number of worker processes detecting snippet languages
+            (started on first use).
+        See QueryList.retrieve_search_results for the remaining parameters.
+        """
+        self.max_results = max_results
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.check_for_empty_snippets = check_for_empty_snippets
+        self.cache = cache
+        self.metrics = metrics
+        self.retry_scheduler = RetryScheduler(wait_on_error, max_wait_on_error)
+        if requests_per_minute <= 0 and concurrency > 1:
+            requests_per_minute = get_requests_per_minute(min_wait, max_wait)
+        self.rate_limiter = AsyncTokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = executor
+        self.language_detection_processes = language_detection_processes
+        self.language_executor = None
+        self.language_executor_lock = asyncio.Lock()
+        # the language cache is not thread-safe, so all lookups and writes run in one thread
+        self.language_cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='language-cache')
+        # snippet -> detection in progress (shared by concurrent queries with the same snippets)
+        self.pending_languages = dict()
+
+        if client is None:
+            try:
+                import httpx
+            except ImportError:
+                raise IllegalConfigurationError("The asyncio API requires the optional package httpx.")
+            limit = max(pool_size, concurrency)
+            client = httpx.AsyncClient(http2=http2, limits=httpx.Limits(max_connections=limit,
+                                                                         max_keepalive_connections=limit))
+        self.client = client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+        if self.language_executor is not None:
+            # waits for the worker processes to exit
+            await self.run_blocking(self.language_executor.shutdown)
+            self.language_executor = None
+        # waits for pending language cache writes
+        await self.run_blocking(self.language_cache_executor.shutdown)
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """ Run a blocking function (parsing, disk I/O) in the thread pool instead of the event loop. """
+        return await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                                functools.partial(function, *args, **kwargs))
+
+    async def search(self, query_string, max_results=None, exact_matches=True, remove_special_characters=True):
+        """
+        Retrieve the search results for a query string.
+        :param max_results: Maximum number of search results (default: max_results of this retriever).
+        :return: List of search results (empty if the query is empty or has failed).
+        """
+        query = Query(query_string, exact_matches, remove_special_characters)
+        await self.retrieve(query, max_results)
+        return query.search_results.values
+
+    async def retrieve(self, query, max_results=None):
+        """ Retrieve the search results of a query, retrying failed attempts. :return: The processed query. """
+        while not await self.attempt(query, self.max_results if max_results is None else max_results):
+            delay = self.retry_scheduler.get_delay(query)
+            self.retry_scheduler.retry_count += 1
+            if self.metrics is not None:
+                self.metrics.increment('retries')
+            logger.info('Retrying in ' + '{0:.0f}'.format(delay * 1000) + ' milliseconds: ' + str(query))
+            await asyncio.sleep(delay)
+        return query
+
+    async def iter_queries(self, queries, detect_languages=False, language_cache=None):
+        """
+        Asynchronously retrieve the search results of the passed queries (e.g., the values of a QueryList),
+        up to concurrency requests at once.
+        :param detect_languages: Detect the snippet languages before a query is yielded.
+        :param language_cache: Language cache to look up and store detected languages.
+        :return: Asynchronous generator of the processed queries in input order.
+        """
+        pending = collections.deque()
+        try:
+            for query in queries:
+                pending.append(asyncio.ensure_future(self._process(query, detect_languages, language_cache)))
+                if len(pending) >= self.max_pending_queries:
+                    yield await pending.popleft()
+            while len(pending) > 0:
+                yield await pending.popleft()
+        finally:
+            # consumer stopped early
+            for task in pending:
+                task.cancel()
+
+    async def _process(self, query, detect_languages, language_cache):
+        await self.retrieve(query)
+        if detect_languages:
+            # overlaps with the retrieval of other queries
+            await self.detect_languages(query.search_results.values, language_cache)
+        return query
+
+    async def detect_languages(self, search_results, language_cache=None):
+        """
+        Detect the snippet languages of search results in worker processes (langdetect is CPU-bound).
+        :param language_cache: Language cache to look up and store detected languages; it is accessed in a dedicated
+            thread, because it is not thread-safe.
+        """
+        languages = dict()
+        detections = dict()
+        snippets = OrderedDict()
+        for search_result in search_results:
+            snippet = search_result.snippet
+            if snippet in self.pending_languages:
+                detections[snippet] = self.pending_languages[snippet]
+            else:
+                snippets[snippet] = None
+        if language_cache is not None and len(snippets) > 0:
+            languages = await self.run_language_cache(get_cached_languages, language_cache, list(snippets))
+        for snippet in list(snippets):
+            if snippet in languages:
+                del snippets[snippet]
+            elif snippet in self.pending_languages:
+                # detection started by another query during the cache lookup
+                detections[snippet] = self.pending_languages[snippet]
+                del snippets[snippet]
+        if len(snippets) > 0:
+            # each distinct snippet is detected only once
+            snippets = list(snippets)
+            detection = asyncio.ensure_future(self._detect_languages(snippets, language_cache))
+            for snippet in snippets:
+                self.pending_languages[snippet] = detection
+                detections[snippet] = detection
+        for snippet, detection in detections.items():
+            # a cancelled query does not cancel detections other queries wait for
+            languages[snippet] = (await asyncio.shield(detection))[snippet]
+        for search_result in search_results:
+            search_result.language = languages[search_result.snippet]
+
+    async def _detect_languages(self, snippets, language_cache):
+        try:
+            detected = await asyncio.get_running_loop().run_in_executor(await self.get_language_executor(),
+                                                                        detect_languages, snippets)
+            languages = dict(zip(snippets, detected))
+            if language_cache is not None:
+                # may flush a batch of entries to the database
+                await self.run_language_cache(put_languages, language_cache, languages)
+            return languages
+        finally:
+            for snippet in snippets:
+                del self.pending_languages[snippet]
+
+    async def run_language_cache(self, function, *args):
+        """ Run a function accessing the language cache in its dedicated thread. """
+        return await asyncio.get_running_loop().run_in_executor(self.language_cache_executor,
+                                                                functools.partial(function, *args))
+
+    async def get_language_executor(self):
+        """ :return: Pool of language detection worker processes, started on first use. """
+        async with self.language_executor_lock:
+            if self.language_executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+
+                # load language profiles (about 0.5 s) once before forking instead of in every worker process
+                await self.run_blocking(initialize)
+                self.language_executor = ProcessPoolExecutor(max_workers=self.language_detection_processes,
+                                                             mp_context=get_process_context(),
+                                                             initializer=initialize)
+        return self.language_executor
+
+    async def attempt(self, query, max_results):
+        """ One attempt to retrieve the search results of a query (see Query.retrieve_search_results). """
+        if query.is_empty:
+            logger.info("Empty query skipped.")
+            return True
+
+        check_for_empty_snippets = query.start_attempt(self.max_retries, self.check_for_empty_snippets)
+
+        try:
+            page = ('get', query.uri, None)
+            while page is not None:
+                method, page_uri, parameters = page
+                if self.cache is not None:
+                    content = await self.run_blocking(query.get_cached_page, page_uri, parameters, self.cache,
+                                                      self.metrics)
+                else:
+                    content = query.get_cached_page(page_uri, parameters, None, self.metrics)
+                if content is None:
+                    async with self.semaphore:
+                        content = await self.retrieve_page(query, method, page_uri, parameters)
+                if content is None:
+                    return await self.handle_error(query)
+
+                is_valid, page = await self.run_blocking(query.parse_page, content, page_uri, max_results,
+                                                         check_for_empty_snippets, self.metrics)
+                if not is_valid:
+                    return await self.handle_error(query)
+
+            return query.finish_attempt(self.metrics)
+
+        except (ConnectionError, OSError, requests.exceptions.RequestException) as e:
+            return await self.handle_error(query, e)
+
+    async def handle_error(self, query, e=None):
+        """ See Query.handle_error; unexpected OS errors mark the query as failed instead of exiting. """
+        if self.cache is not None:
+            # removes the cached page
+            return await self.run_blocking(query.handle_error, self.max_retries, self.cache, e, terminate=False)
+        return query.handle_error(self.max_retries, None, e, terminate=False)
+
+    async def retrieve_page(self, query, method, page_uri, parameters):
+        """ Request a result page that is not cached. :return: Raw content of the page or None. """
+        import httpx
+
+        wait_start = time.perf_counter()
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        else:
+            # reduce request frequency as configured
+            await asyncio.sleep(randint(self.min_wait, self.max_wait) / 1000)
+
+        fetch_start = time.perf_counter()
+        try:
+            if method == 'post':
+                response = await self.client.post(page_uri, data=dict(parameters), headers=query.headers)
+            else:
+                response = await self.client.get(page_uri, params=parameters, headers=query.headers)
+        except httpx.TransportError as e:
+            # handled like connection errors of the synchronous session (i.e., retried)
+            raise requests.exceptions.ConnectionError(e)
+
+        if self.metrics is not None:
+            self.metrics.observe('rate_limit_wait_seconds', fetch_start - wait_start)
+            self.metrics.observe('fetch_seconds', time.perf_counter() - fetch_start)
+
+        if self.cache is not None:
+            # compresses and writes the page to the cache
+            return await self.run_blocking(query.process_response, response.status_code, response.headers,
+                                           response.content, self.cache, self.metrics)
+        return query.process_response(response.status_code, response.headers, response.content, None, self.metrics)
+
+
+def get_cached_languages(language_cache, snippets):
+    """ :return: Dictionary snippet -> language of the snippets whose language is cached. """
+    languages = dict()
+    for snippet in snippets:
+        language = language_cache.get(snippet)
+        if language is not None:
+            languages[snippet] = language
+    return languages
+
+
+def put_languages(language_cache, languages):
+    """ Store detected languages (dictionary snippet -> language) in the language cache. """
+    for snippet, language in languages.items():
+        language_cache.put(snippet, language)
+
+
+async def search(query_string, max_results=25, **kwargs):
+    """
+    Retrieve the search results for a single query string with a temporary retriever.
+    :param kwargs: Parameters of AsyncRetriever (e.g., min_wait, max_wait, requests_per_minute).
+    :return: List of search results.
+    """
+    async with AsyncRetriever(max_results=max_results, **kwargs) as retriever:
+        return await retriever.search(query_string)
+
+
+async def iter_query_list(query_list, detect_languages=False, language_cache=None, **kwargs):
+    """
+    Retrieve the search results of all queries of a QueryList with a temporary retriever.
+    :param kwargs: Parameters of AsyncRetriever (e.g., max_results, concurrency, requests_per_minute).
+    :return: Asynchronous generator of the processed queries in input order.
+    """
+    async with AsyncRetriever(**kwargs) as retriever:
+        async for query in retriever.iter_queries(query_list.values, detect_languages, language_cache):
+            yield query
@@ -0,0 +1,294 @@
+"""
+Daemon mode: instead of retrieving the queries of one input file, ddg-retriever.py keeps running and retrieves
+queries as they arrive, either as JSON lines on stdin or as input files placed in a watched directory.
+All queries are processed by one QueryList, i.e., the HTTP connections, rate limiter, response cache, and the
+loaded language profiles are shared by all batches; results are written as soon as a query has been processed.
+"""
+
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from collections import deque
+
+from ddg.query import Query
+from ddg.query_list import NO_QUERY, QueryList
+from ddg.query_normalizer import QueryNormalizer
+from ddg.result_formats import create_writer, get_filename, read
+from ddg.search_result import SearchResult
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+class QueryDaemon(ABC):
+    """
+    Source of queries for QueryList.retrieve_search_results (see iter_queries) that receives the processed queries
+    in the same order (see handle_query, set as QueryList.query_handler).
+    """
+
+    # seconds to wait for new input before the query list continues collecting queries in flight
+    poll_interval = 0.05
+
+    def __init__(self, exact_matches, remove_special_characters, include_language):
+        """
+        :param include_language: Add the detected snippet languages to the written search results.
+        """
+        # memoized normalization is shared by all batches
+        self.normalizer = QueryNormalizer(exact_matches, remove_special_characters)
+        self.include_language = include_language
+        self.pending = deque()  # (query, origin) in the order the queries have been yielded
+        self.stopped = threading.Event()
+        self.query_store = None  # store of previously retrieved queries, whose search results are joined
+
+    def stop(self):
+        """ Stop reading new input; queries that have already been read are still processed. """
+        if not self.stopped.is_set():
+            logger.info("Stopping daemon after the pending queries...")
+            self.stopped.set()
+
+    def create_query(self, query_string, is_empty, origin):
+        """
+        :param origin: Request or batch the query has been read from.
+        :return: Query, which is remembered with its origin until it has been processed.
+        """
+        query = Query.from_normalized(query_string, is_empty)
+        if self.query_store is not None and not is_empty and self.query_store.contains(query):
+            query.is_stored = True
+        self.pending.append((query, origin))
+        return query
+
+    @abstractmethod
+    def iter_queries(self):
+        """ :return: Generator of queries, yielding NO_QUERY while waiting for input. """
+
+    def handle_query(self, query):
+        pending_query, origin = self.pending.popleft()
+        assert pending_query is query, "Queries must be processed in the order they have been read."
+        self.write_query(query, origin)
+
+    @abstractmethod
+    def write_query(self, query, origin):
+        """ Write the search results of a processed query to the output of its origin. """
+
+
+class StdinDaemon(QueryDaemon):
+    """
+    Reads one request per line from an input stream, either a JSON object with key "query" (other keys, e.g., an id,
+    are passed through) or a JSON string, and writes one JSON line per request to an output stream in input order:
+    {"id": 1, "query": "SQL injection", "query_string": "\\"SQL injection\\"", "failed": false, "results": [...]}
+    """
+
+    def __init__(self, input_stream, output_stream, exact_matches, remove_special_characters, include_language):
+        super().__init__(exact_matches, remove_special_characters, include_language)
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        # bounded, so that reading pauses if queries arrive faster than they are retrieved
+        self.requests = queue.Queue(maxsize=QueryList.max_pending_queries)
+        self.request_count = 0
+
+    def read_requests(self):
+        """ Read requests in a background thread, so that the query list is not blocked while waiting for input. """
+        for line in iter(self.input_stream.readline, ''):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                request = json.loads(line)
+                if isinstance(request, str):
+                    request = {"query": request}
+                if not isinstance(request, dict) or not isinstance(request.get("query"), str):
+                    raise ValueError("key \"query\" missing")
+            except ValueError as e:
+                logger.error("Invalid request: " + line)
+                request = {"error": "Invalid request (" + str(e) + ")"}
+            self.requests.put(request)
+        # end of input
+        self.requests.put(None)
+
+    def iter_queries(self):
+        threading.Thread(target=self.read_requests, daemon=True).start()
+        logger.info("Reading search queries from stdin...")
+        while not self.stopped.is_set():
+            try:
+                request = self.requests.get(timeout=self.poll_interval)
+            except queue.Empty:
+                yield NO_QUERY
+                continue
+            if request is None:
+                logger.info("End of input reached.")
+                break
+            self.request_count += 1
+            if "error" in request:
+                # answered in input order like valid requests
+                yield self.create_query('', True, request)
+            else:
+                # empty queries are skipped by the query list, but still answered
+                query_string, is_empty = self.normalizer.normalize_cached(request["query"])
+                yield self.create_query(query_string, is_empty, request)
+
+    def write_query(self, query, request):
+        response = dict(request)
+        if "error" in request:
+            response["failed"] = True
+        else:
+            response["query_string"] = query.query_string
+            response["failed"] = query.has_failed
+            response["results"] = [dict(zip(SearchResult.get_column_names(self.include_language)[1:],
+                                            result.get_column_values(self.include_language)[1:]))
+                                   for result in query.search_results.values]
+        self.output_stream.write(json.dumps(response, ensure_ascii=False) + '\n')
+        self.output_stream.flush()
+
+
+class Batch(object):
+    """ Queries of one input file of the watched directory, whose search results are written to one output file. """
+
+    def __init__(self, input_file, output_dir, delimiter, output_format, include_language, batch_size):
+        self.input_file = input_file
+        self.filename = os.path.basename(input_file)
+        self.output_dir = output_dir
+        self.delimiter = delimiter
+        self.include_language = include_language
+        self.batch_size = batch_size
+        self.file_path = os.path.join(output_dir, get_filename(self.filename, output_format))
+        self.writer = create_writer(output_format, self.file_path,
+                                    SearchResult.get_column_names(include_language), delimiter)
+        self.rows = list()
+        self.query_count = 0  # number of queries read from the input file
+        self.processed_count = 0
+        self.result_count = 0
+        self.failed_queries = list()
+        self.is_read = False  # all queries have been read from the input file
+        self.start = time.monotonic()
+
+    def is_complete(self):
+        return self.is_read and self.processed_count == self.query_count
+
+    def add(self, query):
+        self.processed_count += 1
+        if query.has_failed:
+            self.failed_queries.append(query)
+        for search_result in query.search_results.values:
+            self.rows.append(search_result.get_column_values(self.include_language))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.result_count += self.writer.write_rows(self.rows)
+        self.rows = list()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        failed_queries = QueryList()
+        failed_queries.failed_queries = self.failed_queries
+        failed_queries.write_failed_queries(self.output_dir, self.delimiter,
+                                            os.path.splitext(self.filename)[0] + '.failed_queries.csv')
+        logger.info("Batch " + self.filename + " finished in " + '{0:.1f}'.format(time.monotonic() - self.start)
+                    + " seconds: " + str(self.query_count) + " queries, " + str(len(self.failed_queries))
+                    + " failed, " + str(self.result_count) + " search results exported to " + self.file_path + ".")
+
+
+class WatchDirectoryDaemon(QueryDaemon):
+    """
+    Retrieves the queries of each input file (column "query") placed in a watched directory and writes their search
+    results to an output file of the same name (and the failed queries to <name>.failed_queries.csv) in the output
+    directory. Completed input files are moved to the subdirectory "processed" of the watched directory.
+    Files whose names start with "." are ignored, i.e., input files should be written under such a name and renamed.
+    """
+
+    processed_directory = 'processed'
+
+    def __init__(self, watch_dir, output_dir, delimiter, output_format, exact_matches, remove_special_characters,
+                 include_language, watch_interval=1.0, batch_size=1000):
+        """
+        :param watch_interval: Seconds between two scans of the watched directory.
+        :param batch_size: Number of rows passed to the writer of an output file at once.
+        """
+        super().__init__(exact_matches, remove_special_characters, include_language)
+        self.watch_dir = watch_dir
+        self.output_dir = output_dir
+        self.delimiter = delimiter
+        self.output_format = output_format
+        self.watch_interval = watch_interval
+        self.batch_size = batch_size
+        self.batches = set()  # input files being processed
+
+    def scan(self):
+        """ :return: Paths of new input files in the order they have been placed in the watched directory. """
+        entries = [entry for entry in os.scandir(self.watch_dir)
+                   if entry.is_file() and not entry.name.startswith('.') and entry.path not in self.batches]
+        entries.sort(key=lambda entry: (entry.stat().st_mtime, entry.name))
+        return [entry.path for entry in entries]
+
+    def iter_queries(self):
+        for directory in [self.output_dir, os.path.join(self.watch_dir, self.processed_directory)]:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        logger.info("Watching " + self.watch_dir + " for input files...")
+
+        next_scan = time.monotonic()
+        while not self.stopped.is_set():
+            if time.monotonic() < next_scan:
+                time.sleep(self.poll_interval)
+                yield NO_QUERY
+                continue
+            next_scan = time.monotonic() + self.watch_interval
+            for input_file in self.scan():
+                if self.stopped.is_set():
+                    break
+                # an input file is read completely, even if the daemon is stopped in the meantime
+                for query in self.iter_batch(input_file):
+                    yield query
+
+    def iter_batch(self, input_file):
+        logger.info("Reading search queries from " + input_file + "...")
+        try:
+            header, reader = read(input_file, self.delimiter)
+            if not header or "query" not in header:
+                raise ValueError("column \"query\" missing")
+        except (ValueError, OSError) as e:
+            logger.error("Skipping input file " + input_file + " (" + str(e) + ").")
+            self.move_to_processed(input_file)
+            return
+
+        batch = Batch(input_file, self.output_dir, self.delimiter, self.output_format, self.include_language,
+                      self.batch_size)
+        self.batches.add(input_file)
+        query_index = header.index("query")
+        unique_query_strings = set()
+        while True:
+            rows = list(itertools.islice(reader, QueryList.normalization_batch_size))
+            if len(rows) == 0:
+                break
+            column = [row[query_index] for row in rows if len(row) > query_index]
+            # duplicates are only skipped within a batch, a later batch retrieves them again (or from the cache)
+            for query_string, is_empty in self.normalizer.normalize_batch(column):
+                if is_empty or query_string in unique_query_strings:
+                    continue
+                unique_query_strings.add(query_string)
+                batch.query_count += 1
+                yield self.create_query(query_string, False, batch)
+
+        batch.is_read = True
+        logger.info(str(batch.query_count) + " search queries have been read from " + input_file + ".")
+        if batch.is_complete():
+            self.finish(batch)
+
+    def write_query(self, query, batch):
+        batch.add(query)
+        if batch.is_complete():
+            self.finish(batch)
+
+    def finish(self, batch):
+        batch.close()
+        self.move_to_processed(batch.input_file)
+        self.batches.discard(batch.input_file)
+
+    def move_to_processed(self, input_file):
+        os.replace(input_file, os.path.join(self.watch_dir, self.processed_directory, os.path.basename(input_file)))
@@ -0,0 +1,173 @@
+"""
+External merge sort of search results that do not fit into memory (see the combine command of ddg-retriever.py):
+the search results are sorted in chunks of a fixed number of rows, which are written to temporary run files
+and merged afterwards, so that only one chunk (or one block of rows per run file while merging) is kept in memory.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import tempfile
+
+from ddg.search_result import SearchResult
+from ddg.search_result_list import SearchResultList
+from ddg.result_formats import read
+from util.exceptions import IllegalArgumentError
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+# number of rows read from a run file at once while merging
+RUN_BLOCK_SIZE = 1000
+
+
+def write_run(rows, directory):
+    """ Write sorted rows to a temporary run file (pickled blocks of rows). :return: Path of the run file. """
+    fd, file_path = tempfile.mkstemp(suffix='.run', dir=directory)
+    rows = iter(rows)
+    with open(fd, 'wb') as fp:
+        while True:
+            block = list(itertools.islice(rows, RUN_BLOCK_SIZE))
+            if len(block) == 0:
+                break
+            pickle.dump(block, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    return file_path
+
+
+def iter_run(file_path):
+    """ Read the rows of a run file, deleting it once it has been read completely. """
+    with open(file_path, 'rb') as fp:
+        while True:
+            try:
+                block = pickle.load(fp)
+            except EOFError:
+                break
+            for row in block:
+                yield row
+    os.remove(file_path)
+
+
+def iter_sorted_rows(rows, chunk_size=100000, temp_dir=None, fan_in=64):
+    """
+    Sort tuples with bounded memory.
+    :param rows: Iterable of tuples; tuples are compared as a whole, i.e., they should start with a unique key
+        (e.g., query, rank, and input position) so that the remaining values are not compared.
+    :param chunk_size: Maximum number of rows sorted in memory at once.
+    :param temp_dir: Directory for the temporary run files (None = system default).
+    :param fan_in: Maximum number of run files merged at once (more runs are merged in several passes).
+    :return: Generator of the sorted rows.
+    """
+    rows = iter(rows)
+    chunk = list(itertools.islice(rows, chunk_size))
+    chunk.sort()
+    if len(chunk) < chunk_size:
+        # everything fits into memory
+        for row in chunk:
+            yield row
+        return
+
+    with tempfile.TemporaryDirectory(prefix='ddg-sort-', dir=temp_dir) as directory:
+        runs = list()
+        while len(chunk) > 0:
+            runs.append(write_run(chunk, directory))
+            # release the written chunk before reading the next one
+            chunk = None
+            chunk = list(itertools.islice(rows, chunk_size))
+            chunk.sort()
+        logger.info(str(len(runs)) + " sorted runs of up to " + str(chunk_size) + " search results written.")
+
+        while len(runs) > fan_in:
+            runs = [write_run(heapq.merge(*[iter_run(run) for run in runs[i:i + fan_in]]), directory)
+                    for i in range(0, len(runs), fan_in)]
+            logger.info("Runs merged into " + str(len(runs)) + " runs.")
+        for row in heapq.merge(*[iter_run(run) for run in runs]):
+            yield row
+
+
+def to_row(search_result, position):
+    return (search_result.query, search_result.rank, position, search_result.url, search_result.title,
+            search_result.snippet, search_result.language)
+
+
+def to_search_result(row):
+    query, rank, _, url, title, snippet, language = row
+    search_result = SearchResult(query, rank, url, title, snippet)
+    search_result.language = language
+    return search_result
+
+
+def iter_sorted(search_results, chunk_size=100000, temp_dir=None, fan_in=64):
+    """
+    Sort search results by (query, rank) with bounded memory (see iter_sorted_rows); search results with the same
+    query and rank keep their input order.
+    :return: Generator of the sorted search results.
+    """
+    rows = (to_row(search_result, position) for position, search_result in enumerate(search_results))
+    for row in iter_sorted_rows(rows, chunk_size, temp_dir, fan_in):
+        yield to_search_result(row)
+
+
+def iter_deduplicated(rows):
+    """
+    Skip rows whose URL has already been listed for the same query (i.e., the best ranked one is kept).
+    :param rows: Rows (query, rank, position, url, ...) grouped by query (e.g., sorted by iter_sorted_rows).
+    """
+    query_string = None
+    urls = set()
+    for row in rows:
+        if row[0] != query_string:
+            query_string = row[0]
+            urls = set()
+        if row[3] in urls:
+            continue
+        urls.add(row[3])
+        yield row
+
+
+def iter_rows_from_readers(readers):
+    """
+    Lazily read the search results of several files one after another as rows
+    (query, rank, position, url, title, snippet, language) without creating SearchResult objects.
+    :param readers: List of tuples (file path, header, iterator over the rows) as returned by read.
+    """
+    position = itertools.count()
+    for input_file, header, rows in readers:
+        logger.info("Reading search results from " + input_file + "...")
+        query_index = header.index("query")
+        rank_index = header.index("rank")
+        url_index = header.index("url")
+        title_index = header.index("title")
+        snippet_index = header.index("snippet")
+        language_index = header.index("language") if "language" in header else None
+        for row in rows:
+            if not row:
+                raise IllegalArgumentError("Wrong CSV format.")
+            yield (row[query_index], int(row[rank_index]), next(position), row[url_index], row[title_index],
+                   row[snippet_index], row[language_index] if language_index is not None else None)
+
+
+def combine_result_files(input_files, output_dir, filename, delimiter, output_format='csv', chunk_size=100000,
+                         batch_size=1000):
+    """
+    Merge the search results of several files into one file sorted by (query, rank), skipping duplicate
+    (query, URL) pairs, without loading the files into memory.
+    :param input_files: Paths of files with exported search results (CSV, SQLite, or Parquet).
+    :param filename: Filename of the merged file (the extension is replaced according to the output format).
+    :param chunk_size: Maximum number of search results sorted in memory at once.
+    :param batch_size: Number of rows passed to the writer at once.
+    """
+    readers = list()
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            raise IllegalArgumentError("Input file " + input_file + " not found.")
+        header, rows = read(input_file, delimiter)
+        if not header:
+            raise IllegalArgumentError("Missing header in " + input_file + ".")
+        readers.append((input_file, header, rows))
+    # the language column is exported if any of the files contains it
+    include_language = any("language" in header for _, header, _ in readers)
+
+    rows = iter_deduplicated(iter_sorted_rows(iter_rows_from_readers(readers), chunk_size, output_dir))
+    SearchResultList().write(output_dir, delimiter, include_language, filename, map(to_search_result, rows),
+                             output_format, batch_size)
@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+
+from ddg.search_result import SearchResult
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+class Journal(object):
+    """
+    Append-only checkpoint file (JSON lines) recording each processed query together with its search results.
+    Used to export results incrementally and to resume interrupted runs.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.completed_query_strings = set()
+        self.failed_query_strings = set()
+        self.fp = None
+
+    def open(self, resume):
+        """
+        Open journal for appending.
+        :param resume: Keep entries of a previous run (otherwise, the journal is truncated).
+        """
+        directory = os.path.dirname(self.file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        if resume and os.path.exists(self.file_path):
+            valid_length = self._load()
+            logger.info(str(len(self.completed_query_strings)) + " processed queries found in journal "
+                        + self.file_path + ".")
+            self.fp = open(self.file_path, 'a+b')
+            # drop incomplete last entry (e.g., if the process was killed while writing)
+            self.fp.truncate(valid_length)
+        else:
+            self.fp = open(self.file_path, 'wb')
+
+    def _load(self):
+        valid_length = 0
+        with open(self.file_path, 'rb') as fp:
+            for line in fp:
+                # a last line without line break is incomplete even if it can be parsed, otherwise the next entry
+                # would be appended to it
+                if not line.endswith(b'\n'):
+                    logger.info("Ignoring incomplete journal entry.")
+                    break
+                try:
+                    entry = json.loads(line.decode('utf8'))
+                except ValueError:
+                    logger.info("Ignoring incomplete journal entry.")
+                    break
+                self.completed_query_strings.add(entry["query"])
+                if entry["failed"]:
+                    self.failed_query_strings.add(entry["query"])
+                valid_length += len(line)
+        return valid_length
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def contains(self, query):
+        return query.query_string in self.completed_query_strings
+
+    def append(self, query):
+        """ Record processed query and its search results. """
+        entry = {
+            "query": query.query_string,
+            "failed": query.has_failed,
+            "results": [result.get_column_values(True) for result in query.search_results.values]
+        }
+        self.fp.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf8'))
+        self.fp.flush()
+        self.completed_query_strings.add(query.query_string)
+        if query.has_failed:
+            self.failed_query_strings.add(query.query_string)
+
+    def iter_search_results(self):
+        """ Stream recorded search results in the order the queries have been processed. """
+        if self.fp is not None:
+            self.fp.flush()
+        with open(self.file_path, 'rb') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line.decode('utf8'))
+                except ValueError:
+                    break
+                for query, rank, language, url, title, snippet in entry["results"]:
+                    search_result = SearchResult(query, rank, url, title, snippet)
+                    search_result.language = language
+                    yield search_result
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import unicodedata
+
+from collections import OrderedDict
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+class LanguageCache(object):
+    """
+    Memo of detected snippet languages, keyed by a hash of the normalized snippet.
+    Recently used entries are kept in memory (LRU), all entries are persisted in an SQLite database
+    so that they can be reused in later runs.
+    The cache is not thread-safe; it must be used by one thread at a time (e.g., the thread collecting the search
+    results or the single-thread executor of an AsyncRetriever).
+    """
+
+    whitespace_regex = re.compile("\\s+")
+
+    def __init__(self, file_path, max_entries=100000, batch_size=1000):
+        """
+        :param file_path: Path to the SQLite database.
+        :param max_entries: Maximum number of entries kept in memory.
+        :param batch_size: Number of new entries written to the database at once.
+        """
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.entries = OrderedDict()  # least recently used first
+        self.pending = list()
+        self.hits = 0
+        self.misses = 0
+
+        # accesses are serialized by the caller, but do not need to happen in the thread that opened the cache
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS languages "
+                                "(snippet_hash TEXT PRIMARY KEY, language TEXT NOT NULL)")
+        self.connection.commit()
+
+    @staticmethod
+    def get_key(snippet):
+        normalized = LanguageCache.whitespace_regex.sub(' ', unicodedata.normalize('NFC', snippet)).strip()
+        return hashlib.sha1(normalized.encode('utf8')).hexdigest()
+
+    def get(self, snippet):
+        """
+        Get memoized language of snippet.
+        :return: Language or None if the language of the snippet has not been detected yet.
+        """
+        key = LanguageCache.get_key(snippet)
+        language = self.entries.get(key)
+
+        if language is None:
+            row = self.connection.execute("SELECT language FROM languages WHERE snippet_hash = ?",
+                                          (key,)).fetchone()
+            if row is not None:
+                language = row[0]
+                self._remember(key, language)
+        else:
+            self.entries.move_to_end(key)
+
+        if language is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return language
+
+    def put(self, snippet, language):
+        key = LanguageCache.get_key(snippet)
+        self._remember(key, language)
+        self.pending.append((key, language))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _remember(self, key, language):
+        self.entries[key] = language
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def flush(self):
+        if len(self.pending) > 0:
+            self.connection.executemany("INSERT OR REPLACE INTO languages VALUES (?, ?)", self.pending)
+            self.connection.commit()
+            self.pending = list()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def log_statistics(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total > 0 else 0
+        logger.info("Language cache: " + str(self.hits) + " hits, " + str(self.misses) + " misses ("
+                    + '{0:.2f}'.format(hit_rate) + "% hit rate).")
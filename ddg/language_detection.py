@@ -0,0 +1,108 @@
+import logging
+import os
+
+from collections import deque, OrderedDict
+from itertools import islice
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+# langdetect (and multiprocessing) are imported and the language profiles (about 0.5 s) are loaded on first use only
+
+
+def initialize():
+    """ Load language profiles and fix seed so that detected languages are deterministic. """
+    from langdetect import DetectorFactory
+    from langdetect.detector_factory import init_factory
+
+    DetectorFactory.seed = 0
+    init_factory()
+
+
+def detect_language(snippet):
+    from langdetect import detect
+    from langdetect.lang_detect_exception import LangDetectException
+
+    try:
+        return detect(snippet)
+    except LangDetectException:
+        return "error"
+
+
+def get_process_context():
+    """
+    :return: Multiprocessing context for worker processes; forked workers share the language profiles loaded by
+        this process (copy-on-write), other start methods load them in the initializer of each worker.
+    """
+    import multiprocessing
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def detect_languages(snippets):
+    return [detect_language(snippet) for snippet in snippets]
+
+
+class LanguageDetector(object):
+    """ Detects snippet languages in chunks, distributed across a pool of worker processes. """
+
+    def __init__(self, processes=None, chunk_size=1000, cache=None):
+        """
+        :param processes: Number of worker processes (None = number of CPUs).
+        :param chunk_size: Number of snippets sent to a worker process at once.
+        :param cache: Language cache; only snippets not found in the cache are sent to the worker processes.
+        """
+        self.processes = processes or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.executor = None
+
+    def __enter__(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        # load language profiles once before forking instead of in every worker process
+        initialize()
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=get_process_context(),
+                                            initializer=initialize)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.executor.shutdown()
+        self.executor = None
+
+    def iter_with_languages(self, search_results):
+        """
+        Lazily detect the snippet languages of the passed search results.
+        Only a bounded number of chunks is processed at once; search results are returned in input order.
+        """
+        search_results = iter(search_results)
+        window = deque()
+        max_pending = 2 * self.processes
+
+        while True:
+            while len(window) < max_pending:
+                chunk = list(islice(search_results, self.chunk_size))
+                if len(chunk) == 0:
+                    break
+                languages = dict()
+                if self.cache is not None:
+                    for search_result in chunk:
+                        language = self.cache.get(search_result.snippet)
+                        if language is not None:
+                            languages[search_result.snippet] = language
+                # each distinct snippet is detected only once
+                snippets = list(OrderedDict.fromkeys(
+                    search_result.snippet for search_result in chunk if search_result.snippet not in languages
+                ))
+                window.append((chunk, languages, snippets, self.executor.submit(detect_languages, snippets)))
+            if len(window) == 0:
+                break
+            chunk, languages, snippets, future = window.popleft()
+            for snippet, language in zip(snippets, future.result()):
+                languages[snippet] = language
+                if self.cache is not None:
+                    self.cache.put(snippet, language)
+            for search_result in chunk:
+                search_result.language = languages[search_result.snippet]
+                yield search_result
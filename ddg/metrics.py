@@ -0,0 +1,218 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+# names and help texts of the recorded metrics (exported with prefix ddg_retriever_)
+COUNTERS = {
+    'requests': 'Result pages requested',
+    'request_errors': 'Requests that failed with an error status code',
+    'bytes_downloaded': 'Bytes of result pages downloaded',
+    'cache_hits': 'Result pages served from the response cache',
+    'cache_misses': 'Result pages not found in the response cache',
+    'retries': 'Retries scheduled for failed attempts',
+    'queries_processed': 'Queries processed (including failed queries)',
+    'queries_failed': 'Queries that finally failed',
+    'search_results': 'Search results retrieved',
+}
+GAUGES = {
+    'queries_in_flight': 'Queries currently processed by worker threads',
+    'queries_buffered': 'Completed queries waiting for previous queries to be collected',
+    'queries_waiting_for_retry': 'Failed queries waiting for their retry',
+    'requests_per_minute': 'Current request rate of the adaptive pacing',
+}
+HISTOGRAMS = {
+    'fetch_seconds': 'Time to fetch a result page (without delays and rate limiting)',
+    'rate_limit_wait_seconds': 'Time spent waiting for the request delay or rate limiter before a request',
+    'parse_seconds': 'Time to parse a result page',
+    'language_detection_seconds': 'Time to detect the snippet languages of a query',
+}
+
+
+class Histogram(object):
+    """ Histogram with fixed (cumulative) buckets as used by Prometheus. """
+
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        self.counts = [0] * (len(Histogram.buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(Histogram.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_quantile(self, q):
+        """ Estimate quantile by linear interpolation within the bucket containing it. """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count > 0 and cumulative + count >= rank:
+                if i == len(Histogram.buckets):
+                    return Histogram.buckets[-1]
+                lower = Histogram.buckets[i - 1] if i > 0 else 0.0
+                return lower + (Histogram.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return Histogram.buckets[-1]
+
+
+class Metrics(object):
+    """ Thread-safe counters, gauges, and histograms describing the retrieval process. """
+
+    prefix = 'ddg_retriever_'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counters = {name: 0 for name in COUNTERS}
+        self.gauges = {name: 0 for name in GAUGES}
+        self.histograms = {name: Histogram() for name in HISTOGRAMS}
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        """ :param value: Duration in seconds. """
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def get_snapshot(self):
+        """ :return: Dictionary with the current values (histograms summarized by count, mean, p50, and p99). """
+        with self.lock:
+            snapshot = {
+                'time': round(time.time(), 3),
+                'uptime': round(time.time() - self.start_time, 3),
+            }
+            snapshot.update(self.counters)
+            snapshot.update(self.gauges)
+            for name, histogram in self.histograms.items():
+                snapshot[name] = {
+                    'count': histogram.count,
+                    'mean': histogram.sum / histogram.count if histogram.count > 0 else None,
+                    'p50': histogram.get_quantile(0.5),
+                    'p99': histogram.get_quantile(0.99),
+                }
+            return snapshot
+
+    def to_prometheus(self):
+        """ :return: Metrics in Prometheus' text exposition format. """
+        lines = []
+        with self.lock:
+            for name, value in self.counters.items():
+                lines.append('# HELP ' + self.prefix + name + '_total ' + COUNTERS[name])
+                lines.append('# TYPE ' + self.prefix + name + '_total counter')
+                lines.append(self.prefix + name + '_total ' + str(value))
+            for name, value in self.gauges.items():
+                lines.append('# HELP ' + self.prefix + name + ' ' + GAUGES[name])
+                lines.append('# TYPE ' + self.prefix + name + ' gauge')
+                lines.append(self.prefix + name + ' ' + str(value))
+            for name, histogram in self.histograms.items():
+                lines.append('# HELP ' + self.prefix + name + ' ' + HISTOGRAMS[name])
+                lines.append('# TYPE ' + self.prefix + name + ' histogram')
+                cumulative = 0
+                for bound, count in zip(Histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(self.prefix + name + '_bucket{le="' + str(bound) + '"} ' + str(cumulative))
+                lines.append(self.prefix + name + '_sum ' + repr(histogram.sum))
+                lines.append(self.prefix + name + '_count ' + str(histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsReporter(object):
+    """
+    Periodically appends metrics snapshots to a JSON lines file and rewrites a Prometheus text file.
+    Optionally, the metrics are served in Prometheus' format at http://127.0.0.1:<port>/metrics.
+    """
+
+    def __init__(self, metrics, interval=60, snapshot_file=None, prometheus_file=None, prometheus_port=0):
+        """
+        :param interval: Seconds between two snapshots.
+        :param snapshot_file: Path to JSON lines file snapshots are appended to.
+        :param prometheus_file: Path to text file (e.g., for node exporter's textfile collector).
+        :param prometheus_port: Local port to serve metrics at (0 = disabled).
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self.snapshot_file = snapshot_file
+        self.prometheus_file = prometheus_file
+        self.prometheus_port = prometheus_port
+        self.stopped = threading.Event()
+        self.thread = None
+        self.server = None
+
+    def start(self):
+        if self.prometheus_port > 0:
+            # http.server is only imported if metrics are served
+            from http.server import ThreadingHTTPServer
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.prometheus_port), create_request_handler())
+            self.server.daemon_threads = True
+            self.server.metrics = self.metrics
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            logger.info("Serving metrics at http://127.0.0.1:" + str(self.prometheus_port) + "/metrics")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        try:
+            if self.snapshot_file:
+                with open(self.snapshot_file, 'a', encoding='utf8') as fp:
+                    fp.write(json.dumps(self.metrics.get_snapshot()) + '\n')
+            if self.prometheus_file:
+                # replace file atomically so that readers never see a partially written file
+                temp_file = self.prometheus_file + '.tmp'
+                with open(temp_file, 'w', encoding='utf8') as fp:
+                    fp.write(self.metrics.to_prometheus())
+                os.replace(temp_file, self.prometheus_file)
+        except OSError as e:
+            logger.error('Writing metrics failed: ' + str(e))
+
+    def close(self):
+        """ Stop reporting and write a final snapshot. """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.report()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def create_request_handler():
+    """ :return: Handler class serving the metrics of the server (server.metrics) at /metrics. """
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            content = self.server.metrics.to_prometheus().encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsRequestHandler
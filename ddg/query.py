@@ -1,18 +1,18 @@
 import errno
 import logging
-import re
 import sys
 import urllib.parse
-import requests
 import time
 
-import unidecode as unidecode
-
+from ddg.query_normalizer import QueryNormalizer
 from ddg.search_result import SearchResult
 from random import randint
-from lxml import html
 
 from ddg.search_result_list import SearchResultList
+from util.rate_limiter import AdaptivePacer
+
+# requests, lxml, and the session are imported on first use, so that importing queries (e.g., to read input files
+# or to merge shards) does not load the HTTP and HTML libraries (see benchmark/import_benchmark.py)
 
 logger = logging.getLogger("ddg-retriever_logger")
 
@@ -20,138 +20,290 @@ logger = logging.getLogger("ddg-retriever_logger")
 class Query(object):
     """ A venue on DBLP. """
 
-    special_character_regex = re.compile("\\s*[()/\\\\?;:,]+\\s*")
+    special_character_regex = QueryNormalizer.special_character_regex
 
-    def __init__(self, query_string, exact_matches, remove_special_characters):
-        # transliterate unicode string into closest possible ASCII representation
-        # not doing this caused issues with queries such as "L'Hôpital's rule"
-        self.query_string = unidecode.unidecode(query_string)
-        self.is_empty = False
-        self.has_failed = False
+    # URI of Duck Duck Go's HTML search (can be replaced, e.g., by a local mock server for benchmarking)
+    search_uri = 'https://duckduckgo.com/html/'
 
-        if remove_special_characters:
-            sub_queries = list(filter(lambda q: len(q) > 0, Query.special_character_regex.split(self.query_string)))
+    # see https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Accept
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.14; rv:68.0) Gecko/20100101 Firefox/68.0",
+        "Accept": "text/html, application/xhtml+xml, application/xml;q=0.9, */*;q=0.8",
+        "Accept-Charset": "utf-8",
+        "Accept-Language": "en"
+    }
 
-            if len(sub_queries) == 0:
-                self.is_empty = True
-            else:
-                if exact_matches:
-                    self.query_string = '"' + '" "'.join(sub_queries) + '"'
-                else:
-                    self.query_string = ' '.join(sub_queries)
-        else:
-            self.query_string = str(self.query_string).strip()
-
-            if len(self.query_string) == 0:
-                self.is_empty = True
-            elif exact_matches:
-                self.query_string = '"' + self.query_string + '"'
-
-        self.uri = 'https://duckduckgo.com/html/?q=' + urllib.parse.quote(self.query_string)
-        # see https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Accept
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.14; rv:68.0) Gecko/20100101 Firefox/68.0",
-            "Accept": "text/html, application/xhtml+xml, application/xml;q=0.9, */*;q=0.8",
-            "Accept-Charset": "utf-8",
-            "Accept-Language": "en"
-        }
+    def __init__(self, query_string, exact_matches, remove_special_characters):
+        query_string, is_empty = QueryNormalizer(exact_matches, remove_special_characters).normalize(query_string)
+        self._initialize(query_string, is_empty)
+
+    @classmethod
+    def from_normalized(cls, query_string, is_empty=False):
+        """
+        Create query from a query string that has already been normalized (see QueryNormalizer).
+        """
+        query = cls.__new__(cls)
+        query._initialize(query_string, is_empty)
+        return query
 
+    def _initialize(self, query_string, is_empty):
+        self.query_string = query_string
+        self.is_empty = is_empty
+        self.has_failed = False
+        self.attempts = 0
+        self.retry_after = None
+        self.page_key = None
+        self.page_latency = None  # fetch time of the last requested (not cached) page
+        self.archived_pages = None  # (page URI, compressed content) of the current attempt (see ResponseArchive)
+        self.empty_snippets_checked = True  # whether empty snippets have been checked in the current attempt
+        self.is_stored = False  # retrieved in a previous run (see QueryStore)
+        self.uri = Query.search_uri + '?q=' + urllib.parse.quote(self.query_string)
         self.search_results = SearchResultList()
 
-        # session for data retrieval
-        self.session = requests.Session()
+    def retrieve_search_results(self, max_results, min_wait, max_wait, check_for_empty_snippets, max_retries=3,
+                                rate_limiter=None, session=None, cache=None, metrics=None, archive=None):
+        """
+        Try to retrieve the search results for this query (one attempt, see RetryScheduler for retries).
+        :param metrics: Metrics to record fetch and parse times, downloaded bytes, etc. in (optional).
+        :param archive: Response archive; the parsed result pages are compressed and kept in archived_pages
+            until the query is collected (optional).
+        :return: True if the query has been processed (or has finally failed),
+            False if the attempt failed and the query should be retried later.
+        """
+        import requests
 
-    def retrieve_search_results(self, max_results, min_wait, max_wait, wait_on_error,
-                                check_for_empty_snippets, depth=0):
         if self.is_empty:
             logger.info("Empty query skipped.")
-            return
+            return True
+
+        check_for_empty_snippets = self.start_attempt(max_retries, check_for_empty_snippets)
+        if archive is not None:
+            self.archived_pages = list()
+            self.empty_snippets_checked = check_for_empty_snippets
 
         try:
+            # result pages are requested until max_results results have been retrieved
+            page = ('get', self.uri, None)
+            while page is not None:
+                method, page_uri, parameters = page
+                content = self.retrieve_page(method, page_uri, parameters, min_wait, max_wait,
+                                             rate_limiter, session, cache, metrics)
+                if content is None:
+                    return self.handle_error(max_retries, cache)
+                if archive is not None:
+                    self.archived_pages.append((page_uri, archive.compress(content)))
+
+                is_valid, page = self.parse_page(content, page_uri, max_results, check_for_empty_snippets, metrics)
+                if rate_limiter is not None and self.page_latency is not None:
+                    # empty result pages may indicate that requests are being blocked
+                    rate_limiter.record(AdaptivePacer.OK if is_valid else AdaptivePacer.EMPTY, self.page_latency)
+                if not is_valid:
+                    return self.handle_error(max_retries, cache)
+
+            return self.finish_attempt(metrics)
+
+        except (ConnectionError, OSError, requests.exceptions.RequestException) as e:
+            if rate_limiter is not None:
+                rate_limiter.record(AdaptivePacer.ERROR)
+            return self.handle_error(max_retries, cache, e)
+
+    def start_attempt(self, max_retries, check_for_empty_snippets):
+        """ :return: Whether empty snippets are checked in this attempt. """
+        self.attempts += 1
+        self.retry_after = None
+
+        # ignore empty snippets in last attempt
+        if self.attempts > max_retries:
+            return False
+        return check_for_empty_snippets
+
+    def parse_page(self, content, page_uri, max_results, check_for_empty_snippets, metrics=None):
+        """
+        Parse a result page and add its search results (ranks continue those of previous pages).
+        :return: Tuple (is_valid, next_page); is_valid is False if a search result is empty,
+            next_page is a tuple (method, uri, parameters) or None if no further page needs to be requested.
+        """
+        from lxml import html
+        from ddg.result_parser import parse_result_items, parse_next_page
+
+        parse_start = time.perf_counter()
+        try:
+            tree = html.fromstring(content)
+            rank = len(self.search_results.values)
+            page_rank = rank
+            for url, title, snippet in parse_result_items(tree):
+                rank += 1
+
+                is_empty = len(url) == 0 or len(title) == 0
+                if check_for_empty_snippets:
+                    is_empty = is_empty or len(snippet) == 0
+
+                if is_empty:
+                    logger.info("Rank " + str(rank) + " empty for query: " + str(self))
+                    return False, None
+                else:
+                    self.search_results.values.append(SearchResult(
+                        self.query_string,
+                        rank,
+                        url,
+                        title,
+                        snippet
+                    ))
+
+                # retrieve only up to max_results results
+                if rank == max_results:
+                    break
+
+            next_page = parse_next_page(tree, page_uri)
+            if rank == max_results or rank == page_rank:
+                return True, None
+            return True, next_page
+        finally:
+            # also pages rejected because of an empty result
+            if metrics is not None:
+                metrics.observe('parse_seconds', time.perf_counter() - parse_start)
+
+    def finish_attempt(self, metrics=None):
+        """ Log outcome of a successful attempt. :return: True (query has been processed). """
+        if len(self.search_results.values) == 0:
+            logger.info("No search results retrieved for query: " + str(self))
+            self.is_empty = True
+        else:
+            logger.info('Successfully parsed result list for query: ' + str(self))
+            if metrics is not None:
+                metrics.increment('search_results', len(self.search_results.values))
+        return True
+
+    def retrieve_page(self, method, page_uri, parameters, min_wait, max_wait, rate_limiter, session, cache,
+                      metrics=None):
+        """
+        Retrieve a result page (from the cache if possible).
+        :param method: HTTP method, i.e., 'get' or 'post' (next pages are requested by submitting a form).
+        :param page_uri: URI of the result page.
+        :param parameters: List of (name, value) tuples submitted as form data or None.
+        :return: Raw content of the page or None if the request failed.
+        """
+        self.page_latency = None
+        content = self.get_cached_page(page_uri, parameters, cache, metrics)
+        if content is not None:
+            return content
+
+        wait_start = time.perf_counter()
+        if rate_limiter is not None:
+            # request budget is shared between all worker threads
+            rate_limiter.acquire()
+        else:
             # reduce request frequency as configured
             delay = randint(min_wait, max_wait)  # delay between requests in milliseconds
             time.sleep(delay / 1000)  # sleep for delay ms to prevent getting blocked
 
-            # retrieve data
-            response = self.session.get(self.uri, headers=self.headers)
-
-            if response.ok:
-                logger.info('Successfully retrieved search results for query: ' + str(self))
-
-                tree = html.fromstring(response.content)
-                items = tree.xpath('//div[@class="results"]'
-                                   '/div[contains(@class, "result")]'
-                                   '/div[contains(@class, "result__body")]')
-
-                rank = 0
-                for item in items:
-                    title = "".join(item.xpath('h2[@class="result__title"]/a[@class="result__a"]/descendant::text()'))
-                    url = "".join(item.xpath('h2[@class="result__title"]/a[@class="result__a"]/@href'))
-                    snippet = "".join(item.xpath('a[@class="result__snippet"]/descendant::text()'))
-
-                    rank += 1
-
-                    is_empty = len(url) == 0 or len(title) == 0
-                    if check_for_empty_snippets:
-                        is_empty = is_empty or len(snippet) == 0
-
-                    if is_empty:
-                        logger.info("Rank " + str(rank) + " empty for query: " + str(self))
-                        self.handle_error(max_results, min_wait, max_wait, wait_on_error,
-                                          check_for_empty_snippets, depth)
-                        return
-                    else:
-                        self.search_results.values.append(SearchResult(
-                            self.query_string,
-                            str(rank),
-                            url,
-                            title,
-                            snippet
-                        ))
-
-                    # retrieve only up to max_results results
-                    if rank == max_results:
-                        break
-
-                    if len(self.search_results.values) == 0:
-                        logger.info("No search results retrieved for query: " + str(self))
-                        self.is_empty = True
-
-                if not self.is_empty:
-                    logger.info('Successfully parsed result list for query: ' + str(self))
-            else:
-                self.handle_error(max_results, min_wait, max_wait, wait_on_error, depth)
-                return
+        # retrieve data (connections are reused across queries)
+        fetch_start = time.perf_counter()
+        if session is None:
+            from ddg.session import get_shared_session
+            session = get_shared_session()
+        if method == 'post':
+            response = session.post(page_uri, data=parameters, headers=self.headers)
+        elif parameters is not None:
+            response = session.get(page_uri, params=parameters, headers=self.headers)
+        else:
+            response = session.get(page_uri, headers=self.headers)
 
-        except (ConnectionError, OSError, requests.exceptions.RequestException) as e:
-            self.handle_error(max_results, min_wait, max_wait, wait_on_error, depth, e)
-            return
+        self.page_latency = time.perf_counter() - fetch_start
+        if metrics is not None:
+            metrics.observe('rate_limit_wait_seconds', fetch_start - wait_start)
+            metrics.observe('fetch_seconds', self.page_latency)
+
+        content = self.process_response(response.status_code, response.headers, response.content, cache, metrics)
+        if content is None and rate_limiter is not None:
+            rate_limiter.record(AdaptivePacer.THROTTLED if response.status_code in (429, 503)
+                                else AdaptivePacer.ERROR, self.page_latency)
+            self.page_latency = None
+        return content
+
+    def get_cached_page(self, page_uri, parameters, cache, metrics=None):
+        """ :return: Raw content of the cached result page or None if the page is not cached. """
+        self.page_key = page_uri
+        if parameters is not None:
+            self.page_key = page_uri + '?' + urllib.parse.urlencode(parameters)
+
+        if cache is None:
+            return None
+        content = cache.get(self.page_key)
+        if metrics is not None:
+            metrics.increment('cache_misses' if content is None else 'cache_hits')
+        if content is not None:
+            logger.info('Retrieved cached search results for query: ' + str(self))
+        return content
+
+    def process_response(self, status_code, headers, content, cache, metrics=None):
+        """
+        Check response to a result page request and cache its content.
+        :return: Raw content of the page or None if the request failed.
+        """
+        if metrics is not None:
+            metrics.increment('requests')
+            metrics.increment('bytes_downloaded', len(content))
+
+        if status_code >= 400:
+            if metrics is not None:
+                metrics.increment('request_errors')
+            logger.error('Request failed with status code ' + str(status_code)
+                         + ' for query: ' + str(self))
+            if status_code in (429, 503):
+                # server asks us to slow down
+                self.retry_after = Query.parse_retry_after(headers.get('Retry-After'))
+            return None
+
+        if cache is not None:
+            cache.put(self.page_key, content)
+        logger.info('Successfully retrieved search results for query: ' + str(self))
+        return content
+
+    def handle_error(self, max_retries, cache=None, e=None, terminate=True):
+        """
+        Reset the search results after a failed attempt and decide whether the query should be retried.
+        :param terminate: Exit on unexpected OS errors (e.g., in the CLI); otherwise, the query is marked as failed.
+        :return: False if the query should be retried, True otherwise.
+        """
+        import requests
 
-    def handle_error(self, max_results, min_wait, max_wait, wait_on_error, check_for_empty_snippets, depth=0, e=None):
         logger.error('An error occurred while retrieving result list for query: ' + str(self))
         logger.error('Resetting result list for query: ' + str(self))
         self.search_results = SearchResultList()
-        if depth <= 2 and (e is None
-                           or isinstance(e, requests.exceptions.RequestException)
-                           or (type(e) == OSError and e.errno == errno.ENETDOWN)):
-            # ignore empty snippets in last iteration
-            if depth == 2:
-                check_for_empty_snippets = False
-            logger.info('Retrying in ' + str(wait_on_error) + ' milliseconds... ')
-            time.sleep(wait_on_error / 1000)
-            self.retrieve_search_results(max_results, min_wait, max_wait, wait_on_error,
-                                         check_for_empty_snippets, depth + 1)
-            return
-        elif type(e) == OSError:
+        if cache is not None and self.page_key is not None:
+            # do not parse the same (cached) page again when retrying
+            cache.remove(self.page_key)
+        if self.attempts <= max_retries and (e is None
+                                             or isinstance(e, requests.exceptions.RequestException)
+                                             or (type(e) == OSError and e.errno == errno.ENETDOWN)):
+            return False
+        elif type(e) == OSError and terminate:
             logger.error('Terminating.')
             sys.exit(1)
-        elif not self.has_failed:
-            self.has_failed = True
-            logger.info('Stopping this query, continuing with next query...')
-            return
         else:
+            self.has_failed = True
             logger.info('Unable to retrieve search results for query: ' + str(self))
-            return
+            return True
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Parse value of Retry-After header (delay in seconds or HTTP date).
+        :return: Delay in seconds or None if value is missing or invalid.
+        """
+        if value is None:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        import email.utils
+
+        try:
+            retry_date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_date.timestamp() - time.time())
 
     def __str__(self):
         return str(self.query_string)
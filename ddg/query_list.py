@@ -1,25 +1,55 @@
 import codecs
 import csv
+import itertools
 import logging
 import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from ddg.query import Query
+from ddg.query_normalizer import QueryNormalizer
+from ddg.response_archive import iter_reparsed_queries
+from ddg.retry_scheduler import RetryScheduler
 from ddg.search_result_list import SearchResultList
 from util.exceptions import IllegalArgumentError
+from util.rate_limiter import AdaptivePacer, TokenBucket, get_requests_per_minute
 
 logger = logging.getLogger("ddg-retriever_logger")
+
+# yielded by query sources that have no query available at the moment, but may receive further queries later
+# (e.g., the daemon waiting for input), so that completed queries are collected in the meantime
+NO_QUERY = object()
 log_pace = 10
 
 
 class QueryList(object):
     """ List of search queries. """
 
+    # maximum number of queries that are processed or buffered to be collected in input order
+    max_pending_queries = 1000
+    # number of rows whose query strings are normalized at once
+    normalization_batch_size = 10000
+
     def __init__(self):
         self.filename = ""
         self.values = list()
         self.unique_query_strings = set()
         self.search_results = SearchResultList()
         self.failed_queries = list()
+        self.session = None
+        self.journal = None
+        self.cache = None
+        self.language_cache = None
+        self.query_store = None
+        self.join_stored = True
+        self.metrics = None
+        self.archive = None
+        self.profile_pool = None
+        self.ranking_diff = None  # compares refreshed queries with their stored search results (see RankingDiff)
+        self.query_handler = None  # receives each processed query instead of this list (see QueryDaemon)
+        self.processed_count = 0
+        self.total_count = None
 
     def initialize(self, filename, queries):
         self.filename = str(filename)
@@ -30,14 +60,18 @@ class QueryList(object):
         self.unique_query_strings.add(query.query_string)
         self.values.append(query)
 
-    def read_from_csv(self, input_file, exact_matches, remove_special_characters, delimiter):
+    def read_from_csv(self, input_file, exact_matches, remove_special_characters, delimiter, query_store=None,
+                      join_stored=True):
         """
         Read search queries from a CSV file (header required).
         :param remove_special_characters: Split query string along special characters
-            (see Query.special_character_regex).
+            (see QueryNormalizer.special_character_regex).
         :param exact_matches: Only search for exact matches of query strings.
         :param input_file: Path to the CSV file.
         :param delimiter: Column delimiter in CSV file (typically ',').
+        :param query_store: Store of queries retrieved in previous runs (see iter_from_reader).
+        :param join_stored: Export the stored search results of previously retrieved queries
+            (otherwise, these queries are skipped).
         """
 
         # read CSV as UTF-8 encoded file (see also http://stackoverflow.com/a/844443)
@@ -51,51 +85,334 @@ class QueryList(object):
             if not header:
                 raise IllegalArgumentError("Missing header in CSV file.")
 
-            query_string = header.index("query")
+            for query in self.iter_from_reader(reader, header, exact_matches, remove_special_characters,
+                                               query_store, join_stored):
+                self.add_query(query)
 
-            # read CSV file
-            for row in reader:
-                if row:
-                    query = Query(row[query_string], exact_matches, remove_special_characters)
+        self.filename = os.path.basename(input_file)
+        logger.info(str(len(self.values)) + " search queries have been imported.")
 
-                    if query.is_empty:
-                        # print query string if it contains not only whitespaces (but, e.g., ignored characters)
-                        if len(str(query).strip()) == 0:
-                            logger.info("Empty query skipped.")
-                        else:
-                            logger.info("Empty query skipped: " + str(query))
-                        continue
+    def iter_from_reader(self, reader, header, exact_matches, remove_special_characters, query_store=None,
+                         join_stored=True):
+        """
+        Lazily read search queries from a CSV reader, skipping empty and duplicate queries.
+        The queries are not added to this list, only their query strings are remembered for deduplication.
+        :param reader: CSV reader positioned after the header.
+        :param header: Header of the CSV file.
+        :param remove_special_characters: Split query string along special characters
+            (see QueryNormalizer.special_character_regex).
+        :param exact_matches: Only search for exact matches of query strings.
+        :param query_store: Store of queries retrieved in previous runs; stored queries are not retrieved again,
+            newly retrieved queries are added to the store.
+        :param join_stored: Export the stored search results of previously retrieved queries
+            (otherwise, these queries are skipped).
+        """
+        self.query_store = query_store
+        self.join_stored = join_stored
+        query_index = header.index("query")
+        normalizer = QueryNormalizer(exact_matches, remove_special_characters)
+
+        while True:
+            rows = list(itertools.islice(reader, self.normalization_batch_size))
+            if len(rows) == 0:
+                break
+            column = list()
+            for row in rows:
+                if not row:
+                    break
+                column.append(row[query_index])
+
+            # duplicates are skipped before any Query object is created
+            for query_string, is_empty in normalizer.normalize_batch(column):
+                if is_empty:
+                    # print query string if it contains not only whitespaces (but, e.g., ignored characters)
+                    if len(query_string.strip()) == 0:
+                        logger.info("Empty query skipped.")
+                    else:
+                        logger.info("Empty query skipped: " + query_string)
+                    continue
+
+                if query_string in self.unique_query_strings:
+                    logger.info("Duplicate query skipped: " + query_string)
+                    continue
 
-                    if query.query_string in self.unique_query_strings:
-                        logger.info("Duplicate query skipped: " + str(query))
+                self.unique_query_strings.add(query_string)
+                query = Query.from_normalized(query_string)
+
+                if query_store is not None and query_store.contains(query):
+                    if not join_stored:
+                        logger.info("Previously retrieved query skipped: " + str(query))
                         continue
+                    # stored search results are loaded when the query is processed
+                    query.is_stored = True
 
-                    self.add_query(query)
-                else:
-                    raise IllegalArgumentError("Wrong CSV format.")
+                yield query
 
-        self.filename = os.path.basename(input_file)
-        logger.info(str(len(self.values)) + " search queries have been imported.")
+            if len(column) < len(rows):
+                raise IllegalArgumentError("Wrong CSV format.")
 
     def retrieve_search_results(self, max_results, min_wait, max_wait, wait_on_error,
-                                detect_languages, check_for_empty_snippets):
-        count = 0
-        for query in self.values:
-            self.handle_query(query, count, max_results, min_wait, max_wait, wait_on_error,
-                              detect_languages, check_for_empty_snippets)
-            count = count + 1
-        # save failed queries
-        self.failed_queries = [query for query in self.values if query.has_failed]
-
-    def handle_query(self, query, count, max_results, min_wait, max_wait, wait_on_error,
-                     detect_languages, check_for_empty_snippets):
+                                detect_languages, check_for_empty_snippets, *, concurrency=1, requests_per_minute=0,
+                                pool_size=10, http2=False, journal=None, cache=None, queries=None,
+                                language_cache=None, max_wait_on_error=300000, max_retries=3, metrics=None,
+                                adaptive_pacing=False, min_requests_per_minute=6, max_requests_per_minute=600,
+                                archive=None, profiles=None):
+        """
+        Retrieve search results for all queries (optional parameters are keyword-only).
+        :param concurrency: Number of worker threads sending requests (1 = sequential retrieval).
+        :param requests_per_minute: Global request budget shared by all workers; if not positive, a single worker
+            waits randomly between min_wait and max_wait before each request, and multiple workers share a budget
+            of one request per (min_wait + max_wait) / 2 milliseconds.
+        :param pool_size: Number of keep-alive connections in the shared HTTP session.
+        :param http2: Use HTTP/2 for the shared HTTP session (requires httpx).
+        :param journal: Opened checkpoint journal; queries contained in the journal are skipped and
+            search results are written to the journal instead of being kept in memory.
+        :param cache: Response cache for raw result pages (cache hits are neither requested nor delayed).
+        :param queries: Iterable of queries to process instead of the values of this list
+            (e.g., a generator streaming them from a file, see iter_from_reader, or from a daemon, see NO_QUERY).
+        :param language_cache: Language cache to look up and store detected snippet languages.
+        :param max_wait_on_error: Maximum backoff before retrying a failed query in milliseconds
+            (the backoff starts at wait_on_error and is doubled after each failed attempt).
+        :param max_retries: Number of retries before a query is considered failed.
+        :param metrics: Metrics to record timings, retries, queue depths, etc. in (optional).
+        :param adaptive_pacing: Adapt the request rate to latencies, errors, and empty result pages (see AdaptivePacer),
+            starting at requests_per_minute (or one request per (min_wait + max_wait) / 2 milliseconds if not
+            positive).
+        :param min_requests_per_minute: Lower bound of the adaptive request rate.
+        :param max_requests_per_minute: Upper bound of the adaptive request rate.
+        :param archive: Opened response archive to record the raw result pages of each processed query in.
+        :param profiles: Request profiles (see RequestProfile) to spread the queries across; each profile has its
+            own headers, connection pool, and rate budget, replacing the shared session and rate limiter.
+        """
+        self.journal = journal
+        self.cache = cache
+        self.language_cache = language_cache
+        self.metrics = metrics
+        self.archive = archive
+        self.failed_queries = list()
+        self.processed_count = 0
+
+        if queries is None:
+            queries = self.values
+            self.total_count = len(self.values)
+        else:
+            # number of queries is unknown when streaming
+            self.total_count = None
+
+        if self.journal is not None:
+            queries = self.skip_processed(queries)
+
+        rate_limiter = None
+        if profiles:
+            from ddg.request_profile import ProfilePool
+
+            # each profile has its own session and rate budget
+            self.profile_pool = ProfilePool(profiles)
+            logger.info("Spreading queries across " + str(len(profiles)) + " request profiles...")
+        else:
+            if self.session is None:
+                from ddg.session import create_session
+
+                # one session for all queries so that connections are reused
+                self.session = create_session(max(pool_size, concurrency), http2)
+
+            if requests_per_minute <= 0 and (adaptive_pacing or concurrency > 1):
+                # the waits apply to all workers together, i.e., workers do not multiply the request rate
+                requests_per_minute = get_requests_per_minute(min_wait, max_wait)
+            if adaptive_pacing:
+                rate_limiter = AdaptivePacer(requests_per_minute, min_requests_per_minute, max_requests_per_minute,
+                                             metrics=metrics)
+                logger.info("Adaptive pacing starting at " + '{0:.1f}'.format(rate_limiter.requests_per_minute)
+                            + " requests per minute...")
+            elif requests_per_minute > 0:
+                rate_limiter = TokenBucket(requests_per_minute)
+                logger.info("Request budget of " + '{0:.1f}'.format(requests_per_minute)
+                            + " requests per minute shared by all workers...")
+
+        if concurrency > 1:
+            logger.info("Retrieving search results with " + str(concurrency) + " worker threads...")
+        retry_scheduler = RetryScheduler(wait_on_error, max_wait_on_error)
+        self.process_queries(queries, concurrency, retry_scheduler, max_results, min_wait, max_wait,
+                             detect_languages, check_for_empty_snippets, max_retries, rate_limiter)
+        logger.info(str(retry_scheduler.retry_count) + " retries have been scheduled.")
+        if self.profile_pool is not None:
+            self.profile_pool.log_statistics()
+        elif adaptive_pacing:
+            rate_limiter.log_statistics()
+
+        if self.cache is not None:
+            self.cache.log_statistics()
+        if self.language_cache is not None:
+            self.language_cache.log_statistics()
+        if self.query_store is not None:
+            self.query_store.log_statistics()
+
+    def iter_reparsed_search_results(self, archive_file, max_results, check_for_empty_snippets, processes=None):
+        """
+        Extract the search results from the raw result pages archived in a previous run (see ResponseArchive)
+        instead of requesting them again, e.g., after changing the parser or CheckForEmptySnippets.
+        Queries whose archived result pages are not valid are added to the failed queries.
+        :param processes: Number of worker processes parsing the archived pages (None = number of CPUs).
+        :return: Generator of search results in the order the queries have been archived.
+        """
+        self.failed_queries = list()
+        self.processed_count = 0
+        for query in iter_reparsed_queries(archive_file, max_results, check_for_empty_snippets, processes):
+            self.processed_count += 1
+            if query.has_failed:
+                self.failed_queries.append(query)
+            for search_result in query.search_results.values:
+                yield search_result
+        logger.info(str(self.processed_count) + " archived queries have been parsed, "
+                    + str(len(self.failed_queries)) + " of them failed.")
+
+    def skip_processed(self, queries):
+        """ Skip queries already recorded in the journal, remembering those that failed in previous runs. """
+        skipped = 0
+        for query in queries:
+            if self.journal.contains(query):
+                skipped += 1
+                self.processed_count += 1
+                if query.query_string in self.journal.failed_query_strings:
+                    query.has_failed = True
+                    self.failed_queries.append(query)
+                continue
+            if skipped > 0:
+                logger.info(str(skipped) + " queries already processed, resuming...")
+                skipped = 0
+            yield query
+
+    def process_queries(self, queries, concurrency, retry_scheduler, max_results, min_wait, max_wait,
+                        detect_languages, check_for_empty_snippets, max_retries, rate_limiter):
+        """
+        Process queries with a pool of worker threads.
+        Failed attempts are re-queued by the retry scheduler, so that other queries keep being processed
+        while a failed query waits for its retry.
+        Results are collected in input order, i.e., completed queries are buffered until all previous queries
+        have been completed (at most max_pending_queries queries are pending at once).
+        """
+        queries = iter(queries)
+        in_flight = dict()  # future -> (position, query)
+        completed = dict()  # position -> query
+        next_position = 0
+        next_collected_position = 0
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                idle = False
+                # due retries take precedence over new queries
+                while len(in_flight) < concurrency:
+                    item = retry_scheduler.pop_due()
+                    if item is None:
+                        if exhausted or next_position - next_collected_position >= self.max_pending_queries:
+                            break
+                        query = next(queries, None)
+                        if query is None:
+                            exhausted = True
+                            break
+                        if query is NO_QUERY:
+                            # the query source has already waited for new queries
+                            idle = True
+                            break
+                        item = (next_position, query)
+                        next_position += 1
+                        if query.is_stored:
+                            logger.info("Previously retrieved search results loaded for query: " + str(query))
+                            query.search_results.values = self.query_store.get_search_results(query.query_string)
+                            completed[item[0]] = query
+                            continue
+                    attempt_rate_limiter, session = rate_limiter, self.session
+                    if self.profile_pool is not None:
+                        # all result pages of an attempt are requested with the same profile
+                        profile = self.profile_pool.select()
+                        item[1].headers = profile.headers
+                        attempt_rate_limiter, session = profile, profile.session
+                    future = executor.submit(item[1].retrieve_search_results, max_results, min_wait, max_wait,
+                                             check_for_empty_snippets, max_retries=max_retries,
+                                             rate_limiter=attempt_rate_limiter, session=session, cache=self.cache,
+                                             metrics=self.metrics, archive=self.archive)
+                    in_flight[future] = item
+
+                # collect after submitting new queries, so that workers are busy while results are collected
+                while next_collected_position in completed:
+                    self.collect_results(completed.pop(next_collected_position), detect_languages)
+                    next_collected_position += 1
+
+                if len(in_flight) == 0:
+                    if len(retry_scheduler) == 0:
+                        if exhausted:
+                            break
+                        # only previously retrieved queries have been read (or none are available), continue reading
+                        continue
+                    if not idle:
+                        # only retries left, wait until the next one is due
+                        time.sleep(retry_scheduler.get_time_until_due())
+                    continue
+
+                # an idle query source waits for new queries instead, so that they are submitted without delay
+                timeout = 0 if idle else retry_scheduler.get_time_until_due()
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, query = in_flight.pop(future)
+                    if future.result():
+                        completed[position] = query
+                    else:
+                        retry_scheduler.schedule(query, (position, query))
+                        if self.metrics is not None:
+                            self.metrics.increment('retries')
+
+                if self.metrics is not None:
+                    self.metrics.set('queries_in_flight', len(in_flight))
+                    self.metrics.set('queries_buffered', len(completed))
+                    self.metrics.set('queries_waiting_for_retry', len(retry_scheduler))
+
+    def collect_results(self, query, detect_languages):
+        # languages are detected here (not in worker threads), because the language cache is not thread-safe
+        if detect_languages and not (query.is_stored and all(result.language is not None
+                                                             for result in query.search_results.values)):
+            detection_start = time.perf_counter()
+            query.search_results.detect_languages(cache=self.language_cache)
+            if self.metrics is not None:
+                self.metrics.observe('language_detection_seconds', time.perf_counter() - detection_start)
+
+        count = self.processed_count
         if count == 0 or count % log_pace == 0:
-            logger.info('{0:.2f}'.format(count / len(self.values) * 100) + '% of the queries have been processed.')
-
-        query.retrieve_search_results(max_results, min_wait, max_wait, wait_on_error, check_for_empty_snippets)
-
-        if detect_languages:
-            query.search_results.detect_languages()
+            if self.total_count:
+                logger.info('{0:.2f}'.format(count / self.total_count * 100)
+                            + '% of the queries have been processed.')
+            else:
+                logger.info(str(count) + ' queries have been processed.')
+        self.processed_count += 1
+
+        if query.has_failed and self.query_handler is None:
+            self.failed_queries.append(query)
+        if self.ranking_diff is not None and not query.is_stored and not query.has_failed and not query.is_empty:
+            # compare with the stored search results before they are replaced
+            self.ranking_diff.add(query, self.query_store.get_search_results(query.query_string)
+                                  if self.query_store is not None else [])
+        if self.query_store is not None and not query.is_stored and not query.has_failed and not query.is_empty:
+            self.query_store.put(query)
+        if self.archive is not None:
+            # queries loaded from the query store are archived with their stored search results;
+            # archived before the journal entry is written, so that no query is missing from the archive after a
+            # resume (a query archived twice is reparsed from its last entry)
+            self.archive.append(query)
+            query.archived_pages = None
+        if self.metrics is not None:
+            self.metrics.increment('queries_processed')
+            if query.has_failed:
+                self.metrics.increment('queries_failed')
+
+        if self.journal is not None or self.query_handler is not None or self.ranking_diff is not None:
+            # checkpoint query and/or pass it on (e.g., to the daemon writing its results), then release its results
+            # (when comparing rankings, only the changes are exported)
+            if self.journal is not None:
+                self.journal.append(query)
+            if self.query_handler is not None:
+                self.query_handler(query)
+            query.search_results = SearchResultList()
+            return
 
         for search_result in query.search_results.values:
             self.search_results.values.append(search_result)
@@ -107,7 +424,22 @@ class QueryList(object):
         :param output_dir: Target directory for generated CSV file.
         :param delimiter: Column delimiter in CSV file (typically ',').
         """
-        self.search_results.write_to_csv(output_dir, delimiter, include_language, self.filename)
+        self.write_search_results(output_dir, delimiter, include_language, 'csv')
+
+    def write_search_results(self, output_dir, delimiter, include_language, output_format='csv'):
+        """
+        Export search results to a file.
+        :param include_language: Add column "language" if tool was configured to detect languages of snippets
+        :param output_dir: Target directory for generated file.
+        :param delimiter: Column delimiter in CSV file (typically ',').
+        :param output_format: One of ddg.result_formats.FORMATS (csv, sqlite, parquet).
+        """
+        if self.journal is not None:
+            # stream search results from journal instead of keeping them in memory
+            self.search_results.write(output_dir, delimiter, include_language, self.filename,
+                                      self.journal.iter_search_results(), output_format)
+        else:
+            self.search_results.write(output_dir, delimiter, include_language, self.filename, None, output_format)
 
     def get_rows(self):
         rows = []
@@ -147,7 +479,7 @@ class QueryList(object):
 
             count = 0
             try:
-                for row in self.get_rows():
+                for row in (query.get_column_values() for query in self.values):
                     if len(row) == len(column_names):
                         writer.writerow(row)
                         count = count + 1
@@ -161,12 +493,12 @@ class QueryList(object):
 
             logger.info(str(count) + ' queries have been exported.')
 
-    def write_failed_queries(self, output_dir, delimiter):
+    def write_failed_queries(self, output_dir, delimiter, filename="failed_queries.csv"):
         if len(self.failed_queries) == 0:
             logger.info("No failed queries to write.")
             return
 
         logger.info("Writing failed queries...")
         failed_queries = QueryList()
-        failed_queries.initialize("failed_queries.csv", self.failed_queries)
+        failed_queries.initialize(filename, self.failed_queries)
         failed_queries.write_to_csv(output_dir, delimiter)
@@ -0,0 +1,68 @@
+import functools
+import re
+
+import unidecode as unidecode
+
+
+class QueryNormalizer(object):
+    """
+    Normalizes raw query strings from input files (transliteration, special characters, exact matches)
+    in batches, so that duplicates can be skipped before Query objects are created.
+    Raw query strings and transliterated tokens are memoized, as both recur frequently in large input files.
+    """
+
+    special_character_regex = re.compile("\\s*[()/\\\\?;:,]+\\s*")
+    whitespace_regex = re.compile("(\\s+)")
+
+    def __init__(self, exact_matches, remove_special_characters, max_cached_tokens=100000,
+                 max_cached_queries=100000):
+        """
+        :param exact_matches: Only search for exact matches of query strings.
+        :param remove_special_characters: Split query string along special characters
+            (see QueryNormalizer.special_character_regex).
+        :param max_cached_tokens: Maximum number of memoized transliterated tokens.
+        :param max_cached_queries: Maximum number of memoized normalized raw query strings.
+        """
+        self.exact_matches = exact_matches
+        self.remove_special_characters = remove_special_characters
+        self.transliterate_token = functools.lru_cache(maxsize=max_cached_tokens)(unidecode.unidecode)
+        self.normalize_cached = functools.lru_cache(maxsize=max_cached_queries)(self.normalize)
+
+    def transliterate(self, text):
+        """ Transliterate unicode string into closest possible ASCII representation. """
+        if text.isascii():
+            return text
+        # unidecode transliterates character by character, i.e., tokens can be transliterated independently
+        return ''.join(token if token.isascii() else self.transliterate_token(token)
+                       for token in QueryNormalizer.whitespace_regex.split(text))
+
+    def normalize(self, raw_query_string):
+        """
+        :return: Tuple (normalized query string, is empty); for empty queries, the transliterated string is returned.
+        """
+        # not transliterating caused issues with queries such as "L'Hôpital's rule"
+        query_string = self.transliterate(raw_query_string)
+
+        if self.remove_special_characters:
+            sub_queries = [q for q in QueryNormalizer.special_character_regex.split(query_string) if len(q) > 0]
+
+            if len(sub_queries) == 0:
+                return query_string, True
+            if self.exact_matches:
+                return '"' + '" "'.join(sub_queries) + '"', False
+            return ' '.join(sub_queries), False
+
+        query_string = query_string.strip()
+        if len(query_string) == 0:
+            return query_string, True
+        if self.exact_matches:
+            return '"' + query_string + '"', False
+        return query_string, False
+
+    def normalize_batch(self, raw_query_strings):
+        """
+        Normalize a column of raw query strings.
+        :return: List of (normalized query string, is empty) tuples in the order of the raw query strings.
+        """
+        # recurring raw query strings are normalized once
+        return [self.normalize_cached(raw_query_string) for raw_query_string in raw_query_strings]
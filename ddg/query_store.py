@@ -0,0 +1,141 @@
+import itertools
+import logging
+import os
+import sqlite3
+import time
+
+from ddg.search_result import SearchResult
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+def get_rows(search_results):
+    """
+    :return: List of rows (query, rank, url, title, snippet, language) with one search result per rank;
+        of search results sharing a rank (e.g., in merged result files), the first one is kept.
+    """
+    rows = list()
+    ranks = set()
+    for result in search_results:
+        if result.rank in ranks:
+            continue
+        ranks.add(result.rank)
+        rows.append((result.query, result.rank, result.url, result.title, result.snippet, result.language))
+    return rows
+
+
+class QueryStore(object):
+    """
+    Persistent index of retrieved queries (keyed by the normalized query string) and their search results,
+    stored in an SQLite database so that repeated runs over overlapping input files only retrieve new queries.
+    Failed queries are not stored, i.e., they are retried in later runs.
+    The store is not thread-safe; it is meant to be used by the thread collecting the search results.
+    """
+
+    def __init__(self, file_path, max_age=0, batch_size=100):
+        """
+        :param file_path: Path to the SQLite database.
+        :param max_age: Maximum age of stored queries in seconds; older queries are retrieved again (0 = no limit).
+        :param batch_size: Number of queries written to the database at once.
+        """
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.file_path = file_path
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.pending = dict()  # query string -> (fetch time, rows of search results), not yet written
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+        self.connection = sqlite3.connect(file_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS queries "
+                                "(query TEXT PRIMARY KEY, fetch_time REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS queries_fetch_time ON queries (fetch_time)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS search_results "
+                                "(query TEXT NOT NULL, rank INTEGER NOT NULL, url TEXT, title TEXT, snippet TEXT, "
+                                "language TEXT, PRIMARY KEY (query, rank))")
+        self.connection.commit()
+        count = self.connection.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+        logger.info(str(count) + " retrieved queries found in query store " + file_path + ".")
+
+    def get_fetch_time(self, query_string):
+        """ :return: Time (seconds since the epoch) the query has been retrieved or None if it is not stored. """
+        if query_string in self.pending:
+            return self.pending[query_string][0]
+        row = self.connection.execute("SELECT fetch_time FROM queries WHERE query = ?", (query_string,)).fetchone()
+        return None if row is None else row[0]
+
+    def contains(self, query):
+        """ :return: True if the query has been retrieved and is not older than max_age. """
+        fetch_time = self.get_fetch_time(query.query_string)
+        found = fetch_time is not None and (self.max_age <= 0 or time.time() - fetch_time <= self.max_age)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def get_search_results(self, query_string):
+        """ :return: List of the stored search results of the query (ordered by rank). """
+        if query_string in self.pending:
+            rows = sorted(row[1:] for row in self.pending[query_string][1])
+        else:
+            rows = self.connection.execute(
+                "SELECT rank, url, title, snippet, language FROM search_results WHERE query = ? ORDER BY rank",
+                (query_string,))
+        search_results = list()
+        for rank, url, title, snippet, language in rows:
+            search_result = SearchResult(query_string, rank, url, title, snippet)
+            search_result.language = language
+            search_results.append(search_result)
+        return search_results
+
+    def put(self, query):
+        """ Store retrieved query and its search results (replacing a previous retrieval). """
+        self.pending[query.query_string] = (time.time(), get_rows(query.search_results.values))
+        self.stored += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def import_search_results(self, search_results, fetch_time):
+        """
+        Store previously exported search results (e.g., the output file of an earlier run) as retrieved at fetch_time.
+        Queries that are already stored are kept.
+        :param search_results: Iterable of search results grouped by query (as exported by this tool).
+        :return: Number of imported queries.
+        """
+        imported = set()
+        for query_string, group in itertools.groupby(search_results, key=lambda result: result.query):
+            if query_string in imported or self.get_fetch_time(query_string) is not None:
+                continue
+            imported.add(query_string)
+            self.pending[query_string] = (fetch_time, get_rows(group))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+        self.flush()
+        logger.info(str(len(imported)) + " queries have been imported into query store " + self.file_path + ".")
+        return len(imported)
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+        with self.connection:
+            self.connection.executemany("DELETE FROM search_results WHERE query = ?",
+                                        [(query_string,) for query_string in self.pending])
+            self.connection.executemany("INSERT OR REPLACE INTO queries VALUES (?, ?)",
+                                        [(query_string, fetch_time)
+                                         for query_string, (fetch_time, _) in self.pending.items()])
+            self.connection.executemany("INSERT INTO search_results VALUES (?, ?, ?, ?, ?, ?)",
+                                        [row for _, rows in self.pending.values() for row in rows])
+        self.pending = dict()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def log_statistics(self):
+        logger.info("Query store: " + str(self.hits) + " queries found, " + str(self.misses) + " queries not found, "
+                    + str(self.stored) + " queries stored.")
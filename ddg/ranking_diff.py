@@ -0,0 +1,95 @@
+""" Comparison of refreshed search results with a previous retrieval of the same query (see the refresh command). """
+
+import logging
+import os
+
+from ddg.result_formats import create_writer, get_filename
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+NEW = 'new'
+DROPPED = 'dropped'
+MOVED = 'moved'
+
+
+def get_ranks(search_results):
+    """ :return: Dict url -> rank (the best rank of URLs listed more than once). """
+    ranks = dict()
+    # reversed, so that the first (best) rank of a URL is kept
+    for search_result in reversed(search_results):
+        ranks[search_result.url] = search_result.rank
+    return ranks
+
+
+def diff_rankings(previous_results, current_results):
+    """
+    Compare two result lists of a query by URL.
+    :return: List of tuples (change, url, rank, previous rank, title) for new, dropped, and moved URLs,
+        ordered by current rank (dropped URLs by previous rank, after the current ones); rank or previous rank
+        is None for dropped and new URLs, respectively.
+    """
+    previous_ranks = get_ranks(previous_results)
+    current_ranks = get_ranks(current_results)
+    changes = list()
+    for search_result in current_results:
+        if current_ranks[search_result.url] != search_result.rank:
+            # duplicate URL
+            continue
+        previous_rank = previous_ranks.get(search_result.url)
+        if previous_rank is None:
+            changes.append((NEW, search_result.url, search_result.rank, None, search_result.title))
+        elif previous_rank != search_result.rank:
+            changes.append((MOVED, search_result.url, search_result.rank, previous_rank, search_result.title))
+    for search_result in previous_results:
+        if search_result.url not in current_ranks and previous_ranks[search_result.url] == search_result.rank:
+            changes.append((DROPPED, search_result.url, None, search_result.rank, search_result.title))
+    return changes
+
+
+class RankingDiff(object):
+    """
+    Writes the changes between the refreshed and the previous search results of each query to a file
+    (<OUTPUT-DIR>/<INPUT-FILE-NAME>.changes.csv or the configured output format), omitting unchanged URLs.
+    """
+
+    column_names = ['query', 'change', 'url', 'rank', 'previous_rank', 'title']
+
+    def __init__(self, output_dir, filename, output_format='csv', delimiter=',', batch_size=1000):
+        """
+        :param filename: Name of the input file; the output file is named <name>.changes.<extension>.
+        :param batch_size: Number of rows passed to the writer at once.
+        """
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        name, extension = os.path.splitext(filename)
+        self.file_path = os.path.join(output_dir, get_filename(name + '.changes' + extension, output_format))
+        self.writer = create_writer(output_format, self.file_path, RankingDiff.column_names, delimiter)
+        self.batch_size = batch_size
+        self.rows = list()
+        self.query_count = 0
+        self.changed_query_count = 0
+        self.counts = {NEW: 0, DROPPED: 0, MOVED: 0}
+        logger.info('Exporting ranking changes to ' + self.file_path + '...')
+
+    def add(self, query, previous_results):
+        """ Compare the search results of a refreshed query with its previous search results. """
+        changes = diff_rankings(previous_results, query.search_results.values)
+        self.query_count += 1
+        if len(changes) > 0:
+            self.changed_query_count += 1
+        for change, url, rank, previous_rank, title in changes:
+            self.counts[change] += 1
+            self.rows.append([query.query_string, change, url, rank, previous_rank, title])
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.writer.write_rows(self.rows)
+        self.rows = list()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        logger.info(str(self.query_count) + " refreshed queries compared, " + str(self.changed_query_count)
+                    + " of them changed: " + str(self.counts[NEW]) + " new, " + str(self.counts[DROPPED])
+                    + " dropped, " + str(self.counts[MOVED]) + " moved URLs.")
@@ -0,0 +1,170 @@
+import itertools
+import logging
+import threading
+import time
+
+from ddg.query import Query
+from ddg.session import create_session
+from util.exceptions import IllegalConfigurationError
+from util.rate_limiter import AdaptivePacer, TokenBucket, get_requests_per_minute
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+# prefix of configuration sections defining request profiles, e.g., [Profile firefox]
+SECTION_PREFIX = 'Profile '
+
+
+class RequestProfile(object):
+    """
+    Request fingerprint (User-Agent, Accept, and Accept-Language headers) with its own connection pool,
+    optional outbound proxy or source address, and rate budget.
+    A profile whose requests fail, are throttled, or return empty result pages is backed off,
+    i.e., it is not selected for new queries until its backoff has expired.
+    """
+
+    # number of consecutive errors or empty result pages after which a profile is backed off
+    # (throttling responses back off a profile right away)
+    max_consecutive_failures = 2
+
+    def __init__(self, name, headers, rate_limiter, proxy=None, source_address=None, pool_size=10, http2=False,
+                 backoff=30000, max_backoff=300000):
+        """
+        :param name: Name of the profile used in log messages.
+        :param headers: Request headers sent with each request of this profile.
+        :param rate_limiter: Rate budget of this profile (TokenBucket or AdaptivePacer).
+        :param proxy: URI of an outbound proxy (e.g., http://proxy:3128) or None.
+        :param source_address: Local IP address to send requests from or None.
+        :param backoff: Backoff of a failing profile in milliseconds (doubled for each consecutive backoff).
+        :param max_backoff: Maximum backoff in milliseconds.
+        """
+        self.name = name
+        self.headers = headers
+        self.rate_limiter = rate_limiter
+        self.session = create_session(pool_size, http2, proxy, source_address)
+        self.backoff = backoff
+        self.max_backoff = max(backoff, max_backoff)
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.backoff_count = 0  # consecutive backoffs (reset by a successful request)
+        self.backoff_until = 0.0
+        self.request_count = 0
+        self.failure_count = 0
+        self.total_backoff_count = 0
+
+    @classmethod
+    def from_config(cls, section, min_wait, max_wait, adaptive_pacing, min_requests_per_minute,
+                    max_requests_per_minute, pool_size=10, http2=False, backoff=30000, max_backoff=300000):
+        """
+        Create profile from a configuration section (keys not set in the section are taken from DEFAULT).
+        Without RequestsPerMinute, the rate budget of the profile corresponds to one request per
+        (MinWait + MaxWait) / 2 milliseconds.
+        """
+        name = section.name[len(SECTION_PREFIX):].strip()
+        headers = dict(Query.headers)
+        headers["User-Agent"] = section.get('UserAgent', headers["User-Agent"])
+        headers["Accept"] = section.get('Accept', headers["Accept"])
+        headers["Accept-Language"] = section.get('AcceptLanguage', headers["Accept-Language"])
+
+        requests_per_minute = section.getfloat('RequestsPerMinute', 0)
+        if requests_per_minute <= 0:
+            requests_per_minute = get_requests_per_minute(min_wait, max_wait)
+        if adaptive_pacing:
+            rate_limiter = AdaptivePacer(requests_per_minute, min_requests_per_minute, max_requests_per_minute)
+        else:
+            rate_limiter = TokenBucket(requests_per_minute)
+
+        return cls(name, headers, rate_limiter, section.get('Proxy', '') or None,
+                   section.get('SourceAddress', '') or None, pool_size, http2, backoff, max_backoff)
+
+    def is_available(self, now):
+        return self.backoff_until <= now
+
+    def acquire(self):
+        """ Wait until the backoff of this profile has expired and a request fits into its rate budget. """
+        delay = self.backoff_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return self.rate_limiter.acquire()
+
+    def record(self, outcome, latency=None):
+        """ Feedback about a request of this profile (see TokenBucket.record). """
+        self.rate_limiter.record(outcome, latency)
+        with self.lock:
+            self.request_count += 1
+            if outcome == AdaptivePacer.OK:
+                self.consecutive_failures = 0
+                self.backoff_count = 0
+                return
+
+            self.failure_count += 1
+            self.consecutive_failures += 1
+            if outcome != AdaptivePacer.THROTTLED \
+                    and self.consecutive_failures < RequestProfile.max_consecutive_failures:
+                return
+            now = time.monotonic()
+            if not self.is_available(now):
+                # failures of requests sent before the profile was backed off
+                return
+            delay = min(self.max_backoff, self.backoff * 2 ** self.backoff_count)
+            self.backoff_count += 1
+            self.total_backoff_count += 1
+            self.consecutive_failures = 0
+            self.backoff_until = now + delay / 1000
+            logger.info("Backing off profile " + self.name + " for " + '{0:.0f}'.format(delay)
+                        + " milliseconds (" + outcome + " response).")
+
+    def log_statistics(self):
+        logger.info("Profile " + self.name + ": " + str(self.request_count) + " requests, "
+                    + str(self.failure_count) + " failed or empty, " + str(self.total_backoff_count) + " backoffs.")
+        if isinstance(self.rate_limiter, AdaptivePacer):
+            self.rate_limiter.log_statistics()
+
+    def close(self):
+        self.session.close()
+
+
+class ProfilePool(object):
+    """ Spreads queries across request profiles in turn, skipping profiles that are backed off. """
+
+    def __init__(self, profiles):
+        if len(profiles) == 0:
+            raise IllegalConfigurationError("At least one request profile is required.")
+        self.profiles = profiles
+        self.turn = itertools.cycle(range(len(profiles)))
+        self.lock = threading.Lock()
+
+    def select(self):
+        """ :return: Next available profile or, if all profiles are backed off, the one available first. """
+        now = time.monotonic()
+        with self.lock:
+            for _ in range(len(self.profiles)):
+                profile = self.profiles[next(self.turn)]
+                if profile.is_available(now):
+                    return profile
+        return min(self.profiles, key=lambda p: p.backoff_until)
+
+    def log_statistics(self):
+        for profile in self.profiles:
+            profile.log_statistics()
+
+    def close(self):
+        for profile in self.profiles:
+            profile.close()
+
+
+def read_profiles(config, min_wait, max_wait, adaptive_pacing, min_requests_per_minute, max_requests_per_minute,
+                  pool_size=10, http2=False, backoff=30000, max_backoff=300000):
+    """
+    Read request profiles from the sections [Profile <name>] of a configuration.
+    :return: List of profiles (empty if no profile is configured).
+    """
+    profiles = []
+    for section_name in config.sections():
+        if section_name.startswith(SECTION_PREFIX):
+            profile = RequestProfile.from_config(config[section_name], min_wait, max_wait, adaptive_pacing,
+                                                 min_requests_per_minute, max_requests_per_minute, pool_size,
+                                                 http2, backoff, max_backoff)
+            logger.info("Request profile " + profile.name + " with a budget of "
+                        + '{0:.1f}'.format(profile.rate_limiter.rate * 60) + " requests per minute.")
+            profiles.append(profile)
+    return profiles
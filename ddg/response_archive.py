@@ -0,0 +1,211 @@
+import gzip
+import json
+import logging
+import os
+
+from collections import deque
+from itertools import islice
+
+from ddg.query import Query
+from ddg.search_result import SearchResult
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+class ResponseArchive(object):
+    """
+    Append-only archive of the raw result pages of a run (one file per input file, each page gzip-compressed),
+    from which the search results can be extracted again without re-querying Duck Duck Go (see iter_reparsed_queries).
+    Each processed query is stored as a JSON header line (query string, failed flag, whether empty snippets have been
+    checked, URIs and compressed sizes of the result pages parsed in its final attempt), directly followed by the
+    compressed pages. Queries loaded from the QueryStore have no result pages; their stored search results are
+    recorded in the header line instead. A query is archived again if a resumed run processes it again (i.e., if the
+    process has been killed after archiving it, but before writing its journal entry); the last entry is reparsed.
+    """
+
+    def __init__(self, file_path, compression_level=6):
+        self.file_path = file_path
+        self.compression_level = compression_level
+        self.query_count = 0
+        self.fp = None
+
+    def open(self, resume):
+        """
+        Open archive for appending.
+        :param resume: Keep entries of a previous run (otherwise, the archive is truncated).
+        """
+        directory = os.path.dirname(self.file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        if resume and os.path.exists(self.file_path):
+            valid_length = 0
+            for _, _, _, _, _, end in iter_entries(self.file_path):
+                valid_length = end
+                self.query_count += 1
+            logger.info(str(self.query_count) + " archived queries found in " + self.file_path + ".")
+            self.fp = open(self.file_path, 'a+b')
+            # drop incomplete last entry (e.g., if the process was killed while writing)
+            self.fp.truncate(valid_length)
+        else:
+            self.fp = open(self.file_path, 'wb')
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+            logger.info(str(self.query_count) + " queries have been archived in " + self.file_path + ".")
+
+    def compress(self, content):
+        """ Compress a raw result page (called by worker threads, zlib releases the GIL). """
+        return gzip.compress(content, compresslevel=self.compression_level)
+
+    def append(self, query):
+        """
+        Record processed query and the compressed result pages of its final attempt (see Query.archived_pages)
+        or, if it has been loaded from the QueryStore, its stored search results.
+        """
+        pages = query.archived_pages or []
+        entry = {
+            "query": query.query_string,
+            "failed": query.has_failed,
+            "checked": query.empty_snippets_checked,
+            "pages": [[page_uri, len(compressed)] for page_uri, compressed in pages]
+        }
+        if query.is_stored:
+            entry["results"] = [result.get_column_values(True) for result in query.search_results.values]
+        self.fp.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf8'))
+        for _, compressed in pages:
+            self.fp.write(compressed)
+        self.fp.flush()
+        self.query_count += 1
+
+
+def iter_entries(file_path):
+    """
+    Read the headers of the archived queries, skipping the page contents.
+    :return: Generator of tuples (query string, failed, empty snippets checked,
+        list of (page URI, offset, compressed size), stored search results or None, end offset),
+        stopping at an incomplete last entry.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as fp:
+        while True:
+            line = fp.readline()
+            if len(line) == 0:
+                break
+            # a header line without line break is incomplete even if it can be parsed (see Journal)
+            if not line.endswith(b'\n'):
+                logger.info("Ignoring incomplete archive entry.")
+                break
+            try:
+                entry = json.loads(line.decode('utf8'))
+            except ValueError:
+                logger.info("Ignoring incomplete archive entry.")
+                break
+            offset = fp.tell()
+            pages = []
+            for page_uri, size in entry["pages"]:
+                pages.append((page_uri, offset, size))
+                offset += size
+            if offset > file_size:
+                logger.info("Ignoring incomplete archive entry.")
+                break
+            fp.seek(offset)
+            yield entry["query"], entry["failed"], entry["checked"], pages, entry.get("results"), offset
+
+
+def iter_latest_entries(file_path):
+    """
+    Read the headers of the archived queries (see iter_entries), skipping entries that are superseded by a later entry
+    of the same query.
+    """
+    last_entries = dict()
+    for query_string, _, _, _, _, end in iter_entries(file_path):
+        last_entries[query_string] = end
+    for entry in iter_entries(file_path):
+        query_string, _, _, _, _, end = entry
+        if last_entries[query_string] == end:
+            yield entry
+
+
+def reparse_entries(file_path, entries, max_results, check_for_empty_snippets):
+    """
+    Extract the search results from archived result pages (executed by worker processes).
+    :param entries: List of tuples as returned by iter_entries.
+    :return: List of queries with their search results; queries whose pages are not valid (e.g., empty snippets)
+        and failed queries whose archived pages do not suffice are marked as failed.
+        Queries loaded from the QueryStore keep their stored search results (up to max_results).
+    """
+    queries = []
+    with open(file_path, 'rb') as fp:
+        for query_string, failed, checked, pages, results, _ in entries:
+            query = Query.from_normalized(query_string)
+            if results is not None:
+                query.is_stored = True
+                for _, rank, language, url, title, snippet in results[:max_results]:
+                    search_result = SearchResult(query_string, rank, url, title, snippet)
+                    search_result.language = language
+                    query.search_results.values.append(search_result)
+                queries.append(query)
+                continue
+            query.attempts = 1
+            next_page = None
+            for page_uri, offset, size in pages:
+                fp.seek(offset)
+                content = gzip.decompress(fp.read(size))
+                # empty snippets accepted in the final attempt of a query remain accepted
+                is_valid, next_page = query.parse_page(content, page_uri, max_results,
+                                                       check_for_empty_snippets and checked)
+                if not is_valid:
+                    logger.info("Archived result page not valid for query: " + str(query))
+                    query.has_failed = True
+                    break
+                if next_page is None:
+                    break
+
+            if len(pages) == 0:
+                query.has_failed = failed
+                if not failed:
+                    query.is_empty = True
+            elif next_page is not None and failed:
+                # final attempt failed after the archived pages (e.g., error while requesting the next page)
+                query.has_failed = True
+            if query.has_failed:
+                query.search_results.values = []
+            elif len(pages) > 0:
+                if next_page is not None:
+                    logger.info("Archive contains fewer result pages than needed for query: " + str(query))
+                query.finish_attempt()
+            queries.append(query)
+    return queries
+
+
+def iter_reparsed_queries(file_path, max_results, check_for_empty_snippets, processes=None, chunk_size=100):
+    """
+    Extract the search results of all archived queries again, distributing chunks of queries across
+    a pool of worker processes.
+    :param processes: Number of worker processes (None = number of CPUs).
+    :param chunk_size: Number of queries sent to a worker process at once.
+    :return: Generator of queries (with search results) in the order they have been archived
+        (queries archived more than once are extracted from their last entry).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    processes = processes or os.cpu_count()
+    entries = iter_latest_entries(file_path)
+    window = deque()
+    max_pending = 2 * processes
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        while True:
+            while len(window) < max_pending:
+                chunk = list(islice(entries, chunk_size))
+                if len(chunk) == 0:
+                    break
+                window.append(executor.submit(reparse_entries, file_path, chunk, max_results,
+                                              check_for_empty_snippets))
+            if len(window) == 0:
+                break
+            for query in window.popleft().result():
+                yield query
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+import urllib.parse
+import zlib
+
+from collections import OrderedDict
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+class ResponseCache(object):
+    """
+    Persistent on-disk cache for raw (gzip-compressed) result pages, keyed by the normalized query URI.
+    Entries expire after a configurable time to live; if the cache exceeds its size limit,
+    the least recently used entries are evicted.
+    The fetch time of an entry is stored as modification time, its last access as access time of the file.
+    """
+
+    def __init__(self, directory, ttl, max_bytes):
+        """
+        :param directory: Directory to store cached pages in.
+        :param ttl: Time to live of cache entries in seconds.
+        :param max_bytes: Maximum size of all (compressed) cache entries in bytes.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.gz'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, filename))
+                except OSError:
+                    # removed in the meantime
+                    continue
+                entries.append((stat.st_atime, filename[:-3], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self.entries[key] = size
+            self.size += size
+
+        logger.info(str(len(self.entries)) + " cached result pages found in " + self.directory + ".")
+
+    @staticmethod
+    def normalize_uri(uri):
+        """ Normalize URI so that equivalent URIs map to the same key (e.g., parameter order, scheme case). """
+        parts = urllib.parse.urlsplit(uri)
+        query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+        path = parts.path if parts.path.endswith('/') else parts.path + '/'
+        return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ''))
+
+    @staticmethod
+    def get_key(uri):
+        return hashlib.sha256(ResponseCache.normalize_uri(uri).encode('utf8')).hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key + '.gz')
+
+    def get(self, uri):
+        """
+        Get cached page for URI.
+        :return: Raw page content or None if the page is not cached or has expired.
+        """
+        key = ResponseCache.get_key(uri)
+        path = self._get_path(key)
+        with self.lock:
+            if key in self.entries:
+                try:
+                    stat = os.stat(path)
+                    if time.time() - stat.st_mtime <= self.ttl:
+                        with open(path, 'rb') as fp:
+                            content = gzip.decompress(fp.read())
+                        # update last access, keep fetch time
+                        os.utime(path, (time.time(), stat.st_mtime))
+                        self.entries.move_to_end(key)
+                        self.hits += 1
+                        return content
+                except (OSError, EOFError, zlib.error) as e:
+                    # e.g., deleted by another process, truncated, or corrupted, the page is requested again
+                    logger.warning("Ignoring unreadable cache entry " + path + ": " + str(e))
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, uri, content):
+        """ Store raw page content for URI and evict least recently used entries if necessary. """
+        key = ResponseCache.get_key(uri)
+        path = self._get_path(key)
+        compressed = gzip.compress(content)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            with open(path + '.tmp', 'wb') as fp:
+                fp.write(compressed)
+            os.replace(path + '.tmp', path)
+            self.entries[key] = len(compressed)
+            self.size += len(compressed)
+
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)))
+
+    def remove(self, uri):
+        with self.lock:
+            key = ResponseCache.get_key(uri)
+            if key in self.entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key)
+        try:
+            os.remove(self._get_path(key))
+        except OSError:
+            pass
+
+    def log_statistics(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total > 0 else 0
+        logger.info("Response cache: " + str(self.hits) + " hits, " + str(self.misses) + " misses ("
+                    + '{0:.2f}'.format(hit_rate) + "% hit rate), " + str(len(self.entries)) + " entries, "
+                    + str(self.size) + " bytes.")
@@ -0,0 +1,188 @@
+"""
+Output formats for search results: CSV, SQLite, and Parquet (requires the optional package pyarrow).
+Writers receive rows in batches; readers return the header and an iterator over the rows,
+which can be passed to SearchResultList.iter_from_reader.
+"""
+
+import csv
+import logging
+import os
+import sqlite3
+
+from util.exceptions import IllegalConfigurationError
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+FORMATS = ('csv', 'sqlite', 'parquet')
+# columns written as integers (all other columns are strings)
+INTEGER_COLUMNS = ('rank', 'previous_rank')
+EXTENSIONS = {
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite',
+    '.db': 'sqlite',
+    '.parquet': 'parquet',
+}
+
+
+def get_format(file_path):
+    """ :return: Format of the file derived from its extension (CSV if the extension is unknown). """
+    return EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), 'csv')
+
+
+def get_filename(filename, output_format):
+    """ :return: Filename with the extension of the output format (e.g., queries.sqlite for queries.csv). """
+    if get_format(filename) == output_format:
+        return filename
+    return os.path.splitext(filename)[0] + '.' + output_format
+
+
+def check_format(output_format):
+    if output_format not in FORMATS:
+        raise IllegalConfigurationError("Unknown output format " + output_format + " (supported formats: "
+                                        + ", ".join(FORMATS) + ").")
+    if output_format == 'parquet':
+        try:
+            import pyarrow
+        except ImportError:
+            raise IllegalConfigurationError("Parquet files require the optional package pyarrow.")
+
+
+def create_writer(output_format, file_path, column_names, delimiter=','):
+    if output_format == 'sqlite':
+        return SqliteWriter(file_path, column_names)
+    if output_format == 'parquet':
+        return ParquetWriter(file_path, column_names)
+    return CsvWriter(file_path, column_names, delimiter)
+
+
+def read(file_path, delimiter=','):
+    """
+    Read the rows of a file in any of the supported formats (derived from the extension).
+    :return: Tuple (header, iterator over the rows); the iterator closes the file once it is exhausted.
+    """
+    input_format = get_format(file_path)
+    if input_format == 'sqlite':
+        return read_sqlite(file_path)
+    if input_format == 'parquet':
+        return read_parquet(file_path)
+    return read_csv(file_path, delimiter)
+
+
+class CsvWriter(object):
+    """ Writes rows to a UTF-8 encoded CSV file. """
+
+    def __init__(self, file_path, column_names, delimiter):
+        # newline='' as csv.writer terminates rows itself (\r\n as with the previously used codecs.open)
+        self.fp = open(file_path, 'w', encoding='utf8', newline='', buffering=2 ** 20)
+        self.writer = csv.writer(self.fp, delimiter=delimiter)
+        self.writer.writerow(column_names)
+
+    def write_rows(self, rows):
+        """ :return: Number of rows written (rows that cannot be encoded are skipped). """
+        count = 0
+        for row in rows:
+            try:
+                self.writer.writerow(row)
+                count += 1
+            except UnicodeEncodeError:
+                logger.error('Encoding error while writing data for: ' + str(row))
+        return count
+
+    def close(self):
+        self.fp.close()
+
+
+class SqliteWriter(object):
+    """ Writes rows to table search_results of a new SQLite database (bulk inserts, one transaction per batch). """
+
+    def __init__(self, file_path, column_names):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self.connection = sqlite3.connect(file_path)
+        self.connection.execute('CREATE TABLE search_results ('
+                                + ', '.join(name + (' INTEGER' if name in INTEGER_COLUMNS else ' TEXT')
+                                            for name in column_names) + ')')
+        self.statement = 'INSERT INTO search_results VALUES (' + ', '.join('?' for _ in column_names) + ')'
+
+    def write_rows(self, rows):
+        with self.connection:
+            self.connection.executemany(self.statement, rows)
+        return len(rows)
+
+    def close(self):
+        self.connection.execute('CREATE INDEX search_results_query ON search_results (query, rank)')
+        self.connection.commit()
+        self.connection.close()
+
+
+class ParquetWriter(object):
+    """ Writes rows to a Parquet file (one row group per batch). """
+
+    def __init__(self, file_path, column_names):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, pyarrow.int64() if name in INTEGER_COLUMNS else pyarrow.string())
+                                      for name in column_names])
+        self.writer = pyarrow.parquet.ParquetWriter(file_path, self.schema)
+
+    def write_rows(self, rows):
+        if len(rows) == 0:
+            return 0
+        columns = [list(column) for column in zip(*rows)]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema))
+        return len(rows)
+
+    def close(self):
+        self.writer.close()
+
+
+def read_csv(file_path, delimiter):
+    fp = open(file_path, encoding='utf8', newline='')
+    reader = csv.reader(fp, delimiter=delimiter)
+    header = next(reader, None)
+
+    def iter_rows():
+        try:
+            for row in reader:
+                yield row
+        finally:
+            fp.close()
+
+    return header, iter_rows()
+
+
+def read_sqlite(file_path):
+    connection = sqlite3.connect(file_path)
+    cursor = connection.execute('SELECT * FROM search_results ORDER BY rowid')
+    header = [column[0] for column in cursor.description]
+
+    def iter_rows():
+        try:
+            while True:
+                rows = cursor.fetchmany(1000)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            connection.close()
+
+    return header, iter_rows()
+
+
+def read_parquet(file_path):
+    import pyarrow.parquet
+
+    parquet_file = pyarrow.parquet.ParquetFile(file_path)
+    header = parquet_file.schema_arrow.names
+
+    def iter_rows():
+        for batch in parquet_file.iter_batches():
+            for row in zip(*(column.to_pylist() for column in batch.columns)):
+                yield row
+
+    return header, iter_rows()
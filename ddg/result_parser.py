@@ -0,0 +1,43 @@
+""" Parser for Duck Duck Go's HTML result pages. """
+
+import urllib.parse
+
+from lxml import etree
+
+# XPath expressions are compiled once instead of for every result page and result item
+result_items = etree.XPath('//div[@class="results"]'
+                           '/div[contains(@class, "result")]'
+                           '/div[contains(@class, "result__body")]')
+title_links = etree.XPath('h2[@class="result__title"]/a[@class="result__a"]')
+snippet_links = etree.XPath('a[@class="result__snippet"]')
+next_page_forms = etree.XPath('//div[contains(@class, "nav-link")]/form[input[@type="submit"][@value="Next"]]')
+form_inputs = etree.XPath('input[@name]')
+
+
+def parse_result_items(tree):
+    """
+    Lazily parse the result items of a result page, i.e., callers can stop after the first max_results items.
+    :param tree: Parsed result page (see lxml.html.fromstring).
+    :return: Generator of (url, title, snippet) tuples in the order of the results on the page.
+    """
+    for item in result_items(tree):
+        links = title_links(item)
+        title = "".join(link.text_content() for link in links)
+        url = "".join(link.get('href', '') for link in links)
+        snippet = "".join(link.text_content() for link in snippet_links(item))
+        yield url, title, snippet
+
+
+def parse_next_page(tree, base_uri):
+    """
+    Parse the form requesting the next result page (Duck Duck Go passes, e.g., offset s, dc, and vqd token).
+    :param tree: Parsed result page (see lxml.html.fromstring).
+    :param base_uri: URI of the result page, used to resolve the form action.
+    :return: Tuple (method, uri, parameters) or None if there is no next page.
+    """
+    forms = next_page_forms(tree)
+    if len(forms) == 0:
+        return None
+    form = forms[0]
+    parameters = [(field.get('name'), field.get('value', '')) for field in form_inputs(form)]
+    return form.get('method', 'get').lower(), urllib.parse.urljoin(base_uri, form.get('action', '')), parameters
@@ -0,0 +1,60 @@
+import heapq
+import itertools
+import logging
+import random
+import time
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+class RetryScheduler(object):
+    """
+    Schedules failed queries for a later retry using exponential backoff with jitter.
+    Delays requested by the server (Retry-After) take precedence over the computed backoff.
+    Instead of blocking, queries wait in a queue until they are due again.
+    """
+
+    def __init__(self, wait_on_error, max_wait_on_error):
+        """
+        :param wait_on_error: Backoff before the first retry in milliseconds.
+        :param max_wait_on_error: Maximum backoff in milliseconds.
+        """
+        self.wait_on_error = wait_on_error
+        self.max_wait_on_error = max(wait_on_error, max_wait_on_error)
+        self.delayed = list()  # heap of (due time, sequence number, item)
+        self.sequence = itertools.count()
+        self.retry_count = 0
+
+    def get_delay(self, query):
+        """ Delay in seconds before the next attempt for the passed query. """
+        if query.retry_after is not None:
+            return query.retry_after
+        backoff = min(self.max_wait_on_error, self.wait_on_error * 2 ** max(0, query.attempts - 1))
+        # jitter prevents retries of concurrently failed queries from being sent at the same time
+        return random.uniform(backoff / 2, backoff) / 1000
+
+    def schedule(self, query, item):
+        """
+        Schedule retry.
+        :param query: Failed query.
+        :param item: Item returned by pop_due once the query is due (e.g., the query and its position).
+        """
+        delay = self.get_delay(query)
+        self.retry_count += 1
+        logger.info('Retrying in ' + '{0:.0f}'.format(delay * 1000) + ' milliseconds: ' + str(query))
+        heapq.heappush(self.delayed, (time.monotonic() + delay, next(self.sequence), item))
+
+    def pop_due(self):
+        """ :return: Item of a query whose retry is due or None. """
+        if len(self.delayed) > 0 and self.delayed[0][0] <= time.monotonic():
+            return heapq.heappop(self.delayed)[2]
+        return None
+
+    def get_time_until_due(self):
+        """ :return: Seconds until the next retry is due or None if no retries are scheduled. """
+        if len(self.delayed) == 0:
+            return None
+        return max(0.0, self.delayed[0][0] - time.monotonic())
+
+    def __len__(self):
+        return len(self.delayed)
@@ -1,4 +1,5 @@
 import logging
+import sys
 
 logger = logging.getLogger("ddg-retriever_logger")
 
@@ -6,9 +7,13 @@ logger = logging.getLogger("ddg-retriever_logger")
 class SearchResult(object):
     """ Search result retrieved from Duck Duck Go. """
 
+    # no per-instance __dict__, as millions of search results may be loaded at once
+    __slots__ = ['query', 'rank', 'url', 'title', 'snippet', 'language']
+
     def __init__(self, query, rank, url, title, snippet):
-        self.query = query
-        self.rank = rank
+        # query strings are shared by all search results retrieved for the same query
+        self.query = sys.intern(query)
+        self.rank = int(rank)
         self.url = url
         self.title = title
         self.snippet = snippet
@@ -3,11 +3,10 @@ import csv
 import logging
 import os
 
-from langdetect.lang_detect_exception import LangDetectException
-
+from ddg.result_formats import create_writer, get_filename, read
+from ddg.language_detection import LanguageDetector, initialize, detect_language
 from ddg.search_result import SearchResult
 from util.exceptions import IllegalArgumentError
-from langdetect import detect, DetectorFactory
 
 logger = logging.getLogger("ddg-retriever_logger")
 
@@ -43,81 +42,147 @@ class SearchResultList(object):
             if not header:
                 raise IllegalArgumentError("Missing header in CSV file.")
 
-            query_index = header.index("query")
-            rank_index = header.index("rank")
-            url_index = header.index("url")
-            title_index = header.index("title")
-            snippet_index = header.index("snippet")
-
-            # read CSV file
-            for row in reader:
-                if row:
-                    self.values.append(
-                        SearchResult(row[query_index], row[rank_index],
-                                     row[url_index], row[title_index], row[snippet_index])
-                    )
-                else:
-                    raise IllegalArgumentError("Wrong CSV format.")
+            self.values.extend(SearchResultList.iter_from_reader(reader, header))
 
         self.filename = os.path.basename(input_file)
         logger.info(str(len(self.values)) + " search results have been imported.")
 
-    def detect_languages(self):
+    @staticmethod
+    def iter_from_file(input_file, delimiter):
+        """
+        Lazily read search results from a CSV, SQLite, or Parquet file (format derived from the extension).
+        :param input_file: Path to the file.
+        :param delimiter: Column delimiter in CSV file (typically ',').
+        """
+        header, rows = read(input_file, delimiter)
+        if not header:
+            raise IllegalArgumentError("Missing header in " + input_file + ".")
+        return SearchResultList.iter_from_reader(rows, header)
+
+    @staticmethod
+    def iter_from_reader(reader, header):
+        """
+        Lazily read search results from a CSV reader.
+        :param reader: CSV reader positioned after the header.
+        :param header: Header of the CSV file.
+        """
+        query_index = header.index("query")
+        rank_index = header.index("rank")
+        url_index = header.index("url")
+        title_index = header.index("title")
+        snippet_index = header.index("snippet")
+        language_index = header.index("language") if "language" in header else None
+
+        for row in reader:
+            if row:
+                search_result = SearchResult(row[query_index], row[rank_index],
+                                             row[url_index], row[title_index], row[snippet_index])
+                if language_index is not None:
+                    search_result.language = row[language_index]
+                yield search_result
+            else:
+                raise IllegalArgumentError("Wrong CSV format.")
+
+    def detect_languages(self, processes=1, chunk_size=1000, cache=None):
+        """
+        Detect the snippet languages of all search results.
+        :param processes: Number of worker processes (1 = detect languages in this process).
+        :param chunk_size: Number of snippets sent to a worker process at once.
+        :param cache: Language cache to look up and store detected languages.
+        """
         if len(self.values) == 0:
             return
 
         logger.info("Detecting snippet languages...")
-        DetectorFactory.seed = 0
 
-        for search_result in self.values:
-            try:
-                search_result.language = detect(search_result.snippet)
-            except LangDetectException:
-                search_result.language = "error"
+        for _ in SearchResultList.iter_with_languages(self.values, processes, chunk_size, cache):
+            pass
+
+    @staticmethod
+    def iter_with_languages(search_results, processes=1, chunk_size=1000, cache=None):
+        """
+        Lazily detect the snippet languages of the passed search results.
+        :param processes: Number of worker processes (1 = detect languages in this process).
+        :param chunk_size: Number of snippets sent to a worker process at once.
+        :param cache: Language cache to look up and store detected languages.
+        """
+        if processes > 1:
+            with LanguageDetector(processes, chunk_size, cache) as language_detector:
+                for search_result in language_detector.iter_with_languages(search_results):
+                    yield search_result
+            return
 
-    def write_to_csv(self, output_dir, delimiter, include_language, filename=None):
+        initialize()
+        for search_result in search_results:
+            language = None
+            if cache is not None:
+                language = cache.get(search_result.snippet)
+            if language is None:
+                language = detect_language(search_result.snippet)
+                if cache is not None:
+                    cache.put(search_result.snippet, language)
+            search_result.language = language
+            yield search_result
+
+    def write_to_csv(self, output_dir, delimiter, include_language, filename=None, search_results=None):
         """
         Export search results to a CSV file.
         :param output_dir: Target directory for generated CSV file.
         :param delimiter: Column delimiter in CSV file (typically ',').
         :param include_language: Add column "language" if tool was configured to detect languages of snippets.
         :param filename: Filename of file to export.
+        :param search_results: Iterable of search results to export instead of the values of this list
+            (e.g., a generator streaming them from a file).
+        """
+        self.write(output_dir, delimiter, include_language, filename, search_results, 'csv')
+
+    def write(self, output_dir, delimiter, include_language, filename=None, search_results=None, output_format='csv',
+              batch_size=1000):
+        """
+        Export search results to a file.
+        :param output_dir: Target directory for generated file.
+        :param delimiter: Column delimiter in CSV file (typically ',').
+        :param include_language: Add column "language" if tool was configured to detect languages of snippets.
+        :param filename: Filename of file to export (the extension is replaced according to the output format).
+        :param search_results: Iterable of search results to export instead of the values of this list
+            (e.g., a generator streaming them from a file).
+        :param output_format: One of ddg.result_formats.FORMATS (csv, sqlite, parquet).
+        :param batch_size: Number of rows passed to the writer at once.
         """
 
         if filename is not None:
             self.filename = filename
 
-        if len(self.values) == 0:
-            logger.info("Nothing to export.")
-            return
+        if search_results is None:
+            if len(self.values) == 0:
+                logger.info("Nothing to export.")
+                return
+            search_results = self.values
 
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        file_path = os.path.join(output_dir, self.filename)
-
-        # write search results to UTF8-encoded CSV file (see also http://stackoverflow.com/a/844443)
-        with codecs.open(file_path, 'w', encoding='utf8') as fp:
-            logger.info('Exporting search results to ' + file_path + '...')
-            writer = csv.writer(fp, delimiter=delimiter)
-
-            column_names = SearchResult.get_column_names(include_language)
-
-            # write header of CSV file
-            writer.writerow(column_names)
-
-            count = 0
-            try:
-                for row in self.get_rows(include_language):
-                    if len(row) == len(column_names):
-                        writer.writerow(row)
-                        count = count + 1
-                    else:
-                        raise IllegalArgumentError(
-                            str(abs(len(column_names) - len(row))) + ' parameter(s) is/are missing for "'
-                            + str(row) + '"')
-
-            except UnicodeEncodeError:
-                logger.error('Encoding error while writing data for: ' + str(row))
-
-            logger.info(str(count) + ' search results have been exported.')
+        file_path = os.path.join(output_dir, get_filename(self.filename, output_format))
+        column_names = SearchResult.get_column_names(include_language)
+
+        logger.info('Exporting search results to ' + file_path + '...')
+        writer = create_writer(output_format, file_path, column_names, delimiter)
+        count = 0
+        try:
+            batch = list()
+            # rows are generated while writing instead of being materialized (see get_rows)
+            for result in search_results:
+                row = result.get_column_values(include_language)
+                if len(row) != len(column_names):
+                    raise IllegalArgumentError(
+                        str(abs(len(column_names) - len(row))) + ' parameter(s) is/are missing for "'
+                        + str(row) + '"')
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    count += writer.write_rows(batch)
+                    batch = list()
+            count += writer.write_rows(batch)
+        finally:
+            writer.close()
+
+        logger.info(str(count) + ' search results have been exported.')
@@ -0,0 +1,101 @@
+import logging
+import threading
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def create_session(pool_size=10, http2=False, proxy=None, source_address=None):
+    """
+    Create an HTTP session that keeps connections alive and can be shared between queries (and threads).
+    :param pool_size: Number of connections kept alive per host.
+    :param http2: Use HTTP/2 if the optional httpx package (with h2) is installed.
+    :param proxy: URI of an outbound proxy for all requests of the session (optional).
+    :param source_address: Local IP address to bind outgoing connections to (optional).
+    """
+    if http2:
+        try:
+            import httpx
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            return Http2Session(httpx.Client(transport=httpx.HTTPTransport(
+                http2=True, limits=limits, proxy=proxy, local_address=source_address
+            )))
+        except ImportError:
+            logger.warning("HTTP/2 requires httpx[http2], falling back to HTTP/1.1...")
+
+    session = requests.Session()
+    adapter = SourceAddressAdapter(source_address, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if proxy is not None:
+        session.proxies = {'http': proxy, 'https': proxy}
+    return session
+
+
+class SourceAddressAdapter(HTTPAdapter):
+    """ Adapter binding outgoing connections to a local IP address (e.g., one of several egress addresses). """
+
+    def __init__(self, source_address=None, **kwargs):
+        self.source_address = source_address
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.source_address is not None:
+            kwargs['source_address'] = (self.source_address, 0)
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        if self.source_address is not None:
+            kwargs['source_address'] = (self.source_address, 0)
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+def get_shared_session():
+    """ Session used by queries if no session has been injected. """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+class Http2Session(object):
+    """ Wrapper exposing an httpx client through the subset of the requests.Session API used by Query. """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, uri, params=None, headers=None, timeout=None):
+        return self.request('GET', uri, params=params, headers=headers, timeout=timeout)
+
+    def post(self, uri, data=None, headers=None, timeout=None):
+        return self.request('POST', uri, data=data, headers=headers, timeout=timeout)
+
+    def request(self, method, uri, params=None, data=None, headers=None, timeout=None):
+        """ :param timeout: Timeout in seconds (None = timeout of the client; httpx disables it for None). """
+        import httpx
+        if timeout is None:
+            timeout = httpx.USE_CLIENT_DEFAULT
+        try:
+            response = self.client.request(method, uri, params=params, data=dict(data) if data else None,
+                                           headers=headers, timeout=timeout)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e)
+
+        # convert response so that callers can rely on requests' interface (ok, content, headers, ...)
+        converted = requests.models.Response()
+        converted.status_code = response.status_code
+        converted.headers = requests.structures.CaseInsensitiveDict(response.headers)
+        converted.url = str(response.url)
+        converted.encoding = response.encoding
+        converted._content = response.content
+        return converted
+
+    def close(self):
+        self.client.close()
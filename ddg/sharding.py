@@ -0,0 +1,121 @@
+""" Deterministic partitioning of queries into shards that can be retrieved independently and merged afterwards. """
+
+import codecs
+import csv
+import logging
+import os
+import zlib
+
+from ddg.result_formats import get_filename, read
+from ddg.search_result_list import SearchResultList
+from util.exceptions import IllegalArgumentError
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+def parse_shard(value):
+    """
+    Parse shard specification.
+    :param value: String "i/N" with 1 <= i <= N.
+    :return: Tuple (i, N).
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise IllegalArgumentError("Shard must be specified as i/N (e.g., 1/4): " + value)
+    if count < 1 or index < 1 or index > count:
+        raise IllegalArgumentError("Shard index must be between 1 and " + str(count) + ": " + value)
+    return index, count
+
+
+def get_shard(query_string, shard_count):
+    """ :return: Shard (1, ..., shard_count) of the passed (normalized) query string, independent of the process. """
+    # crc32 instead of hash(), which is salted differently in each process
+    return zlib.crc32(query_string.encode('utf8')) % shard_count + 1
+
+
+def get_shard_filename(filename, shard_index, shard_count):
+    """ :return: Filename with shard suffix, e.g., queries.shard-1-of-4.csv for queries.csv. """
+    name, extension = os.path.splitext(filename)
+    return name + '.shard-' + str(shard_index) + '-of-' + str(shard_count) + extension
+
+
+def filter_shard(queries, shard_index, shard_count):
+    """ Lazily filter queries belonging to the passed shard. """
+    for query in queries:
+        if get_shard(query.query_string, shard_count) == shard_index:
+            yield query
+
+
+def merge_shards(query_list, queries, output_dir, delimiter, shard_count, output_format='csv'):
+    """
+    Merge the search results and failed queries exported by all shards into the output files of an unsharded run.
+    :param query_list: Query list the failed queries are collected in.
+    :param queries: Iterable of the deduplicated queries of the input file (in input order).
+    :param shard_count: Number of shards.
+    :param output_format: Format of the shard outputs and the merged output (see ddg.result_formats).
+    """
+    shard_results = dict()
+    failed_query_strings = set()
+    include_language = False
+    for shard_index in range(1, shard_count + 1):
+        file_path = os.path.join(output_dir, get_filename(
+            get_shard_filename(query_list.filename, shard_index, shard_count), output_format))
+        if not os.path.exists(file_path):
+            raise IllegalArgumentError("Missing output of shard " + str(shard_index) + "/" + str(shard_count)
+                                       + ": " + file_path)
+        header, rows = read(file_path, delimiter)
+        include_language = include_language or "language" in header
+        shard_results[shard_index] = SearchResultList.iter_from_reader(rows, header)
+        failed_query_strings.update(read_failed_query_strings(os.path.join(
+            output_dir, get_shard_filename("failed_queries.csv", shard_index, shard_count)), delimiter))
+
+    def collect_failed(all_queries):
+        for query in all_queries:
+            if query.query_string in failed_query_strings:
+                query.has_failed = True
+                query_list.failed_queries.append(query)
+            yield query
+
+    logger.info("Merging search results of " + str(shard_count) + " shards...")
+    query_list.search_results.write(output_dir, delimiter, include_language, query_list.filename,
+                                    iter_merged_search_results(collect_failed(queries), shard_results, shard_count),
+                                    output_format)
+    query_list.write_failed_queries(output_dir, delimiter)
+
+
+def iter_merged_search_results(queries, shard_results, shard_count):
+    """
+    Merge the search results of all shards in the order of the queries.
+    Each shard exports its search results in input order, i.e., the shards are interleaved
+    without loading them into memory.
+    :param queries: Deduplicated queries in input order.
+    :param shard_results: Dictionary shard index -> iterator over the search results of the shard.
+    :param shard_count: Number of shards.
+    """
+    pending = dict()  # shard index -> first search result of the shard not merged yet
+    for query in queries:
+        shard_index = get_shard(query.query_string, shard_count)
+        results = shard_results[shard_index]
+        search_result = pending.pop(shard_index, None)
+        if search_result is None:
+            search_result = next(results, None)
+        # queries without search results (empty or failed) have no rows in the shard output
+        while search_result is not None and search_result.query == query.query_string:
+            yield search_result
+            search_result = next(results, None)
+        if search_result is not None:
+            pending[shard_index] = search_result
+
+    for shard_index, search_result in pending.items():
+        logger.error("Search results of shard " + str(shard_index) + " do not match input file, e.g., for query: "
+                     + str(search_result.query))
+
+
+def read_failed_query_strings(file_path, delimiter):
+    if not os.path.exists(file_path):
+        return set()
+    with codecs.open(file_path, encoding='utf8') as fp:
+        reader = csv.reader(fp, delimiter=delimiter)
+        next(reader, None)
+        return set(row[0] for row in reader if row)
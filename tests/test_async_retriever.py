@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import unittest
+import urllib.parse
+
+from benchmark.parser_benchmark import load_fixtures
+from ddg.query import Query
+from ddg.search_result import SearchResult
+
+try:
+    import httpx
+    from ddg.async_retriever import AsyncRetriever
+except ImportError:
+    httpx = None
+
+
+class LanguageCache(object):
+    """ Language cache that records the threads it is accessed in. """
+
+    def __init__(self, languages):
+        self.languages = dict(languages)
+        self.threads = set()
+
+    def get(self, snippet):
+        self.threads.add(threading.current_thread())
+        return self.languages.get(snippet)
+
+    def put(self, snippet, language):
+        self.threads.add(threading.current_thread())
+        self.languages[snippet] = language
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class AsyncRetrieverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.page = load_fixtures()[0]
+        self.requests = list()
+        self.responses = list()
+
+    def handle(self, request):
+        """ Answer requests with the queued responses (exceptions are raised), then with the result page. """
+        self.requests.append((request, time.monotonic()))
+        if len(self.responses) > 0:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return httpx.Response(200, content=self.page)
+
+    def search(self, query_string, max_results=10, **kwargs):
+        async def search():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+            async with AsyncRetriever(max_results=max_results, min_wait=0, max_wait=0, client=client,
+                                      **kwargs) as retriever:
+                return await retriever.retrieve(Query(query_string, True, True))
+
+        return asyncio.run(search())
+
+    def test_pagination(self):
+        query = self.search('SQL injection', max_results=40)
+        self.assertFalse(query.has_failed)
+        self.assertEqual([result.rank for result in query.search_results.values], list(range(1, 41)))
+        self.assertEqual([request.method for request, _ in self.requests], ['GET', 'POST'])
+        form = urllib.parse.parse_qs(self.requests[1][0].content.decode('utf8'))
+        self.assertEqual(form['s'], ['30'])
+
+    def test_retry_after_is_respected(self):
+        self.responses.append(httpx.Response(429, headers={'Retry-After': '1'}))
+        query = self.search('SQL injection', wait_on_error=10)
+        self.assertFalse(query.has_failed)
+        self.assertEqual(len(query.search_results.values), 10)
+        self.assertEqual(len(self.requests), 2)
+        self.assertGreaterEqual(self.requests[1][1] - self.requests[0][1], 0.99)
+
+    def test_retries_with_backoff_until_max_retries(self):
+        self.responses.extend(httpx.Response(500) for _ in range(3))
+        query = self.search('SQL injection', wait_on_error=10, max_retries=2)
+        self.assertTrue(query.has_failed)
+        self.assertEqual(len(query.search_results.values), 0)
+        self.assertEqual(len(self.requests), 3)
+        # first backoff between wait_on_error / 2 and wait_on_error, then doubled
+        self.assertGreaterEqual(self.requests[1][1] - self.requests[0][1], 0.005)
+        self.assertGreaterEqual(self.requests[2][1] - self.requests[1][1], 0.01)
+
+    def test_transport_errors_are_retried(self):
+        self.responses.append(httpx.ConnectError("connection refused"))
+        query = self.search('SQL injection', wait_on_error=10)
+        self.assertFalse(query.has_failed)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_os_error_marks_query_as_failed(self):
+        # terminate=False: the process keeps running
+        self.responses.append(OSError("disk full"))
+        query = self.search('SQL injection', wait_on_error=10)
+        self.assertTrue(query.has_failed)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_language_cache_is_accessed_outside_the_event_loop(self):
+        snippets = ['cached snippet', 'This is an English sentence about software testing and retrieval.']
+        search_results = [SearchResult('"q"', rank, 'https://example.org/' + str(rank), 'Title', snippet)
+                          for rank, snippet in enumerate(snippets, start=1)]
+        language_cache = LanguageCache({'cached snippet': 'de'})
+
+        async def detect():
+            async with AsyncRetriever(client=httpx.AsyncClient()) as retriever:
+                await retriever.detect_languages(search_results, language_cache)
+
+        asyncio.run(detect())
+        self.assertEqual([result.language for result in search_results], ['de', 'en'])
+        self.assertEqual(language_cache.languages[snippets[1]], 'en')
+        self.assertNotIn(threading.main_thread(), language_cache.threads)
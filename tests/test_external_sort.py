@@ -0,0 +1,65 @@
+import os
+import random
+import tempfile
+import unittest
+
+from ddg.external_sort import combine_result_files, iter_deduplicated, iter_sorted, iter_sorted_rows
+from ddg.search_result import SearchResult
+from ddg.search_result_list import SearchResultList
+
+
+class ExternalSortTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        generator = random.Random(0)
+        # unique rows with recurring first values
+        self.rows = [(generator.randrange(100), i) for i in range(1000)]
+        generator.shuffle(self.rows)
+
+    def assert_no_temporary_files(self):
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_sort_in_memory(self):
+        self.assertEqual(list(iter_sorted_rows(self.rows, 1000, self.directory.name)), sorted(self.rows))
+        self.assertEqual(list(iter_sorted_rows([], 10, self.directory.name)), [])
+
+    def test_sort_runs(self):
+        for chunk_size in [1, 7, 999]:
+            self.assertEqual(list(iter_sorted_rows(self.rows, chunk_size, self.directory.name)), sorted(self.rows))
+            self.assert_no_temporary_files()
+
+    def test_merge_in_several_passes(self):
+        # 100 runs merged 3 at a time
+        self.assertEqual(list(iter_sorted_rows(self.rows, 10, self.directory.name, fan_in=3)), sorted(self.rows))
+        self.assert_no_temporary_files()
+
+    def test_sort_search_results_stable(self):
+        search_results = [SearchResult('"b"', 2, 'u1', 't', 's'), SearchResult('"a"', 10, 'u2', 't', 's'),
+                          SearchResult('"b"', 1, 'u3', 't', 's'), SearchResult('"a"', 2, 'u4', 't', 's'),
+                          SearchResult('"b"', 1, 'u5', 't', 's')]
+        search_results[0].language = 'en'
+        sorted_results = list(iter_sorted(search_results, 2, self.directory.name))
+        # ranks are compared as numbers, search results with the same query and rank keep their order
+        self.assertEqual([(r.query, r.rank, r.url) for r in sorted_results],
+                         [('"a"', 2, 'u4'), ('"a"', 10, 'u2'), ('"b"', 1, 'u3'), ('"b"', 1, 'u5'), ('"b"', 2, 'u1')])
+        self.assertEqual(sorted_results[-1].language, 'en')
+
+    def test_deduplicate_per_query(self):
+        rows = [('"a"', 1, 0, 'u1'), ('"a"', 2, 1, 'u2'), ('"a"', 3, 2, 'u1'), ('"b"', 1, 3, 'u1')]
+        self.assertEqual(list(iter_deduplicated(rows)), [rows[0], rows[1], rows[3]])
+
+    def test_combine_result_files(self):
+        first = [SearchResult('"b"', 1, 'u1', 't', 's'), SearchResult('"a"', 1, 'u2', 't', 's')]
+        second = [SearchResult('"a"', 2, 'u2', 't', 's'), SearchResult('"a"', 3, 'u3', 't', 's')]
+        SearchResultList().write(self.directory.name, ',', False, 'first.csv', first)
+        SearchResultList().write(self.directory.name, ',', False, 'second.csv', second, 'sqlite')
+        output_dir = os.path.join(self.directory.name, 'output')
+        combine_result_files([os.path.join(self.directory.name, 'first.csv'),
+                              os.path.join(self.directory.name, 'second.sqlite')],
+                             output_dir, 'combined.csv', ',', chunk_size=1)
+        self.assertEqual(os.listdir(output_dir), ['combined.csv'])
+        combined = SearchResultList.iter_from_file(os.path.join(output_dir, 'combined.csv'), ',')
+        self.assertEqual([(r.query, r.rank, r.url) for r in combined],
+                         [('"a"', 1, 'u2'), ('"a"', 3, 'u3'), ('"b"', 1, 'u1')])
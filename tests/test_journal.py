@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from ddg.journal import Journal
+from ddg.query import Query
+from ddg.search_result import SearchResult
+
+
+def create_query(query_string, has_failed=False):
+    query = Query.from_normalized(query_string)
+    query.has_failed = has_failed
+    if not has_failed:
+        query.search_results.values.append(SearchResult(query_string, 1, 'https://example.com/' + query_string,
+                                                        'Title', 'Snippet'))
+    return query
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'journal', 'queries.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_journal(self, *queries):
+        journal = Journal(self.file_path)
+        journal.open(False)
+        for query in queries:
+            journal.append(query)
+        journal.close()
+
+    def resume(self):
+        journal = Journal(self.file_path)
+        journal.open(True)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_resume(self):
+        self.write_journal(create_query('a'), create_query('b', has_failed=True))
+        journal = self.resume()
+        self.assertEqual(journal.completed_query_strings, {'a', 'b'})
+        self.assertEqual(journal.failed_query_strings, {'b'})
+        self.assertTrue(journal.contains(create_query('a')))
+        self.assertFalse(journal.contains(create_query('c')))
+        self.assertEqual([(r.query, r.rank, r.url) for r in journal.iter_search_results()],
+                         [('a', 1, 'https://example.com/a')])
+
+    def test_open_without_resume_truncates(self):
+        self.write_journal(create_query('a'))
+        self.write_journal()
+        self.assertEqual(self.resume().completed_query_strings, set())
+
+    def test_incomplete_entry_is_truncated(self):
+        self.write_journal(create_query('a'), create_query('b'))
+        valid_length = os.path.getsize(self.file_path)
+        with open(self.file_path, 'ab') as fp:
+            fp.write(b'{"query": "c", "fail')
+        journal = self.resume()
+        self.assertEqual(journal.completed_query_strings, {'a', 'b'})
+        self.assertEqual(os.path.getsize(self.file_path), valid_length)
+
+    def test_entry_without_line_break_is_incomplete(self):
+        self.write_journal(create_query('a'), create_query('b'))
+        with open(self.file_path, 'rb') as fp:
+            content = fp.read()
+        # last entry is valid JSON, but its line break is missing
+        with open(self.file_path, 'wb') as fp:
+            fp.write(content[:-1])
+        journal = self.resume()
+        self.assertEqual(journal.completed_query_strings, {'a'})
+        journal.append(create_query('c'))
+        journal.close()
+        self.assertEqual(Journal(self.file_path)._load(), os.path.getsize(self.file_path))
+        self.assertEqual(self.resume().completed_query_strings, {'a', 'c'})
@@ -0,0 +1,41 @@
+import unittest
+
+from ddg.metrics import Histogram
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_empty_histogram(self):
+        self.assertIsNone(Histogram().get_quantile(0.5))
+
+    def test_interpolation_within_bucket(self):
+        histogram = Histogram()
+        # bucket (0.1, 0.25]
+        for _ in range(4):
+            histogram.observe(0.2)
+        self.assertAlmostEqual(histogram.get_quantile(0.5), 0.175)
+        self.assertAlmostEqual(histogram.get_quantile(1), 0.25)
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 0.8)
+
+    def test_first_bucket_starts_at_zero(self):
+        histogram = Histogram()
+        histogram.observe(0.0005)
+        histogram.observe(0.001)
+        self.assertEqual(histogram.counts[0], 2)
+        self.assertAlmostEqual(histogram.get_quantile(0.5), 0.0005)
+
+    def test_quantiles_across_buckets(self):
+        histogram = Histogram()
+        for value in [0.003] * 50 + [0.7] * 49 + [7]:
+            histogram.observe(value)
+        # p50 at the upper bound of (0.0025, 0.005], p99 at the upper bound of (0.5, 1]
+        self.assertAlmostEqual(histogram.get_quantile(0.5), 0.005)
+        self.assertAlmostEqual(histogram.get_quantile(0.99), 1)
+        self.assertAlmostEqual(histogram.get_quantile(0.995), 7.5)
+
+    def test_values_above_last_bucket(self):
+        histogram = Histogram()
+        histogram.observe(1000)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(histogram.get_quantile(0.5), Histogram.buckets[-1])
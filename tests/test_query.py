@@ -0,0 +1,32 @@
+import unittest
+
+from benchmark.parser_benchmark import load_fixtures
+from ddg.metrics import Metrics
+from ddg.query import Query
+
+PAGE_URI = 'https://duckduckgo.com/html/'
+
+
+class ParsePageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.page = load_fixtures()[0]
+        self.query = Query.from_normalized('"query"')
+        self.metrics = Metrics()
+
+    def test_valid_page(self):
+        is_valid, next_page = self.query.parse_page(self.page, PAGE_URI, 10, True, self.metrics)
+        self.assertTrue(is_valid)
+        self.assertIsNone(next_page)
+        self.assertEqual([result.rank for result in self.query.search_results.values], list(range(1, 11)))
+        self.assertEqual(self.metrics.histograms['parse_seconds'].count, 1)
+
+    def test_page_with_empty_snippet(self):
+        # the first snippet link of the page is removed
+        start = self.page.index(b'<a class="result__snippet"')
+        end = self.page.index(b'</a>', start) + len(b'</a>')
+        is_valid, next_page = self.query.parse_page(self.page[:start] + self.page[end:], PAGE_URI, 10, True,
+                                                    self.metrics)
+        self.assertFalse(is_valid)
+        self.assertIsNone(next_page)
+        self.assertEqual(self.metrics.histograms['parse_seconds'].count, 1)
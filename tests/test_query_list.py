@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest
+
+from benchmark.parser_benchmark import load_fixtures
+from ddg.query import Query
+from ddg.query_list import QueryList
+
+
+class Response(object):
+
+    def __init__(self, content):
+        self.status_code = 200
+        self.headers = {}
+        self.content = content
+
+
+class RecordingSession(object):
+    """ Answers every request with a recorded result page and records when it has been sent. """
+
+    def __init__(self):
+        self.page = load_fixtures()[0]
+        self.request_times = list()
+        self.lock = threading.Lock()
+
+    def get(self, uri, params=None, headers=None):
+        with self.lock:
+            self.request_times.append(time.monotonic())
+        return Response(self.page)
+
+    def post(self, uri, data=None, headers=None):
+        return self.get(uri)
+
+
+class QueryListTest(unittest.TestCase):
+
+    @staticmethod
+    def retrieve(query_count, concurrency, min_wait, max_wait):
+        query_list = QueryList()
+        query_list.session = RecordingSession()
+        queries = [Query.from_normalized('"q' + str(i) + '"') for i in range(query_count)]
+        query_list.retrieve_search_results(10, min_wait, max_wait, 1000, False, False, concurrency=concurrency,
+                                           queries=queries)
+        return queries, query_list.session.request_times
+
+    def test_workers_share_the_waits(self):
+        # one request per 100 milliseconds, regardless of the number of workers
+        queries, request_times = self.retrieve(12, 4, 100, 100)
+        self.assertTrue(all(not query.has_failed and len(query.search_results.values) == 10 for query in queries))
+        self.assertEqual(len(request_times), 12)
+        self.assertGreaterEqual(request_times[-1] - request_times[0], 11 * 0.1 * 0.9)
+
+    def test_single_worker_waits_before_each_request(self):
+        start = time.monotonic()
+        _, request_times = self.retrieve(3, 1, 100, 100)
+        self.assertGreaterEqual(request_times[0] - start, 0.09)
+        self.assertGreaterEqual(request_times[-1] - request_times[0], 2 * 0.1 * 0.9)
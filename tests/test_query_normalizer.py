@@ -0,0 +1,46 @@
+import unittest
+
+from ddg.query import Query
+from ddg.query_normalizer import QueryNormalizer
+
+
+class QueryNormalizerTest(unittest.TestCase):
+
+    def test_exact_matches_with_special_characters_removed(self):
+        normalizer = QueryNormalizer(True, True)
+        self.assertEqual(normalizer.normalize('SQL injection'), ('"SQL injection"', False))
+        self.assertEqual(normalizer.normalize('a (b) c/d'), ('"a" "b" "c" "d"', False))
+        self.assertEqual(normalizer.normalize('  ()  '), ('  ()  ', True))
+        self.assertEqual(normalizer.normalize(''), ('', True))
+
+    def test_special_characters_removed(self):
+        self.assertEqual(QueryNormalizer(False, True).normalize('a (b) c'), ('a b c', False))
+
+    def test_special_characters_kept(self):
+        self.assertEqual(QueryNormalizer(True, False).normalize(' a (b) '), ('"a (b)"', False))
+        normalizer = QueryNormalizer(False, False)
+        self.assertEqual(normalizer.normalize('  a (b)  '), ('a (b)', False))
+        self.assertEqual(normalizer.normalize('   '), ('', True))
+
+    def test_transliteration(self):
+        normalizer = QueryNormalizer(True, True)
+        self.assertEqual(normalizer.normalize("L'Hôpital's rule"), ('"L\'Hopital\'s rule"', False))
+        self.assertEqual(normalizer.normalize('Ärger: Straße'), ('"Arger" "Strasse"', False))
+        self.assertEqual(normalizer.transliterate('Straße  und\tÄrger'), 'Strasse  und\tArger')
+
+    def test_batch_matches_query(self):
+        raw_query_strings = ['SQL injection', 'a (b) c/d', '  ()  ', 'Ärger: Straße', 'SQL injection', '']
+        for exact_matches, remove_special_characters in [(True, True), (True, False), (False, True), (False, False)]:
+            normalizer = QueryNormalizer(exact_matches, remove_special_characters)
+            expected = []
+            for raw_query_string in raw_query_strings:
+                query = Query(raw_query_string, exact_matches, remove_special_characters)
+                expected.append((query.query_string, query.is_empty))
+            self.assertEqual(normalizer.normalize_batch(raw_query_strings), expected)
+
+    def test_memoization(self):
+        normalizer = QueryNormalizer(True, True, max_cached_tokens=10, max_cached_queries=10)
+        normalizer.normalize_batch(['Straße', 'Straße', 'große Straße'])
+        self.assertEqual(normalizer.normalize_cached.cache_info().hits, 1)
+        # transliterated tokens are shared by different query strings
+        self.assertEqual(normalizer.transliterate_token.cache_info().hits, 1)
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+import unittest
+
+from ddg.query import Query
+from ddg.query_store import QueryStore
+from ddg.search_result import SearchResult
+
+
+def create_query(query_string, urls):
+    query = Query.from_normalized(query_string)
+    for rank, url in enumerate(urls, 1):
+        query.search_results.values.append(SearchResult(query_string, rank, url, 'Title', 'Snippet'))
+    return query
+
+
+def get_urls(search_results):
+    return [(search_result.rank, search_result.url) for search_result in search_results]
+
+
+class QueryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.file_path = os.path.join(self.directory.name, 'store', 'queries.sqlite')
+
+    def open(self, **kwargs):
+        store = QueryStore(self.file_path, **kwargs)
+        self.addCleanup(store.connection.close)
+        return store
+
+    def test_pending_queries_are_found(self):
+        store = self.open(batch_size=100)
+        store.put(create_query('"a"', ['https://a.com/1', 'https://a.com/2']))
+        self.assertTrue(store.contains(Query.from_normalized('"a"')))
+        self.assertFalse(store.contains(Query.from_normalized('"b"')))
+        self.assertEqual(get_urls(store.get_search_results('"a"')), [(1, 'https://a.com/1'), (2, 'https://a.com/2')])
+        self.assertEqual((store.hits, store.misses, store.stored), (1, 1, 1))
+
+    def test_persistence_and_replacement(self):
+        store = self.open(batch_size=1)
+        store.put(create_query('"a"', ['https://a.com/1', 'https://a.com/2']))
+        store.put(create_query('"a"', ['https://a.com/3']))
+        store.close()
+        store = self.open()
+        self.assertTrue(store.contains(Query.from_normalized('"a"')))
+        self.assertEqual(get_urls(store.get_search_results('"a"')), [(1, 'https://a.com/3')])
+
+    def test_duplicate_ranks(self):
+        store = self.open(batch_size=1)
+        query = create_query('"a"', ['https://a.com/1'])
+        query.search_results.values.append(SearchResult('"a"', 1, 'https://a.com/duplicate', 'Title', 'Snippet'))
+        store.put(query)
+        self.assertEqual(get_urls(store.get_search_results('"a"')), [(1, 'https://a.com/1')])
+
+    def test_max_age(self):
+        store = self.open(max_age=60)
+        store.put(create_query('"a"', ['https://a.com/1']))
+        store.pending['"a"'] = (time.time() - 120, store.pending['"a"'][1])
+        self.assertFalse(store.contains(Query.from_normalized('"a"')))
+
+    def test_import_keeps_stored_queries(self):
+        store = self.open()
+        store.put(create_query('"a"', ['https://a.com/1']))
+        search_results = create_query('"a"', ['https://a.com/old']).search_results.values \
+            + create_query('"b"', ['https://b.com/1', 'https://b.com/2']).search_results.values
+        self.assertEqual(store.import_search_results(search_results, time.time()), 1)
+        self.assertEqual(get_urls(store.get_search_results('"a"')), [(1, 'https://a.com/1')])
+        self.assertEqual(get_urls(store.get_search_results('"b"')), [(1, 'https://b.com/1'), (2, 'https://b.com/2')])
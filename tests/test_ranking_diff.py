@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from ddg.query import Query
+from ddg.ranking_diff import DROPPED, MOVED, NEW, RankingDiff, diff_rankings
+from ddg.result_formats import read
+from ddg.search_result import SearchResult
+
+
+def create_search_results(urls):
+    return [SearchResult('"query"', rank, url, 'Title ' + url, 'Snippet') for rank, url in enumerate(urls, 1)]
+
+
+class RankingDiffTest(unittest.TestCase):
+
+    def test_unchanged(self):
+        search_results = create_search_results(['a', 'b'])
+        self.assertEqual(diff_rankings(search_results, create_search_results(['a', 'b'])), [])
+
+    def test_new_moved_and_dropped(self):
+        changes = diff_rankings(create_search_results(['a', 'b', 'c', 'd']),
+                                create_search_results(['b', 'a', 'e', 'd']))
+        self.assertEqual(changes, [(MOVED, 'b', 1, 2, 'Title b'),
+                                   (MOVED, 'a', 2, 1, 'Title a'),
+                                   (NEW, 'e', 3, None, 'Title e'),
+                                   (DROPPED, 'c', None, 3, 'Title c')])
+
+    def test_without_previous_results(self):
+        self.assertEqual([change[0] for change in diff_rankings([], create_search_results(['a', 'b']))], [NEW, NEW])
+
+    def test_duplicate_urls_are_compared_by_best_rank(self):
+        changes = diff_rankings(create_search_results(['a', 'b', 'a']), create_search_results(['a', 'a', 'c']))
+        self.assertEqual(changes, [(NEW, 'c', 3, None, 'Title c'), (DROPPED, 'b', None, 2, 'Title b')])
+
+    def test_write_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ranking_diff = RankingDiff(directory, 'queries.csv', batch_size=1)
+            query = Query.from_normalized('"query"')
+            query.search_results.values = create_search_results(['b', 'a'])
+            ranking_diff.add(query, create_search_results(['a', 'b']))
+            ranking_diff.add(query, create_search_results(['b', 'a']))
+            ranking_diff.close()
+            self.assertEqual((ranking_diff.query_count, ranking_diff.changed_query_count), (2, 1))
+            self.assertEqual(ranking_diff.counts, {NEW: 0, DROPPED: 0, MOVED: 2})
+
+            header, rows = read(os.path.join(directory, 'queries.changes.csv'))
+            self.assertEqual(header, RankingDiff.column_names)
+            self.assertEqual(list(rows), [['"query"', MOVED, 'b', '1', '2', 'Title b'],
+                                          ['"query"', MOVED, 'a', '2', '1', 'Title a']])
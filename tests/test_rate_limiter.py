@@ -0,0 +1,95 @@
+import time
+import unittest
+
+from util.rate_limiter import AdaptivePacer, TokenBucket, get_requests_per_minute
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_requests_per_minute_from_waits(self):
+        self.assertEqual(get_requests_per_minute(500, 1500), 60)
+        self.assertEqual(get_requests_per_minute(0, 0), 60000)
+
+    def test_rate_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+
+    def test_first_token_is_available_immediately(self):
+        self.assertEqual(TokenBucket(60).acquire(), 0.0)
+
+    def test_waits_for_refill(self):
+        bucket = TokenBucket(600)  # one token every 0.1 seconds
+        bucket.acquire()
+        start = time.monotonic()
+        waited = bucket.acquire()
+        self.assertGreater(waited, 0.05)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_capacity_allows_bursts(self):
+        bucket = TokenBucket(1, capacity=3)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertLess(bucket.tokens, 1)
+
+
+class AdaptivePacerTest(unittest.TestCase):
+
+    @staticmethod
+    def record_window(pacer, outcome=AdaptivePacer.OK, failures=0, latency=None):
+        for i in range(pacer.window):
+            pacer.record(AdaptivePacer.ERROR if i < failures else outcome, latency)
+
+    def test_rate_is_bounded(self):
+        self.assertEqual(AdaptivePacer(1000, 6, 600).requests_per_minute, 600)
+        self.assertEqual(AdaptivePacer(1, 6, 600).requests_per_minute, 6)
+        # maximum is at least the minimum
+        self.assertEqual(AdaptivePacer(60, 100, 10).requests_per_minute, 100)
+
+    def test_slow_start_doubles_rate_if_limiting(self):
+        pacer = AdaptivePacer(60, 6, 600, window=5)
+        pacer.is_limiting = True
+        self.record_window(pacer)
+        self.assertEqual(pacer.requests_per_minute, 120)
+        self.assertAlmostEqual(pacer.rate, 2)
+        self.assertEqual(pacer.increase_count, 1)
+
+    def test_rate_is_kept_if_not_exhausted(self):
+        pacer = AdaptivePacer(60, 6, 600, window=5)
+        self.record_window(pacer)
+        self.assertEqual(pacer.requests_per_minute, 60)
+        self.assertEqual(pacer.request_count, 0)
+
+    def test_acquire_marks_pacer_as_limiting(self):
+        pacer = AdaptivePacer(600, 6, 6000)
+        pacer.acquire()
+        self.assertFalse(pacer.is_limiting)
+        pacer.acquire()
+        self.assertTrue(pacer.is_limiting)
+
+    def test_additive_increase_after_decrease(self):
+        pacer = AdaptivePacer(100, 6, 600, increase=10, window=10)
+        self.record_window(pacer, failures=2)
+        self.assertEqual(pacer.requests_per_minute, 50)
+        self.assertFalse(pacer.is_slow_start)
+        pacer.is_limiting = True
+        # failures up to max_error_rate are tolerated
+        self.record_window(pacer, failures=1)
+        self.assertEqual(pacer.requests_per_minute, 60)
+        self.assertEqual((pacer.increase_count, pacer.decrease_count), (1, 1))
+
+    def test_throttling_decreases_rate_once_per_round_trip(self):
+        pacer = AdaptivePacer(100, 30, 600)
+        pacer.record(AdaptivePacer.THROTTLED, 0)
+        self.assertEqual(pacer.requests_per_minute, 50)
+        # request sent before the last decrease
+        pacer.record(AdaptivePacer.THROTTLED, 10)
+        self.assertEqual(pacer.requests_per_minute, 50)
+        pacer.record(AdaptivePacer.THROTTLED, 0)
+        # minimum rate
+        self.assertEqual(pacer.requests_per_minute, 30)
+
+    def test_slow_responses_count_as_failures(self):
+        pacer = AdaptivePacer(100, 6, 600, window=10)
+        pacer.record(AdaptivePacer.OK, 0.1)
+        for _ in range(pacer.window - 1):
+            pacer.record(AdaptivePacer.OK, 1.0)
+        self.assertEqual(pacer.requests_per_minute, 50)
@@ -0,0 +1,65 @@
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from benchmark.mock_server import MockServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RefreshTest(unittest.TestCase):
+    """ Runs ddg-retriever.py against the mock server. """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.server = MockServer().start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.input_file = os.path.join(self.directory.name, 'queries.csv')
+        with open(self.input_file, 'w') as fp:
+            fp.write('query\nq1\nq2\nq3\n')
+        self.store_file = os.path.join(self.directory.name, 'queries.sqlite')
+        self.config_file = os.path.join(self.directory.name, 'config.ini')
+        with open(self.config_file, 'w') as fp:
+            fp.write('[DEFAULT]\n'
+                     'InputFile = ' + self.input_file + '\n'
+                     'OutputDirectory = ' + os.path.join(self.directory.name, 'output') + '\n'
+                     'Delimiter = ,\n'
+                     'SearchUri = ' + self.server.search_uri + '\n'
+                     'MinWait = 0\n'
+                     'MaxWait = 0\n'
+                     'MaxResults = 10\n'
+                     'DetectLanguages = False\n'
+                     'CacheDirectory = ' + os.path.join(self.directory.name, 'cache') + '\n'
+                     'QueryStore = ' + self.store_file + '\n'
+                     'QueryStoreMaxAge = 1\n')
+
+    def run_retriever(self, *arguments):
+        self.server.reset()
+        command = [sys.executable, os.path.join(ROOT_DIR, 'ddg-retriever.py'), '-c', self.config_file]
+        process = subprocess.run(command + list(arguments), cwd=self.directory.name, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE)
+        self.assertEqual(process.returncode, 0, process.stderr.decode('utf8')[-2000:])
+        return set(self.server.first_request_times)
+
+    def test_stale_queries_are_requested_again(self):
+        self.assertEqual(self.run_retriever(), {'"q1"', '"q2"', '"q3"'})
+
+        connection = sqlite3.connect(self.store_file)
+        with connection:
+            connection.execute('UPDATE queries SET fetch_time = fetch_time - 7200 WHERE query = ?', ('"q2"',))
+        connection.close()
+        # the result pages of the stale query have changed, but are still cached (CacheTTL)
+        self.server.page_shift = 1
+        self.assertEqual(self.run_retriever('refresh'), {'"q2"'})
+
+        with open(os.path.join(self.directory.name, 'output', 'queries.changes.csv'), newline='') as fp:
+            rows = list(csv.reader(fp))
+        self.assertGreater(len(rows), 1)
+        self.assertEqual(set(row[0] for row in rows[1:]), {'"q2"'})
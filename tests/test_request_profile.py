@@ -0,0 +1,90 @@
+import configparser
+import time
+import unittest
+
+from ddg.query import Query
+from ddg.request_profile import ProfilePool, RequestProfile, read_profiles
+from util.exceptions import IllegalConfigurationError
+from util.rate_limiter import AdaptivePacer, TokenBucket
+
+
+class RequestProfileTest(unittest.TestCase):
+
+    def create_profile(self, name='test', backoff=30000, max_backoff=300000):
+        profile = RequestProfile(name, dict(Query.headers), TokenBucket(60), backoff=backoff, max_backoff=max_backoff)
+        self.addCleanup(profile.close)
+        return profile
+
+    def test_backoff_after_consecutive_failures(self):
+        profile = self.create_profile()
+        profile.record(AdaptivePacer.ERROR)
+        self.assertTrue(profile.is_available(time.monotonic()))
+        # a successful request resets the consecutive failures
+        profile.record(AdaptivePacer.OK)
+        profile.record(AdaptivePacer.EMPTY)
+        self.assertTrue(profile.is_available(time.monotonic()))
+        profile.record(AdaptivePacer.ERROR)
+        self.assertFalse(profile.is_available(time.monotonic()))
+        self.assertTrue(profile.is_available(time.monotonic() + 30))
+        self.assertEqual((profile.request_count, profile.failure_count, profile.total_backoff_count), (4, 3, 1))
+
+    def test_throttling_backs_off_immediately(self):
+        profile = self.create_profile()
+        profile.record(AdaptivePacer.THROTTLED)
+        self.assertFalse(profile.is_available(time.monotonic()))
+
+    def test_backoff_is_doubled_up_to_maximum(self):
+        profile = self.create_profile(backoff=1000, max_backoff=3000)
+        delays = []
+        for _ in range(4):
+            profile.backoff_until = 0.0
+            now = time.monotonic()
+            profile.record(AdaptivePacer.THROTTLED)
+            delays.append(round(profile.backoff_until - now))
+        self.assertEqual(delays, [1, 2, 3, 3])
+
+    def test_failures_during_backoff_do_not_extend_it(self):
+        profile = self.create_profile()
+        profile.record(AdaptivePacer.THROTTLED)
+        backoff_until = profile.backoff_until
+        profile.record(AdaptivePacer.THROTTLED)
+        self.assertEqual(profile.backoff_until, backoff_until)
+        self.assertEqual(profile.total_backoff_count, 1)
+
+    def test_pool_skips_backed_off_profiles(self):
+        profiles = [self.create_profile(name) for name in ['a', 'b', 'c']]
+        pool = ProfilePool(profiles)
+        self.assertEqual([pool.select().name for _ in range(4)], ['a', 'b', 'c', 'a'])
+        profiles[1].record(AdaptivePacer.THROTTLED)
+        self.assertEqual([pool.select().name for _ in range(3)], ['c', 'a', 'c'])
+        # all profiles backed off: the one available first
+        profiles[0].backoff_until = time.monotonic() + 100
+        profiles[2].backoff_until = time.monotonic() + 10
+        self.assertEqual(pool.select().name, 'c')
+
+    def test_pool_requires_profiles(self):
+        with self.assertRaises(IllegalConfigurationError):
+            ProfilePool([])
+
+    def test_read_profiles(self):
+        config = configparser.ConfigParser()
+        config.read_string('[Profile firefox]\n'
+                           'UserAgent = Mozilla/5.0 Firefox\n'
+                           'RequestsPerMinute = 30\n'
+                           '[Profile default]\n'
+                           '[Other]\n')
+        profiles = read_profiles(config, 1000, 3000, False, 6, 600)
+        for profile in profiles:
+            self.addCleanup(profile.close)
+        self.assertEqual([profile.name for profile in profiles], ['firefox', 'default'])
+        self.assertEqual(profiles[0].headers['User-Agent'], 'Mozilla/5.0 Firefox')
+        self.assertEqual(profiles[0].headers['Accept'], Query.headers['Accept'])
+        self.assertAlmostEqual(profiles[0].rate_limiter.rate * 60, 30)
+        # one request per (MinWait + MaxWait) / 2 milliseconds
+        self.assertAlmostEqual(profiles[1].rate_limiter.rate * 60, 30)
+        self.assertIsInstance(profiles[1].rate_limiter, TokenBucket)
+
+        profiles = read_profiles(config, 1000, 3000, True, 6, 600)
+        for profile in profiles:
+            self.addCleanup(profile.close)
+        self.assertIsInstance(profiles[0].rate_limiter, AdaptivePacer)
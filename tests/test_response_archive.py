@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from benchmark.parser_benchmark import load_fixtures
+from ddg.query import Query
+from ddg.response_archive import ResponseArchive, iter_entries, iter_reparsed_queries
+
+PAGE_URI = 'https://duckduckgo.com/html/'
+
+
+def get_urls(page, max_results):
+    query = Query.from_normalized('"query"')
+    query.parse_page(page, PAGE_URI, max_results, False)
+    return [result.url for result in query.search_results.values]
+
+
+class ResponseArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'archive', 'queries.archive')
+        self.pages = load_fixtures()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def archive(self, resume, *queries):
+        archive = ResponseArchive(self.file_path)
+        archive.open(resume)
+        for query_string, page in queries:
+            query = Query.from_normalized(query_string)
+            query.archived_pages = [(PAGE_URI, archive.compress(page))]
+            archive.append(query)
+        archive.close()
+
+    def reparse(self, max_results=10):
+        return list(iter_reparsed_queries(self.file_path, max_results, False, processes=1))
+
+    def test_reparse(self):
+        self.archive(False, ('"q1"', self.pages[0]), ('"q2"', self.pages[1]))
+        queries = self.reparse()
+        self.assertEqual([query.query_string for query in queries], ['"q1"', '"q2"'])
+        self.assertEqual([result.url for result in queries[0].search_results.values], get_urls(self.pages[0], 10))
+        self.assertEqual([result.url for result in queries[1].search_results.values], get_urls(self.pages[1], 10))
+
+    def test_query_archived_again_on_resume(self):
+        # killed after archiving "q1", but before its journal entry was written
+        self.archive(False, ('"q1"', self.pages[0]))
+        self.archive(True, ('"q1"', self.pages[1]), ('"q2"', self.pages[2]))
+        self.assertEqual(len(list(iter_entries(self.file_path))), 3)
+
+        queries = self.reparse()
+        self.assertEqual([query.query_string for query in queries], ['"q1"', '"q2"'])
+        self.assertEqual([result.url for result in queries[0].search_results.values], get_urls(self.pages[1], 10))
+
+    def test_incomplete_entry_is_dropped_on_resume(self):
+        self.archive(False, ('"q1"', self.pages[0]), ('"q2"', self.pages[1]))
+        with open(self.file_path, 'r+b') as fp:
+            fp.truncate(os.path.getsize(self.file_path) - 10)
+        self.archive(True, ('"q2"', self.pages[1]))
+        self.assertEqual([query.query_string for query in self.reparse()], ['"q1"', '"q2"'])
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from ddg.response_cache import ResponseCache
+
+URI = 'https://duckduckgo.com/html/?q=%22SQL+injection%22'
+CONTENT = b'<html><body>' + b'<div class="result">SQL injection</div>' * 100 + b'</body></html>'
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.directory.name, 3600, 1024 * 1024)
+        self.cache.put(URI, CONTENT)
+        self.path = self.cache._get_path(ResponseCache.get_key(URI))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assert_miss_removes_entry(self):
+        self.assertIsNone(self.cache.get(URI))
+        self.assertEqual(self.cache.misses, 1)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(len(self.cache.entries), 0)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_hit(self):
+        self.assertEqual(self.cache.get(ResponseCache.normalize_uri(URI)), CONTENT)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_truncated_entry(self):
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(os.path.getsize(self.path) // 2)
+        self.assert_miss_removes_entry()
+
+    def test_corrupted_entry(self):
+        with open(self.path, 'rb') as fp:
+            compressed = bytearray(fp.read())
+        # flip the bits of the first byte of the deflate stream (after the 10-byte gzip header)
+        compressed[10] ^= 0xff
+        with open(self.path, 'wb') as fp:
+            fp.write(compressed)
+        self.assert_miss_removes_entry()
+
+    def test_expired_entry(self):
+        os.utime(self.path, (0, 0))
+        self.assert_miss_removes_entry()
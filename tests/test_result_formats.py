@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from ddg.result_formats import check_format, create_writer, get_filename, get_format, read
+from ddg.search_result import SearchResult
+from ddg.search_result_list import SearchResultList
+from util.exceptions import IllegalConfigurationError
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def create_search_results(count):
+    search_results = []
+    for i in range(count):
+        search_result = SearchResult('"query ' + str(i // 10) + '"', i % 10 + 1, 'https://example.com/' + str(i),
+                                     'Title, "quoted"\nwith line break', 'Snippet ' + str(i) + ' äöü')
+        search_result.language = 'de' if i % 2 else 'en'
+        search_results.append(search_result)
+    return search_results
+
+
+class ResultFormatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_format_and_filename(self):
+        self.assertEqual(get_format('results.csv'), 'csv')
+        self.assertEqual(get_format('results.SQLite'), 'sqlite')
+        self.assertEqual(get_format('results.db'), 'sqlite')
+        self.assertEqual(get_format('results.parquet'), 'parquet')
+        self.assertEqual(get_format('results'), 'csv')
+        self.assertEqual(get_filename('queries.csv', 'csv'), 'queries.csv')
+        self.assertEqual(get_filename('queries.csv', 'sqlite'), 'queries.sqlite')
+        self.assertEqual(get_filename('queries.db', 'sqlite'), 'queries.db')
+        with self.assertRaises(IllegalConfigurationError):
+            check_format('xlsx')
+
+    def assert_round_trip(self, output_format, delimiter=','):
+        search_results = create_search_results(25)
+        for include_language in [True, False]:
+            # batches smaller than the number of search results
+            SearchResultList().write(self.directory.name, delimiter, include_language, 'queries.csv',
+                                     iter(search_results), output_format, batch_size=10)
+            file_path = os.path.join(self.directory.name, get_filename('queries.csv', output_format))
+            header, _ = read(file_path, delimiter)
+            self.assertEqual(header, SearchResult.get_column_names(include_language))
+            read_results = list(SearchResultList.iter_from_file(file_path, delimiter))
+            self.assertEqual([r.get_column_values(include_language) for r in read_results],
+                             [r.get_column_values(include_language) for r in search_results])
+
+    def test_csv_round_trip(self):
+        self.assert_round_trip('csv')
+        self.assert_round_trip('csv', ';')
+
+    def test_sqlite_round_trip(self):
+        self.assert_round_trip('sqlite')
+
+    @unittest.skipIf(pyarrow is None, "requires the optional package pyarrow")
+    def test_parquet_round_trip(self):
+        self.assert_round_trip('parquet')
+
+    def test_integer_columns(self):
+        file_path = os.path.join(self.directory.name, 'changes.sqlite')
+        writer = create_writer('sqlite', file_path, ['query', 'rank', 'previous_rank'])
+        writer.write_rows([['"a"', 1, None], ['"a"', 2, 1]])
+        writer.close()
+        header, rows = read(file_path)
+        self.assertEqual(header, ['query', 'rank', 'previous_rank'])
+        self.assertEqual(list(rows), [('"a"', 1, None), ('"a"', 2, 1)])
@@ -0,0 +1,58 @@
+import time
+import unittest
+
+from ddg.query import Query
+from ddg.retry_scheduler import RetryScheduler
+
+
+def create_query(attempts, retry_after=None):
+    query = Query.from_normalized('"query"')
+    query.attempts = attempts
+    query.retry_after = retry_after
+    return query
+
+
+class RetrySchedulerTest(unittest.TestCase):
+
+    def test_exponential_backoff_with_jitter(self):
+        scheduler = RetryScheduler(1000, 300000)
+        for attempts, backoff in [(0, 1000), (1, 1000), (2, 2000), (3, 4000)]:
+            for _ in range(20):
+                delay = scheduler.get_delay(create_query(attempts))
+                self.assertGreaterEqual(delay, backoff / 2 / 1000)
+                self.assertLessEqual(delay, backoff / 1000)
+
+    def test_backoff_is_limited(self):
+        scheduler = RetryScheduler(1000, 5000)
+        self.assertLessEqual(scheduler.get_delay(create_query(10)), 5)
+        # maximum is at least the initial backoff
+        self.assertEqual(RetryScheduler(1000, 10).max_wait_on_error, 1000)
+
+    def test_retry_after_takes_precedence(self):
+        scheduler = RetryScheduler(1000, 300000)
+        self.assertEqual(scheduler.get_delay(create_query(3, retry_after=42)), 42)
+
+    def test_pop_due(self):
+        scheduler = RetryScheduler(1000, 300000)
+        self.assertIsNone(scheduler.pop_due())
+        self.assertIsNone(scheduler.get_time_until_due())
+
+        scheduler.schedule(create_query(1, retry_after=60), 'later')
+        scheduler.schedule(create_query(1, retry_after=0), 'first')
+        scheduler.schedule(create_query(1, retry_after=0), 'second')
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(scheduler.retry_count, 3)
+        self.assertEqual(scheduler.get_time_until_due(), 0.0)
+        # due items in the order they have been scheduled
+        self.assertEqual(scheduler.pop_due(), 'first')
+        self.assertEqual(scheduler.pop_due(), 'second')
+        self.assertIsNone(scheduler.pop_due())
+        self.assertGreater(scheduler.get_time_until_due(), 59)
+        self.assertEqual(len(scheduler), 1)
+
+    def test_due_after_delay(self):
+        scheduler = RetryScheduler(1000, 300000)
+        scheduler.schedule(create_query(1, retry_after=0.05), 'item')
+        self.assertIsNone(scheduler.pop_due())
+        time.sleep(scheduler.get_time_until_due())
+        self.assertEqual(scheduler.pop_due(), 'item')
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from ddg.query import Query
+from ddg.search_result import SearchResult
+from ddg.sharding import filter_shard, get_shard, get_shard_filename, iter_merged_search_results, parse_shard
+from util.exceptions import IllegalArgumentError
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ShardingTest(unittest.TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('1/4'), (1, 4))
+        self.assertEqual(parse_shard('4/4'), (4, 4))
+        for value in ['0/4', '5/4', '1/0', '1', '1/2/3', 'a/b']:
+            with self.assertRaises(IllegalArgumentError):
+                parse_shard(value)
+
+    def test_shard_assignment_is_stable(self):
+        # shards of separate runs (and versions) must agree, i.e., the assignment must not change
+        self.assertEqual([get_shard(q, 4) for q in ['"SQL injection"', '"stack overflow"', '"a"', '"b"']],
+                         [4, 4, 3, 2])
+        self.assertEqual(get_shard('"SQL injection"', 1), 1)
+
+    def test_shard_assignment_is_independent_of_process(self):
+        code = 'from ddg.sharding import get_shard; print(get_shard(\'"SQL injection"\', 7))'
+        for _ in range(2):
+            output = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, stdout=subprocess.PIPE, check=True)
+            self.assertEqual(int(output.stdout), get_shard('"SQL injection"', 7))
+
+    def test_shards_partition_queries(self):
+        queries = [Query.from_normalized('"q' + str(i) + '"') for i in range(100)]
+        shards = [list(filter_shard(queries, shard_index, 3)) for shard_index in range(1, 4)]
+        self.assertEqual(sorted(q.query_string for shard in shards for q in shard),
+                         sorted(q.query_string for q in queries))
+        self.assertTrue(all(len(shard) > 0 for shard in shards))
+
+    def test_shard_filename(self):
+        self.assertEqual(get_shard_filename('queries.csv', 1, 4), 'queries.shard-1-of-4.csv')
+        self.assertEqual(get_shard_filename('queries', 2, 4), 'queries.shard-2-of-4')
+
+    def test_merge_in_query_order(self):
+        queries = [Query.from_normalized('"q' + str(i) + '"') for i in range(20)]
+        shard_results = {shard_index: [] for shard_index in range(1, 4)}
+        for query in queries:
+            if query.query_string == '"q5"':
+                # failed or empty query without search results
+                continue
+            for rank in range(1, 3):
+                shard_results[get_shard(query.query_string, 3)].append(
+                    SearchResult(query.query_string, rank, 'https://example.com', 'Title', 'Snippet'))
+        merged = iter_merged_search_results(iter(queries), {shard_index: iter(results) for shard_index, results
+                                                            in shard_results.items()}, 3)
+        self.assertEqual([(r.query, r.rank) for r in merged],
+                         [(q.query_string, rank) for q in queries if q.query_string != '"q5"' for rank in range(1, 3)])
@@ -0,0 +1,205 @@
+""" Rate limiting for requests shared between worker threads. """
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("ddg-retriever_logger")
+
+
+def get_requests_per_minute(min_wait, max_wait):
+    """ :return: Request rate corresponding to one request per (min_wait + max_wait) / 2 milliseconds. """
+    return 60000 / max(1, (min_wait + max_wait) / 2)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket.
+    Tokens are refilled continuously at the configured rate; acquire() blocks until a token is available.
+    """
+
+    def __init__(self, requests_per_minute, capacity=1):
+        """
+        :param requests_per_minute: Number of tokens refilled per minute.
+        :param capacity: Maximum number of tokens that can be accumulated (burst size).
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("Rate must be positive.")
+        self.rate = requests_per_minute / 60  # tokens per second
+        self.capacity = max(1, capacity)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Block until a token is available and consume it.
+        :return: Time spent waiting in seconds.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def record(self, outcome, latency=None):
+        """
+        Feedback about a request sent after acquire() (ignored, as the rate of this bucket is fixed).
+        :param outcome: One of AdaptivePacer.OK, ERROR, THROTTLED, or EMPTY.
+        :param latency: Time to fetch the response in seconds (None if no response has been received).
+        """
+        pass
+
+
+class AdaptivePacer(TokenBucket):
+    """
+    Token bucket whose rate is adapted to the responses of the server (AIMD, as in TCP congestion control).
+    After each window of requests, the rate is increased by a constant step if the bucket has been the bottleneck
+    and few requests failed, returned empty result pages, or were slow (latency above latency_factor times the
+    baseline latency); otherwise, it is decreased multiplicatively.
+    Until the first decrease, the rate is doubled instead of increased by a constant step (slow start),
+    so that a conservative initial rate quickly approaches the sustainable rate.
+    Throttling responses (429/503) decrease the rate right away, unless the request has been sent before the last
+    decrease, i.e., the rate is decreased at most once per round trip.
+    """
+
+    OK = 'ok'
+    ERROR = 'error'
+    THROTTLED = 'throttled'
+    EMPTY = 'empty'
+
+    def __init__(self, requests_per_minute, min_requests_per_minute, max_requests_per_minute, increase=None,
+                 decrease_factor=0.5, window=20, max_error_rate=0.1, latency_factor=3.0, metrics=None):
+        """
+        :param requests_per_minute: Initial rate.
+        :param min_requests_per_minute: Lower bound of the rate.
+        :param max_requests_per_minute: Upper bound of the rate.
+        :param increase: Additive increase in requests per minute (default: a tenth of the initial rate).
+        :param decrease_factor: Factor the rate is multiplied with on congestion.
+        :param window: Number of requests after which the rate is reconsidered.
+        :param max_error_rate: Maximum fraction of failed, empty, or slow requests in a window without decreasing
+            the rate.
+        :param latency_factor: Requests are considered slow if their latency exceeds the baseline latency
+            (minimum latency, slowly following the observed latencies) by this factor.
+        :param metrics: Metrics to record the current rate in (optional).
+        """
+        min_requests_per_minute = max(0.1, min_requests_per_minute)
+        max_requests_per_minute = max(min_requests_per_minute, max_requests_per_minute)
+        requests_per_minute = min(max_requests_per_minute, max(min_requests_per_minute, requests_per_minute))
+        super().__init__(requests_per_minute)
+        self.requests_per_minute = requests_per_minute
+        self.min_requests_per_minute = min_requests_per_minute
+        self.max_requests_per_minute = max_requests_per_minute
+        self.increase = increase if increase is not None else max(1.0, requests_per_minute / 10)
+        self.decrease_factor = decrease_factor
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.latency_factor = latency_factor
+        self.metrics = metrics
+
+        self.baseline_latency = None
+        self.last_decrease = time.monotonic()
+        self.is_slow_start = True
+        self.request_count = 0  # requests recorded since the last decision
+        self.failure_count = 0  # failed, empty, or slow requests since the last decision
+        self.is_limiting = False  # a request had to wait for a token since the last decision
+        self.increase_count = 0
+        self.decrease_count = 0
+        self.peak_requests_per_minute = requests_per_minute
+        self._update_metrics()
+
+    def acquire(self):
+        waited = super().acquire()
+        if waited > 0:
+            self.is_limiting = True
+        return waited
+
+    def record(self, outcome, latency=None):
+        now = time.monotonic()
+        with self.lock:
+            is_slow = False
+            if outcome == AdaptivePacer.OK and latency is not None:
+                if self.baseline_latency is None or latency < self.baseline_latency:
+                    self.baseline_latency = latency
+                else:
+                    # follow gradual latency changes (e.g., different network paths)
+                    self.baseline_latency += (latency - self.baseline_latency) * 0.01
+                is_slow = latency > self.latency_factor * self.baseline_latency
+
+            if outcome == AdaptivePacer.THROTTLED:
+                # requests sent before the last decrease do not reflect the current rate
+                if now - (latency or 0) >= self.last_decrease:
+                    self._decrease(now, outcome + ' response')
+                else:
+                    logger.debug("Adaptive pacing: throttling response to request sent before last decrease ignored.")
+                return
+
+            self.request_count += 1
+            if outcome != AdaptivePacer.OK or is_slow:
+                self.failure_count += 1
+            if self.request_count < self.window:
+                return
+
+            error_rate = self.failure_count / self.request_count
+            if error_rate > self.max_error_rate:
+                self._decrease(now, '{0:.0%}'.format(error_rate) + ' of the last ' + str(self.request_count)
+                               + ' requests failed, were empty, or were slow')
+            elif not self.is_limiting:
+                logger.debug("Adaptive pacing: rate of " + '{0:.1f}'.format(self.requests_per_minute)
+                             + " requests per minute not exhausted, keeping it.")
+                self._reset_window()
+            elif self.requests_per_minute >= self.max_requests_per_minute:
+                logger.debug("Adaptive pacing: maximum rate of " + '{0:.1f}'.format(self.max_requests_per_minute)
+                             + " requests per minute reached.")
+                self._reset_window()
+            elif self.is_slow_start:
+                self._set_rate(min(self.max_requests_per_minute, self.requests_per_minute * 2),
+                               'increasing', str(self.request_count) + ' requests without congestion (slow start)')
+                self.increase_count += 1
+            else:
+                self._set_rate(min(self.max_requests_per_minute, self.requests_per_minute + self.increase),
+                               'increasing', str(self.request_count) + ' requests without congestion')
+                self.increase_count += 1
+
+    def _decrease(self, now, reason):
+        self.last_decrease = now
+        self.is_slow_start = False
+        self.decrease_count += 1
+        self._set_rate(max(self.min_requests_per_minute, self.requests_per_minute * self.decrease_factor),
+                       'decreasing', reason)
+
+    def _set_rate(self, requests_per_minute, direction, reason):
+        """ Change rate (the lock must be held). """
+        logger.info("Adaptive pacing: " + reason + ", " + direction + " rate from "
+                    + '{0:.1f}'.format(self.requests_per_minute) + " to " + '{0:.1f}'.format(requests_per_minute)
+                    + " requests per minute.")
+        self._refill()
+        self.requests_per_minute = requests_per_minute
+        self.rate = requests_per_minute / 60
+        self.peak_requests_per_minute = max(self.peak_requests_per_minute, requests_per_minute)
+        self._reset_window()
+        self._update_metrics()
+
+    def _reset_window(self):
+        self.request_count = 0
+        self.failure_count = 0
+        self.is_limiting = False
+
+    def _update_metrics(self):
+        if self.metrics is not None:
+            self.metrics.set('requests_per_minute', self.requests_per_minute)
+
+    def log_statistics(self):
+        logger.info("Adaptive pacing: final rate " + '{0:.1f}'.format(self.requests_per_minute)
+                    + " requests per minute (peak " + '{0:.1f}'.format(self.peak_requests_per_minute) + ", "
+                    + str(self.increase_count) + " increases, " + str(self.decrease_count) + " decreases).")